@@ -0,0 +1,50 @@
+# coding: utf8
+
+"""
+Benchmark of the transfer function sensitivity (SIF.dTFsensitivity): closed form from the Gramians
+(method='gramians') vs. one H2-norm per non-zero coefficient of Z (method='naive')
+
+Usage: python benchmarks/bench_dTFsensitivity.py
+"""
+
+__author__ = "Thibault Hilaire"
+__copyright__ = "Copyright 2015, FiXiF Project, LIP6"
+__credits__ = ["Thibault Hilaire"]
+
+__license__ = "GPL v3"
+__version__ = "0.4"
+__maintainer__ = "Thibault Hilaire"
+__email__ = "thibault.hilaire@lip6.fr"
+__status__ = "Beta"
+
+
+from time import time
+from numpy import isfinite
+from numpy.random import seed
+from numpy.testing import assert_allclose
+
+from fixif.SIF import random_SIF
+from fixif.LTI import random_dSS
+
+
+def bench(n, p, q, l):
+	"""Time the two methods on a random SIF, and check they give the same sensitivity matrix"""
+	R = random_SIF(random_dSS(n, p, q), l)
+
+	t0 = time()
+	_, MX1 = R.dTFsensitivity(method='naive')
+	t1 = time()
+	_, MX2 = R.dTFsensitivity(method='gramians')
+	t2 = time()
+
+	mask = isfinite(MX1)
+	assert_allclose(MX1[mask], MX2[mask], rtol=1e-5, atol=1e-6)
+	return t1 - t0, t2 - t1
+
+
+if __name__ == '__main__':
+	seed(0)
+	print("%4s %3s %3s %3s %12s %12s %8s" % ('n', 'p', 'q', 'l', 'naive (s)', 'gramians (s)', 'speedup'))
+	for n, p, q, l in [(5, 1, 1, 2), (10, 1, 1, 4), (12, 2, 2, 4), (20, 2, 2, 8)]:
+		t_naive, t_gramians = bench(n, p, q, l)
+		print("%4d %3d %3d %3d %12.4f %12.4f %8.1f" % (n, p, q, l, t_naive, t_gramians, t_naive / t_gramians))
@@ -0,0 +1,171 @@
+# coding: utf8
+
+"""
+This file contains the SpectralData class, that stores the spectral decompositions (Schur form, eigenvalues
+and eigenvectors) of a state matrix A, so that they are computed only once and shared by all the
+state-spaces with the same matrix A
+"""
+
+__author__ = "Thibault Hilaire"
+__copyright__ = "Copyright 2015, FiXiF Project, LIP6"
+__credits__ = ["Thibault Hilaire"]
+
+__license__ = "GPL v3"
+__version__ = "0.4"
+__maintainer__ = "Thibault Hilaire"
+__email__ = "thibault.hilaire@lip6.fr"
+__status__ = "Beta"
+
+
+from weakref import WeakValueDictionary
+from threading import Lock
+
+from numpy import asarray, ascontiguousarray, float64, zeros, zeros_like, diag, eye, finfo, conj, einsum, iscomplexobj, real
+from numpy.linalg import norm
+from scipy.linalg import schur, rsf2csf, solve_triangular
+
+
+# all the SpectralData objects currently in use, indexed by the content of their matrix A
+_spectral_cache = WeakValueDictionary()
+_spectral_lock = Lock()
+
+
+def spectral_data(A):
+	"""
+	Returns the SpectralData object associated to the matrix A
+	The object is shared by all the matrices with exactly the same content (same shape and same binary values)
+	as long as it is used somewhere (the cache only keeps weak references).
+	"""
+	A = ascontiguousarray(A, dtype=float64)
+	key = (A.shape, A.tobytes())
+	with _spectral_lock:
+		sd = _spectral_cache.get(key)
+		if sd is None:
+			sd = SpectralData(A)
+			_spectral_cache[key] = sd
+	return sd
+
+
+
+class SpectralData(object):
+	r"""
+	Spectral data of a (square) matrix A, computed once when asked for:
+	- real Schur form: :math:`A = U T U^\top` with T quasi upper-triangular and U orthogonal
+	- complex Schur form: :math:`A = U_c T_c U_c^H` with T_c upper-triangular and U_c unitary
+	- eigenvalues and (right) eigenvectors, obtained from the complex Schur form
+
+	The real Schur factorization is the only factorization done (the other quantities are deduced from it).
+	It is also used to solve (batches of) discrete Lyapunov (Stein) equations, see solve_stein.
+	"""
+
+	def __init__(self, A):
+		self._A = asarray(A, dtype=float64)
+		if self._A.ndim != 2 or self._A.shape[0] != self._A.shape[1]:
+			raise ValueError('SpectralData: A is not a square matrix')
+
+		self._schur = None
+		self._complex_schur = None
+		self._eig = None
+		self.nb_factorizations = 0		# number of Schur factorizations done (should be 0 or 1)
+
+	@property
+	def A(self):
+		"""Returns the matrix A"""
+		return self._A
+
+	@property
+	def n(self):
+		"""Returns the size of A"""
+		return self._A.shape[0]
+
+	@property
+	def schur(self):
+		"""Returns the real Schur form (T,U) of A, such that A = U.T.U^t"""
+		if self._schur is None:
+			T, U = schur(self._A, output='real')
+			self.nb_factorizations += 1
+			self._schur = (T, U)
+		return self._schur
+
+	@property
+	def complex_schur(self):
+		"""Returns the complex Schur form (T,U) of A, such that A = U.T.U^H (T upper triangular)"""
+		if self._complex_schur is None:
+			self._complex_schur = rsf2csf(*self.schur)
+		return self._complex_schur
+
+	@property
+	def eigvals(self):
+		"""Returns the eigenvalues of A"""
+		return diag(self.complex_schur[0])
+
+	@property
+	def eig(self):
+		"""
+		Returns the eigenvalues and the (normalized) right eigenvectors of A (same convention as numpy.linalg.eig)
+		The eigenvectors of the upper triangular T are computed by back-substitution, and then transformed by U
+		"""
+		if self._eig is None:
+			T, U = self.complex_schur
+			n = self.n
+			lam = diag(T)
+			V = zeros((n, n), dtype=T.dtype)
+			smin = max(finfo(float64).eps * norm(T, 1), finfo(float64).tiny)
+			for k in range(n):
+				V[k, k] = 1
+				if k > 0:
+					Tk = T[:k, :k] - lam[k] * eye(k)
+					# perturb the (almost) zero pivots (repeated eigenvalues), as done in LAPACK xTREVC
+					d = diag(Tk).copy()
+					d[abs(d) < smin] = smin
+					Tk[range(k), range(k)] = d
+					V[:k, k] = solve_triangular(Tk, -T[:k, k])
+			X = U.dot(V)
+			X /= norm(X, axis=0)
+			self._eig = (lam, X)
+		return self._eig
+
+
+	def solve_stein(self, Q, transpose=False):
+		r"""
+		Solve the discrete Lyapunov (Stein) equation(s)
+			:math:`X = A X A^\top + Q` (default) or :math:`X = A^\top X A + Q` (if transpose is True)
+		with a complex Bartels-Stewart algorithm, based on the (shared) Schur form of A.
+		Q can be a (n,n) matrix or a stacked batch of right-hand sides, given as a (b,n,n) array,
+		and X has the same shape as Q (all the equations share the same Schur factorization).
+
+		With :math:`A = U T U^H`, the equation becomes :math:`Y = T Y T^H + \tilde{Q}` (with
+		:math:`Y = U^H X U` and :math:`\tilde{Q} = U^H Q U`) and is solved column by column, from the last one,
+		with a triangular solve for each column:
+		:math:`(I - \bar{T}_{jj} T) Y_{:,j} = \tilde{Q}_{:,j} + T \sum_{k>j} \bar{T}_{jk} Y_{:,k}`
+		For the transposed equation, the same algorithm is applied to the flipped (upper triangular) :math:`T^H`.
+		"""
+		Q = asarray(Q)
+		single = (Q.ndim == 2)
+		if single:
+			Q = Q[None, :, :]
+		n = self.n
+		if Q.shape[1:] != (n, n):
+			raise ValueError('SpectralData: Q should be a (n,n) matrix or a batch of (n,n) matrices')
+
+		T, U = self.complex_schur
+		if transpose:
+			# X = A^H X A + Q  is  X' = T' X' T'^H + Q' with the flipped T' = P T^H P (upper triangular) and U' = U P
+			T = T.conj().T[::-1, ::-1]
+			U = U[:, ::-1]
+
+		# Qt[:, :, b] = U^H Q[b] U
+		Qt = einsum('ai,bac,cj->ijb', U.conj(), Q, U)
+		Y = zeros_like(Qt)
+		I = eye(n)
+		for j in range(n - 1, -1, -1):
+			rhs = Qt[:, j, :]
+			if j < n - 1:
+				rhs = rhs + T.dot(einsum('ikb,k->ib', Y[:, j + 1:, :], conj(T[j, j + 1:])))
+			Y[:, j, :] = solve_triangular(I - conj(T[j, j]) * T, rhs)
+
+		# back to X = U Y U^H
+		X = einsum('ia,abk,jb->kij', U, Y, U.conj())
+		if not iscomplexobj(self._A) and not iscomplexobj(Q):
+			X = real(X)
+		return X[0] if single else X
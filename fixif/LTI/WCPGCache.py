@@ -0,0 +1,137 @@
+# coding: utf8
+
+"""
+This file contains the WCPGCache class, a persistent (on-disk) cache for the WCPG results,
+indexed by the exact (binary) content of the matrices A, B, C, D
+"""
+
+__author__ = "Thibault Hilaire"
+__copyright__ = "Copyright 2015, FiXiF Project, LIP6"
+__credits__ = ["Thibault Hilaire"]
+
+__license__ = "GPL v3"
+__version__ = "0.4"
+__maintainer__ = "Thibault Hilaire"
+__email__ = "thibault.hilaire@lip6.fr"
+__status__ = "Beta"
+
+
+import os
+from hashlib import sha256
+from tempfile import mkstemp
+
+from numpy import ascontiguousarray, float64, save, load
+
+
+class WCPGCache(object):
+	"""
+	Persistent cache of WCPG results, stored in a directory (one .npy file per result)
+	- the key is a hash (sha256) of the exact binary content of A, B, C, D (and their shapes), and of the
+	requested precision/method, so the cache is independent of the objects (and of the runs)
+	- the files are written atomically (temporary file + rename), so that several processes can share the
+	same cache directory
+	- when the size of the directory exceeds max_size (in bytes), the least recently used results are removed
+	(a read updates the modification time of the file)
+
+	..Example::
+		>>> from fixif.LTI import dSS, WCPGCache
+		>>> dSS._WCPG_cache = WCPGCache('/tmp/WCPG_cache', max_size=2**30)
+
+	The cache can also be set with the environment variables FIXIF_WCPG_CACHE (path) and FIXIF_WCPG_CACHE_SIZE
+	(see fixif.config)
+	"""
+
+	def __init__(self, path, max_size=2**30):
+		self._path = path
+		self._max_size = max_size
+		if not os.path.isdir(path):
+			os.makedirs(path, exist_ok=True)
+
+	@property
+	def path(self):
+		return self._path
+
+	@property
+	def max_size(self):
+		return self._max_size
+
+
+	@staticmethod
+	def key(A, B, C, D, prec=None):
+		"""Returns the key (hexadecimal string) associated to the matrices A, B, C, D and the precision prec"""
+		h = sha256()
+		for X in (A, B, C, D):
+			X = ascontiguousarray(X, dtype=float64)
+			h.update(repr(X.shape).encode())
+			h.update(X.tobytes())
+		h.update(repr(prec).encode())
+		return h.hexdigest()
+
+
+	def _filename(self, key):
+		return os.path.join(self._path, key + '.npy')
+
+
+	def get(self, key):
+		"""Returns the result stored for the key, or None if it is not in the cache"""
+		filename = self._filename(key)
+		try:
+			W = load(filename)
+			os.utime(filename)		# for the LRU policy
+		except (IOError, OSError, ValueError):
+			# not in the cache (or removed in the meantime, or corrupted)
+			return None
+		return W
+
+
+	def put(self, key, W):
+		"""Store the result W for the key"""
+		fd, tmpname = mkstemp(dir=self._path, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				save(f, ascontiguousarray(W, dtype=float64))
+			os.replace(tmpname, self._filename(key))
+		except BaseException:
+			if os.path.exists(tmpname):
+				os.remove(tmpname)
+			raise
+		self._evict()
+
+
+	def _evict(self):
+		"""Remove the least recently used results, until the size of the cache is lower than max_size"""
+		files = []
+		total = 0
+		for entry in os.scandir(self._path):
+			if entry.name.endswith('.npy'):
+				try:
+					st = entry.stat()
+				except OSError:
+					continue
+				files.append((st.st_mtime, st.st_size, entry.path))
+				total += st.st_size
+		if total <= self._max_size:
+			return
+		files.sort()
+		for _, size, filename in files:
+			try:
+				os.remove(filename)
+			except OSError:
+				pass		# already removed by another process
+			total -= size
+			if total <= self._max_size:
+				break
+
+
+	def clear(self):
+		"""Remove all the results"""
+		for entry in os.scandir(self._path):
+			if entry.name.endswith('.npy'):
+				try:
+					os.remove(entry.path)
+				except OSError:
+					pass
+
+
+	def __len__(self):
+		return sum(1 for entry in os.scandir(self._path) if entry.name.endswith('.npy'))
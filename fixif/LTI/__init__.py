@@ -1,5 +1,6 @@
 # coding: utf8
-from fixif.LTI.dSS import dSS, iter_random_dSS, random_dSS
+from fixif.LTI.dSS import dSS, iter_random_dSS, random_dSS, compute_gramians
+from fixif.LTI.WCPGCache import WCPGCache
 from fixif.LTI.dTF import dTF, iter_random_dTF, random_dTF
 from fixif.LTI.Filter import Filter, iter_random_Filter, random_Filter
 from fixif.LTI.Butter import Butter, iter_random_Butter, random_Butter
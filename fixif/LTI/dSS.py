@@ -16,12 +16,13 @@ __status__ = "Beta"
 
 
 from copy import copy
-from numpy import empty, float64, identity, dot, array
-from numpy import matrix as mat, set_printoptions
+from numpy import float64, identity, dot, array, empty
+from numpy import matrix as mat
 from numpy import eye, zeros, r_, c_, sqrt
-from numpy.linalg import inv, solve, norm
+from numpy.lib.stride_tricks import as_strided
+from numpy.linalg import inv, solve, norm, eigvalsh
 from numpy.linalg.linalg import LinAlgError
-from scipy.linalg import solve_discrete_lyapunov
+from scipy.linalg import solve_discrete_lyapunov, matrix_balance
 
 from scipy.signal import ss2tf
 from numpy.core.umath import pi, cos, sin
@@ -30,7 +31,13 @@ import numpy
 from itertools import chain
 from numpy.testing import assert_allclose
 
-from fixif.WCPG import WCPG_ABCD
+try:
+	from fixif.WCPG import WCPG_ABCD
+except ImportError:
+	pass
+from fixif.LTI.SpectralData import spectral_data
+from fixif.LTI.WCPGCache import WCPGCache
+from fixif.config import WCPG_CACHE_PATH, WCPG_CACHE_SIZE
 
 try:
 	from slycot import sb03md, ab09ad
@@ -71,10 +78,13 @@ class dSS(object):
 
 	- Gramians : Wo and Wc
 	- "Norms"   : H2-norm (H2norm), Worst Case Peak Gain (WCPG) (see doc for each)
+	- spectral data of A (Schur form, eigenvalues, eigenvectors), shared by all the dSS with the same A
 
 	"""
 
-	_W_method = 'slycot'  # linalg, slycot
+	_W_method = 'slycot'  # linalg, slycot, schur
+	_W_check_tol = 1e-8  # relative tolerance used to check the Gramians given by the 'schur' method (see _stein_schur_checked)
+	_WCPG_cache = WCPGCache(WCPG_CACHE_PATH, WCPG_CACHE_SIZE) if WCPG_CACHE_PATH else None  # persistent WCPG cache (or None)
 
 
 	def __init__(self, A, B, C, D):
@@ -104,6 +114,9 @@ class dSS(object):
 		self._DC_gain = None
 		self._WCPG = None
 
+		# spectral data of A (shared with the other dSS with the same A)
+		self._spectral = None
+
 
 	# Properties
 	@property
@@ -161,6 +174,13 @@ class dSS(object):
 		"""Returns the size of state space, as a tuple (n,p,q)"""
 		return self._n, self._p, self._q
 
+	@property
+	def spectral(self):
+		"""Returns the spectral data of A (Schur form, eigenvalues, eigenvectors), see SpectralData"""
+		if self._spectral is None:
+			self._spectral = spectral_data(self._A)
+		return self._spectral
+
 
 	# ================================
 	# Gramians (Wo, Wc) calculation
@@ -181,6 +201,11 @@ class dSS(object):
 
 		- ``slycot`` : using ``slycot`` lib with func ``sb03md``, like in [matlab ,pydare]
 		see http://slicot.org/objects/software/shared/libindex.html
+		(when slycot is not installed, the ``schur`` method is used if its result passes the checks of
+		_stein_schur_checked, and ``linalg`` otherwise)
+
+		- ``schur`` : Bartels-Stewart algorithm (in numpy/scipy) based on the Schur form of A (shared with
+		the other computations on A, see SpectralData.solve_stein)
 
 		- ``None`` (default) : use the default method defined in the dSS class (dSS._W_method)
 
@@ -189,6 +214,7 @@ class dSS(object):
 			>>> mydSS = random_dSS() ## define a new state space from random data
 			>>> mydSS.calc_Wo('linalg') # use numpy
 			>>> mydSS.calc_Wo('slycot') # use slycot
+			>>> mydSS.calc_Wo('schur') # use the Bartels-Stewart algorithm
 			>>> mydSS.calc_Wo() # use the default method defined in dSS
 
 		.. warning::
@@ -220,9 +246,11 @@ class dSS(object):
 			# Solve the Lyapunov equation by calling the Slycot function sb03md
 			# If we don't use "copy" in the call, the result is plain false
 
+			# the (shared) Schur form of A is given, so that sb03md does not factorize A again
 			try:
+				T, U = self.spectral.schur
 				X, scale, sep, ferr, w = sb03md(self.n, -self._C.transpose() * self._C,
-				                                copy(self._A.transpose()), eye(self.n, self.n), dico='D', trana='T')
+				                                copy(T), copy(U), dico='D', fact='F', trana='N')
 				self._Wo = mat(X)
 
 			except ValueError as ve:
@@ -236,12 +264,37 @@ class dSS(object):
 					e.info = ve.info
 				raise e
 			except NameError:
-				return self.calc_Wo('linalg')
+				# slycot is not installed: the Bartels-Stewart algorithm is used if its result is correct, scipy otherwise
+				X = self._stein_schur_checked(self._C.transpose() * self._C, transpose=True)
+				if X is None:
+					return self.calc_Wo('linalg')
+				self._Wo = mat(X)
+
+		elif method == 'schur':
+			self._Wo = mat(self.spectral.solve_stein(self._C.transpose() * self._C, transpose=True))
 
 		else:
 			raise ValueError("dSS: Unknown method to calculate observers (method=%s)" % method)
 
 
+	def _stein_schur_checked(self, Q, transpose=False):
+		"""
+		Solve the Stein equation X = A X A^T + Q (or X = A^T X A + Q if transpose is True) with the Bartels-Stewart
+		algorithm (see SpectralData.solve_stein), and check the result, since the algorithm is not accurate when the
+		eigenvectors of A are ill-conditioned.
+		Returns X, or None when the relative residual of the equation is larger than dSS._W_check_tol, or when X is not
+		positive semi-definite (up to the same relative tolerance)
+		"""
+		X = self.spectral.solve_stein(Q, transpose=transpose)
+		A = self._A.transpose() if transpose else self._A
+		nX = norm(X)
+		if norm(A * X * A.transpose() + Q - X) > dSS._W_check_tol * (nX + norm(Q)):
+			return None
+		if self._n > 0 and eigvalsh((X + X.transpose()) / 2).min() < -dSS._W_check_tol * nX:
+			return None
+		return X
+
+
 	def calc_Wc(self, method=None):
 		"""
 		Computes observers :math:`W_c`  with method 'method' :
@@ -258,6 +311,11 @@ class dSS(object):
 
 		- ``slycot`` : using ``slycot`` lib with func ``sb03md``, like in [matlab ,pydare]
 		see http://slicot.org/objects/software/shared/libindex.html
+		(when slycot is not installed, the ``schur`` method is used if its result passes the checks of
+		_stein_schur_checked, and ``linalg`` otherwise)
+
+		- ``schur`` : Bartels-Stewart algorithm (in numpy/scipy) based on the Schur form of A (shared with
+		the other computations on A, see SpectralData.solve_stein)
 
 		- ``None`` (default) : use the default method defined in the dSS class (dSS._W_method)
 
@@ -266,6 +324,7 @@ class dSS(object):
 			>>> mydSS = random_dSS() ## define a new state space from random data
 			>>> mydSS.calc_Wc('linalg') # use numpy
 			>>> mydSS.calc_Wc('slycot') # use slycot
+			>>> mydSS.calc_Wc('schur') # use the Bartels-Stewart algorithm
 			>>> mydSS.calc_Wo() # use the default method defined in dSS
 
 		.. warning::
@@ -296,9 +355,11 @@ class dSS(object):
 			# Solve the Lyapunov equation by calling the Slycot function sb03md
 			# If we don't use "copy" in the call, the result is plain false
 
+			# the (shared) Schur form of A is given, so that sb03md does not factorize A again
 			try:
+				T, U = self.spectral.schur
 				X, scale, sep, ferr, w = sb03md(self.n, -self._B * self._B.transpose(),
-				                                copy(self._A), eye(self.n, self.n), dico='D', trana='T')
+				                                copy(T), copy(U), dico='D', fact='F', trana='T')
 				self._Wc = mat(X)
 
 			except ValueError as ve:
@@ -312,7 +373,14 @@ class dSS(object):
 					e.info = ve.info
 				raise e
 			except NameError:
-				return self.calc_Wc(method='linalg')
+				# slycot is not installed: the Bartels-Stewart algorithm is used if its result is correct, scipy otherwise
+				X = self._stein_schur_checked(self._B * self._B.transpose())
+				if X is None:
+					return self.calc_Wc('linalg')
+				self._Wc = mat(X)
+
+		elif method == 'schur':
+			self._Wc = mat(self.spectral.solve_stein(self._B * self._B.transpose()))
 
 		else:
 			raise ValueError("dSS: Unknown method to calculate observers (method=%s)" % method)
@@ -354,67 +422,271 @@ class dSS(object):
 
 
 
-	def WCPG_mp(self):
+	def WCPG(self, output_info=None):
 		r"""
 		Compute the Worst Case Peak Gain of the state space
-
+		if output_info is given, it should be a dictionary that will be fill by WCPG library.
+		It then contains some informations about the computation (nb iterations, etc.)
 		.. math::
 			\langle \langle H \rangle \rangle \triangleq |D| + \sum_{k=0}^\infty |C * A^k * B|
 
-		Using algorithm developed in paper :
-		[CIT001]_
-
-		.. [CIT001]
-			Lozanova & al., calculation of WCPG
+		Using algorithm developed in paper, and implement in the WCPG library (and its Python wrapper) :
 
+		If a persistent cache is set (dSS._WCPG_cache, see WCPGCache), the result is looked for in it first
+		(except when output_info is given)
 		"""
 		# compute the WCPG value if it's not already done
-		if self._WCPG is None:
-
+		if self._WCPG is None or output_info is not None:
 			try:
-				# noinspection PyUnusedLocal
-				A, B, C, D = array(self._A), array(self._B), array(self._C), array(self._D)
-				n, p, q = self.size
-				W = empty((p, q), dtype=float64)
-				mpeps = 2**-120
-
-				# int WCPG_ABCD_mprec(mpfr_t *W, double *A, double *B, double *C, double *D, uint64_t n, uint64_t p, uint64_t q, mpfr_t mpeps);
-				code = "return_val = WCPG_ABCD( &W[0,0], &A[0,0], &B[0,0], &C[0,0], &D[0,0], n, p, q, mpeps);"
-				support = 'extern "C" int WCPG_ABCD_mprec(double *W, double *A, double *B, double *C, double *D, ' \
-				          'uint64_t n, uint64_t p, mpfr_t mpeps);'
-				err = inline(code, ['W', 'A', 'B', 'C', 'D', 'n', 'p', 'q', 'mpeps'], support_code=support, libraries=["WCPG"])
-				if err == 0:
-					# change numpy display formatter, so that we can display the full coefficient in hex
-					# (equivalent to printf("%a",...) in C)
-					set_printoptions(formatter={'float_kind': lambda x: x.hex()})
-					print(self)
-					raise ValueError("WCPG: cannot compute WCPG")
-				self._WCPG = mat(W)
-			except:
-				raise ValueError("dSS: Impossible to compute WCPG matrix. Is WCPG library really installed ?")
-
+				wcpg = WCPG_ABCD
+			except NameError:
+				raise ImportError("dSS.WCPG: the WCPG library is not installed (WCPG_estimate can be used instead)")
+			cache = dSS._WCPG_cache
+			if cache is not None and output_info is None:
+				key = cache.key(self._A, self._B, self._C, self._D, 'WCPG_ABCD')
+				W = cache.get(key)
+				if W is None:
+					W = wcpg(self._A, self._B, self._C, self._D, None)
+					cache.put(key, W)
+			else:
+				W = wcpg(self._A, self._B, self._C, self._D, output_info)
+			self._WCPG = mat(W)
 		return self._WCPG
 
 
-	def WCPG(self, output_info=None):
+	def WCPG_estimate(self, eps=1e-10, blocksize=64, maxorder=2**24):
 		r"""
-		Compute the Worst Case Peak Gain of the state space
-		if output_info is given, it should be a dictionary that will be fill by WCPG library.
-		It then contains some informations about the computation (nb iterations, etc.)
+		Compute an estimate of the Worst Case Peak Gain of the state space, with numpy only (does not require
+		the WCPG library), with an estimate of its error
+
 		.. math::
 			\langle \langle H \rangle \rangle \triangleq |D| + \sum_{k=0}^\infty |C * A^k * B|
 
-		Using algorithm developed in paper, and implement in the WCPG library (and its Python wrapper) :
+		The sum is truncated at order N, and computed by blocks of blocksize terms: the block
+		:math:`[A^{jL}B, A^{jL+1}B, ..., A^{jL+L-1}B]` is obtained from the previous one by a product by
+		:math:`A^L` (computed by repeated squaring).
+		In exact arithmetic, the truncation error is bounded by
 
+		.. math::
+			\sum_{k \geq N} |c_i A^k b_j| \leq \|c_i\| \|A^N b_j\| \sum_{k \geq 0} \|A^k\|
+			\leq \|c_i\| \|A^N b_j\| \frac{\prod_{t<s} (1 + \|A^{2^t}\|)}{1 - \|A^{2^s}\|}
+
+		with s such that :math:`\|A^{2^s}\| < 1/2` (2-norms), and the order N is increased (starting from
+		an estimation given by the spectral radius of A) until this bound is lower than eps.
+		A first-order estimate of the rounding errors (propagated through the powers of A) is added. The
+		second-order terms are neglected, and the norms used in the bounds are computed in floating-point, so
+		the error estimate is not a guaranteed bound: W + errest is not guaranteed to be an upper bound of the WCPG,
+		and it cannot be used to prune realizations (the WCPG method should be used for a rigorous result).
+
+		Parameters:
+			- eps: absolute bound of the truncation error (in exact arithmetic)
+			- blocksize: number of terms computed per block (rounded to a power of 2)
+			- maxorder: maximum truncation order
+
+		Returns:
+			- W: the estimate of the WCPG (matrix p x q)
+			- errest: an estimate of :math:`|W - \langle \langle H \rangle \rangle|` (matrix p x q), not a guaranteed bound
 		"""
-		# compute the WCPG value if it's not already done
-		if self._WCPG is None or output_info is not None:
-			self._WCPG = WCPG_ABCD(self._A, self._B, self._C, self._D, output_info)
-		return self._WCPG
+		A, B, C, D = array(self._A), array(self._B), array(self._C), array(self._D)
+		n, p, q = self.size
+		u = numpy.finfo(float64).eps / 2
+
+		# balance A with a diagonal similarity (powers of 2, so it is exact, and C A^k B is unchanged),
+		# so that the norms of the powers of A (used in the bounds) are smaller
+		if n > 0:
+			A, T = matrix_balance(A, permute=False)
+			t = numpy.diag(T)
+			B = B / t[:, None]
+			C = C * t[None, :]
+
+		# the WCPG is infinite if A is not stable
+		rho = max(abs(self.spectral.eigvals)) if n > 0 else 0
+		if rho >= 1:
+			raise ValueError("dSS: WCPG_estimate: the system is not stable (spectral radius %f)" % rho)
+
+		# bound of sum_k ||A^k|| = prod_{t<s} (1+||A^(2^t)||) / (1 - ||A^(2^s)||)
+		sumA = 1.
+		P = A
+		for _ in range(64):
+			nP = norm(P, 2)
+			if nP < 0.5:
+				break
+			sumA *= 1 + nP
+			P = P.dot(P)
+		else:
+			raise ValueError("dSS: WCPG_estimate: cannot bound the powers of A (spectral radius too close to 1)")
+		sumA /= 1 - nP
+
+		# first estimation of the order, from the spectral radius
+		nC = norm(C, axis=1)
+		scale = max(nC.max() * norm(B, axis=0).max() * sumA, eps) if n > 0 else eps
+		N = int(numpy.ceil(numpy.log(eps / scale) / numpy.log(rho))) if rho > 0 else 1
+		N = min(max(N, 1), maxorder)
+
+		# block [B, AB, ..., A^(L-1) B] and A^L
+		L = 1
+		X = B
+		AL = A
+		while L < blocksize:
+			X = c_[X, AL.dot(X)]
+			AL = AL.dot(AL)
+			L *= 2
+
+		W = abs(D).copy()
+		sumX = zeros(q)		# sum_k ||A^k b_j||
+		k = 0		# number of terms already computed
+		while True:
+			W += abs(C.dot(X)).reshape(p, L, q).sum(axis=1)
+			sumX += norm(X.reshape(n, L, q), axis=0).sum(axis=0)
+			k += L
+			X = AL.dot(X)
+			if k >= N:
+				# truncation error bound, with A^N b_j = X[:, j] (first term of the next block)
+				T = nC[:, None] * norm(X[:, :q], axis=0)[None, :] * sumA
+				if T.max() <= eps:
+					break
+				if k >= maxorder:
+					raise ValueError("dSS: WCPG_estimate: the maximum order is reached, without the required accuracy")
+				N = min(2 * k, maxorder)
+
+		# first-order estimate of the rounding errors (the terms in u^2 are neglected): each product by A (or A^L)
+		# adds an error bounded by (n+1)u |A| |x|, that is propagated by the next powers of A (bounded by sumA),
+		# and the k additions
+		gamma = (n + 1) * u * max(norm(abs(A), 2), norm(abs(AL), 2), 1)
+		R = gamma * sumA * nC[:, None] * sumX[None, :] + k * u * W
+		errest = T + R
+		return mat(W), mat(errest)
 
 
 
 
+	# ======================================================================================
+	def simulate(self, u, x0=None, blocksize=None):
+		r"""
+		Compute the outputs of the state-space with the inputs u (and the initial state x0)
+		The simulation is done by blocks of L samples (block-state propagation): with :math:`x_j` the state at the
+		beginning of the block j, :math:`U_j` and :math:`Y_j` the inputs and outputs of this block
+
+		.. math::
+			Y_j = \mathcal{O} x_j + \mathcal{T} U_j \quad \text{ and } \quad x_{j+1} = A^L x_j + \mathcal{C} U_j
+
+		with :math:`\mathcal{O}` the observability matrix, :math:`\mathcal{T}` the block Toeplitz matrix of the
+		Markov parameters and :math:`\mathcal{C}` the (reversed) controllability matrix (all of order L).
+		So only the recursion over the blocks is done in Python (all the inputs of a batch are treated at once).
+
+		Parameters:
+			- u: a q*N matrix (one input sequence) or a (batch, q, N) array (several input sequences)
+			- x0: initial state (n-vector, or (batch, n) array), zero by default
+			- blocksize: the block length L (default: chosen from the state size)
+		Returns:
+			- y: a p*N matrix (for a q*N input), or a (batch, p, N) array
+		"""
+		n, p, q = self.size
+		single = (numpy.ndim(u) == 2)
+		U = numpy.asarray(u, dtype=float64)
+		if single:
+			U = U[None, :, :]
+		if U.ndim != 3 or U.shape[1] != q:
+			raise ValueError("dSS.simulate: u should be a %d*N matrix or a (batch, %d, N) array" % (q, q))
+		batch, _, N = U.shape
+
+		# block length, number of full blocks and length of the last (partial) block
+		L = min(N, max(32, 2 * n)) if blocksize is None else blocksize
+		L = max(L, 1)
+		nb, r = divmod(N, L)
+
+		A, B, C = array(self._A), array(self._B), array(self._C)
+
+		# observability matrix O (L, p, n) and reversed controllability matrix (n, L, q)
+		O = empty((L, p, n))
+		Ctrl = empty((n, L, q))
+		P = eye(n)
+		X = B
+		for k in range(L):
+			O[k] = C.dot(P)
+			Ctrl[:, L - 1 - k, :] = X
+			P = P.dot(A)
+			X = A.dot(X)
+		AL = P
+		# block Toeplitz matrix T[i,:,k,:] = h(i-k) (L, p, L, q), as a strided view on the Markov parameters
+		# preceded by L-1 zeros: T[i,:,k,:] = Hz[L-1+i-k]
+		Hz = numpy.concatenate([zeros((L - 1, p, q))] + list(self.iter_markov(L)))
+		s0, s1, s2 = Hz.strides
+		T = as_strided(Hz[L - 1:], shape=(L, p, L, q), strides=(s0, s1, -s0, s2))
+
+		if x0 is None:
+			x = zeros((batch, n))
+		else:
+			x = numpy.broadcast_to(numpy.asarray(x0, dtype=float64).reshape(-1, n), (batch, n)).copy()
+		Y = empty((batch, p, N))
+
+		if nb > 0:
+			# full blocks: Ub[b, i, j, k] = u[b, i, jL+k] (a view on u)
+			Ub = U[:, :, :nb * L].reshape(batch, q, nb, L)
+			# states at the beginning of each block
+			CU = numpy.tensordot(Ub, Ctrl, axes=([1, 3], [2, 1]))		# (batch, nb, n)
+			Xb = empty((batch, nb, n))
+			ALt = AL.T
+			for j in range(nb):
+				Xb[:, j, :] = x
+				x = x.dot(ALt) + CU[:, j, :]
+			# outputs
+			Yb = numpy.tensordot(Ub, T, axes=([1, 3], [3, 2]))		# (batch, nb, L, p)
+			Yb += numpy.tensordot(Xb, O, axes=([2], [2]))
+			Y[:, :, :nb * L] = Yb.transpose(0, 3, 1, 2).reshape(batch, p, nb * L)
+
+		if r > 0:
+			# last partial block (of length r), with the r first Markov parameters and rows of O
+			Yr = numpy.tensordot(U[:, :, nb * L:], T[:r, :, :r, :], axes=([1, 2], [3, 2]))		# (batch, r, p)
+			Yr += numpy.tensordot(x, O[:r], axes=([1], [2]))
+			Y[:, :, nb * L:] = Yr.transpose(0, 2, 1)
+
+		return mat(Y[0]) if single else Y
+
+
+
+	# ======================================================================================
+	def iter_markov(self, N, blocksize=1024):
+		r"""
+		Generator of the N first Markov parameters (impulse response) of the system
+			:math:`h(0) = D` and :math:`h(k) = C A^{k-1} B` for k>0
+		They are computed with a forward recursion, by blocks: the block :math:`[A^{jL}B, ..., A^{jL+L-1}B]` is obtained
+		from the previous one with a product by :math:`A^L`, so that the cost is linear in N (and the memory in L).
+
+		Parameters:
+			- N: number of Markov parameters
+			- blocksize: (maximum) number of Markov parameters per block
+		Yields:
+			- (L, p, q) arrays H of consecutive Markov parameters (H[r] is h(k+r), k being the number of Markov
+			parameters already given)
+		"""
+		n, p, q = self.size
+		A, B, C, D = array(self._A), array(self._B), array(self._C), array(self._D)
+		L = max(1, min(blocksize, N))
+
+		# block [B, AB, ..., A^(L-1) B] (n, L*q) and A^L
+		X = empty((n, L, q))
+		P = B
+		AL = eye(n)
+		for k in range(L):
+			X[:, k, :] = P
+			P = A.dot(P)
+			AL = AL.dot(A)
+		X = X.reshape(n, L * q)
+
+		# the first Markov parameter is D, so the blocks C.X are shifted by one
+		carry = D[None, :, :]
+		k = 0
+		while k < N:
+			G = C.dot(X).reshape(p, L, q).transpose(1, 0, 2)		# h(k+1) to h(k+L)
+			H = numpy.concatenate((carry, G[:-1]))
+			carry = G[-1:]
+			X = AL.dot(X)
+			m = min(L, N - k)
+			yield H[:m]
+			k += m
+
+
 	# ======================================================================================
 	def calc_DC_gain(self):
 		r"""
@@ -446,6 +718,10 @@ class dSS(object):
 		self._B = Tinv * self._B
 		self._C = self._C * T
 		# D is unchanged
+		# the Gramians and the spectral data are not valid anymore
+		self._Wo = None
+		self._Wc = None
+		self._spectral = None
 
 	# ======================================================================================
 	def _check_dimensions(self):
@@ -528,8 +804,8 @@ class dSS(object):
 		n1, p1, q1 = self.size
 		n2, p2, q2 = other.size
 
-		if p1 != q2:
-			raise ValueError("dSS: second state space should have same number of inputs as first state number of outputs")
+		if q1 != p2:
+			raise ValueError("dSS: second state space should have same number of outputs as first state number of inputs")
 
 		# TODO: possible simplification if self.A==other.A ??
 
@@ -753,6 +1029,89 @@ class dSS(object):
 
 
 
+def _stein_doubling(A, Q, maxiter=64):
+	"""
+	Solve a batch of discrete Lyapunov (Stein) equations X[k] = A[k] * X[k] * A[k]^T + Q[k]
+	with the (Smith) doubling algorithm: X <- X + A X A^T and A <- A^2
+	A and Q are (b,n,n) arrays
+	"""
+	X = Q.copy()
+	A = A.copy()
+	for _ in range(maxiter):
+		dX = numpy.matmul(numpy.matmul(A, X), A.transpose(0, 2, 1))
+		X += dX
+		A = numpy.matmul(A, A)
+		nX = norm(X, axis=(1, 2))
+		if not numpy.all(numpy.isfinite(nX)):
+			break
+		if numpy.all(norm(dX, axis=(1, 2)) <= numpy.finfo(float64).eps * nX):
+			return X
+	raise ValueError("dSS: compute_gramians: the doubling algorithm did not converge (is the system stable?)")
+
+
+def _gramians_doubling(A, B, C):
+	"""Compute the Gramians Wo and Wc of a batch of systems (A,B,C given as (b,n,n), (b,n,q) and (b,p,n) arrays)"""
+	At = A.transpose(0, 2, 1)
+	Wc = _stein_doubling(A, numpy.matmul(B, B.transpose(0, 2, 1)))
+	Wo = _stein_doubling(At, numpy.matmul(C.transpose(0, 2, 1), C))
+	return Wo, Wc
+
+
+def compute_gramians(systems, processes=None, chunksize=64):
+	"""
+	Compute (and store) the Gramians Wo and Wc of a list of systems, in a vectorized way
+	The systems are grouped by size, and the Lyapunov equations of a group are solved at once
+	(with a batched doubling algorithm on stacked 3D arrays).
+
+	Parameters:
+		- systems: list of dSS, or of objects with a dSS attribute (SIF, Realization, Filter, etc.)
+		- processes: if not None, number of processes used to solve the groups (by chunks of chunksize systems)
+		- chunksize: number of systems per task when a process pool is used
+
+	Returns the list of (Wo, Wc) of the systems (they are also stored in the dSS, so that S.Wo and S.Wc are
+	not computed again)
+
+	..Example::
+		>>> from fixif.LTI import Filter, compute_gramians
+		>>> F = Filter(num=[1, 2, 3, 4], den=[5.0, 6.0, 7.0, 8.0])
+		>>> R = list(F.iterAllRealizations())
+		>>> compute_gramians(R)
+	"""
+	# get the dSS objects, and group them by (n,p,q) (the systems already computed are not taken into account)
+	ss = [S if isinstance(S, dSS) else S.dSS for S in systems]
+	groups = {}
+	for i, S in enumerate(ss):
+		if S._Wo is None or S._Wc is None:
+			groups.setdefault(S.size, []).append(i)
+
+	# build the tasks (stacked matrices)
+	tasks = []
+	for (n, p, q), indexes in groups.items():
+		for k in range(0, len(indexes), chunksize if processes else len(indexes)):
+			ind = indexes[k:k + chunksize] if processes else indexes
+			A = numpy.array([array(ss[i].A) for i in ind])
+			B = numpy.array([array(ss[i].B) for i in ind])
+			C = numpy.array([array(ss[i].C) for i in ind])
+			tasks.append((ind, (A, B, C)))
+
+	# solve them (possibly with a process pool)
+	if processes and len(tasks) > 1:
+		from concurrent.futures import ProcessPoolExecutor
+		with ProcessPoolExecutor(max_workers=processes) as executor:
+			results = list(executor.map(_gramians_doubling, *zip(*[t[1] for t in tasks])))
+	else:
+		results = [_gramians_doubling(*t[1]) for t in tasks]
+
+	# and store the results
+	for (ind, _), (Wo, Wc) in zip(tasks, results):
+		for k, i in enumerate(ind):
+			ss[i]._Wo = mat(Wo[k])
+			ss[i]._Wc = mat(Wc[k])
+
+	return [(S.Wo, S.Wc) for S in ss]
+
+
+
 def iter_random_dSS(number, stable=True, n=(5, 10), p=(1, 5), q=(1, 5),
                     pRepeat=0.01, pReal=0.5, pBCmask=0.90, pDmask=0.8, pDzero=0.5):
 	"""
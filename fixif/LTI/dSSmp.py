@@ -14,12 +14,17 @@ import mpmath
 import numpy
 
 from numpy.random.mtrand import randint, rand
-from fixif.func_aux import python2mpf_matrix, mpf_to_numpy, mp_poly_product, mpf_matrix_fadd, mpf_matrix_fmul, mpf_matrix_to_sollya
+from mpmath.libmp import mpf_pos
+from fixif.func_aux import python2mpf_matrix, mpf_to_numpy, mpf_matrix_to_sollya, DyadicMatrix, dyadic_charpoly, mpf_matrix_charpoly
+from fixif.func_aux import mp_context
 from fixif.LTI import random_dSS
 
 
 class dSSmp(object):
 
+	_dTFmp_exact_order = 32		# maximum order for the exact computation of the transfer function
+	_dTFmp_max_prec = 2**16		# maximum working precision for the computation of the transfer function
+
 	def __init__(self, A, B, C, D):
 		"""
 		The dSSmp class describes a discrete state space realization
@@ -109,6 +114,8 @@ class dSSmp(object):
 		self._C = C
 		self._D = D
 
+		self._dyadic = None		# (A,B,C,D) as DyadicMatrix, computed when needed
+
 
 
 	@property
@@ -278,58 +285,67 @@ class dSSmp(object):
 	def to_dTFmp(self, prec=64):
 		"""
 		This function computes corresponding transfer function in multiple precision.
-		All operations are performed with at leaste prec bits of precision for mantissas.
+		The coefficients of the transfer function are given with prec bits of precision for mantissas
+		(correctly rounded for the exact method, and with a relative error (to the norm of the coefficients)
+		lower than 2^-prec otherwise).
+
+		The denominator is the characteristic polynomial of A and, since
+			det(zI - A + BC) = det(zI - A) (1 + C (zI - A)^-1 B),
+		the numerator is charpoly(A - BC) + (D - 1) charpoly(A).
+		For small orders (n <= _dTFmp_exact_order), the characteristic polynomials are computed exactly
+		(Faddeev-LeVerrier algorithm in dyadic integer arithmetic).
+		Otherwise, they are computed with a Hessenberg reduction, in a local mpmath context (the global
+		precision is not modified), and the precision is increased until two successive computations agree.
+
 		Parameters
 		----------
-		prec - precision for the computations
+		prec - precision for the coefficients
 
 		Returns
 		-------
 		TF - a dTFmp object
 
 		"""
-		# converting the dSS matrices to mp type
-
-		oldprec = mpmath.mp.prec
-		mpmath.mp.prec = prec
-
 		from fixif.LTI import dTFmp
 
 		if self.p != 1 or self.q != 1:
 			raise ValueError('dSS: cannot convert a dSSmp to dTFmp for not a SISO system')
 
-		E, V = mpmath.mp.eig(self.A)  # eig returns a list E and a matrix V
-		Cmp = self.C * V
-		Vinv = mpmath.mp.inverse(V)
-		Bmp = Vinv * self.B
+		A, B, C, D = self.dyadic
+		ABC = A - B * C
+		one = DyadicMatrix([[1]])
 
-		Q = mp_poly_product([-e for e in E])
-		PP = mpmath.mp.zeros(Q.rows - 1, 1)
-		# tmp_polyproduct = mp.zeros([self.n, 1]) #temporary polynomial products
-		for i in range(0, self.n):
-			# P = sum_i=0^n c_i * b_i * product_j!=i p_j
-			tmp_polyproduct = mp_poly_product([-e for e in E], i)
-			PP = PP + Cmp[0, i] * Bmp[i, 0] * tmp_polyproduct
-
-
-		if self.D[0, 0] != mpmath.mp.zero:
-			P = self.D[0, 0] * Q
+		if self._n <= self._dTFmp_exact_order:
+			# exact computation
+			den = dyadic_charpoly(A)
+			num = dyadic_charpoly(ABC) + den * (D - one)
+			b = num.round(prec).to_mpmath()
+			a = den.round(prec).to_mpmath()
 		else:
-			P = mpmath.mp.zeros(Q.rows, 1)
-
-		for i in range(1, P.rows):
-			P[i, 0] = P[i, 0] + PP[i - 1, 0]
+			# Hessenberg reduction with increasing working precision
+			wprec = prec + 32
+			ctx = mp_context(prec=wprec)
+			Amp = A.to_mpmath()
+			ABCmp = ABC.to_mpmath()
+			Dm1 = (D - one).to_mpmath()[0, 0]
+			res = None
+			while True:
+				ctx.prec = wprec
+				den = mpf_matrix_charpoly(Amp, ctx)
+				num = [x + ctx.mpf(Dm1) * y for x, y in zip(mpf_matrix_charpoly(ABCmp, ctx), den)]
+				if res is not None:
+					# residual between two successive computations, relative to the norm of the coefficients
+					scale = max(ctx.norm(ctx.matrix(num)), ctx.norm(ctx.matrix(den)))
+					residual = max(ctx.norm(ctx.matrix(num) - ctx.matrix(res[0])), ctx.norm(ctx.matrix(den) - ctx.matrix(res[1])))
+					if residual <= ctx.ldexp(scale, -prec - 1):
+						break
+				if wprec > self._dTFmp_max_prec:
+					raise ValueError('dSSmp: cannot compute the transfer function with %d bits (max working precision reached)' % prec)
+				res = (num, den)
+				wprec *= 2
+			b = mpmath.matrix([mpmath.mp.make_mpf(mpf_pos(x._mpf_, prec, 'n')) for x in num])
+			a = mpmath.matrix([mpmath.mp.make_mpf(mpf_pos(x._mpf_, prec, 'n')) for x in den])
 
-		b = mpmath.mp.zeros(P.rows, 1)
-		a = mpmath.mp.zeros(Q.rows, 1)
-		for i in range(0, P.rows):
-			b[i, 0] = P[i, 0].real
-			b[i, 0] = mpmath.fadd(b[i, 0], mpmath.mp.zero, prec=prec)
-		for i in range(0, Q.rows):
-			a[i, 0] = Q[i, 0].real
-			a[i, 0] = mpmath.fadd(a[i, 0], mpmath.mp.zero, prec=prec)
-
-		mpmath.mp.prec = oldprec
 		return dTFmp(b, a)
 
 	def WCPGmp(self, delta=2**-53):
@@ -372,99 +388,110 @@ class dSSmp(object):
 
 
 
-	def simulate_rounded(self, u, prec=53):
-
-		# suppose u is a mpmath matrix
-		xk = mpmath.mp.zeros(self._n, 1)
-
-		# xk = mpf_matrix_to_sollya(xk)[0]
-
-		nSimulations = u.shape[1]
-		yk = mpmath.mp.zeros(self._p, nSimulations)
+	@property
+	def dyadic(self):
+		"""
+		Returns the matrices (A, B, C, D) as DyadicMatrix (integer mantissas with a common exponent),
+		used for the exact computations
+		"""
+		if self._dyadic is None:
+			self._dyadic = tuple(DyadicMatrix.from_mpmath(X) for X in (self._A, self._B, self._C, self._D))
+		return self._dyadic
 
-		yk_sollya = mpf_matrix_to_sollya(yk)[0]
-		for i in range(0, nSimulations):
-			xkp1 = mpf_matrix_fmul(self._A, xk)
-			xkp1 = mpf_matrix_fadd(xkp1, mpf_matrix_fmul(self._B, u[:, i]))
 
-			yk[:, i] = mpf_matrix_fmul(self._C, xk)
-			yk[:, i] = mpf_matrix_fadd(yk[:, i], mpf_matrix_fmul(self._D, u[:, i]))
+	def _simulate_dyadic(self, u, x0=None, prec=None, rounding='n', round_outputs=False):
+		"""
+		Simulation engine, with dyadic integer matrices: the state x(k) is kept as integer mantissas
+		with a common exponent, and
+			x(k+1) = A x(k) + B u(k)
+			y(k)   = C x(k) + D u(k)
+		are computed exactly (B u and D u are computed once for all the inputs).
+		If prec is not None, the states are rounded to prec bits after each iteration (with the rounding mode
+		rounding, see DyadicMatrix.round), and also the outputs if round_outputs is True.
+		Returns the p x T outputs as a DyadicMatrix.
+		"""
+		# inputs
+		if isinstance(u, numpy.ndarray):
+			u = numpy.matrix(u)
+		elif not isinstance(u, mpmath.matrix):
+			raise ValueError('Cannot perform simulation: u must be either mpmath.matrix or numpy.matrix')
+		try:
+			U = DyadicMatrix.from_matrix(u)
+		except ValueError as e:
+			raise ValueError('Cannot perform simulation. %s' % e)
+		if U.rows != self._q:
+			raise ValueError('Cannot perform simulation: u is of incorrect size')
+
+		# initial state
+		if x0 is None:
+			xk = DyadicMatrix(numpy.zeros((self._n, 1), dtype=object))
+		elif isinstance(x0, mpmath.matrix) or isinstance(x0, numpy.ndarray):
+			xk = DyadicMatrix.from_matrix(x0)
+		else:
+			raise ValueError('Cannot perform simulation: initial state specified in incorrect format')
+		if xk.shape != (self._n, 1):
+			raise ValueError('Cannot perform simulation: initial state is of incorrect size')
 
+		A, B, C, D = self.dyadic
+		BU = B * U
+		DU = D * U
+		y = []
+		for k in range(U.cols):
+			yk = C * xk + DU[:, k:k+1]
+			xk = A * xk + BU[:, k:k+1]
+			if prec is not None:
+				xk = xk.round(prec, rounding)
+				if round_outputs:
+					yk = yk.round(prec, rounding)
+			y.append(yk)
+
+		if not y:
+			return DyadicMatrix(numpy.zeros((self._p, 0), dtype=object))
+		return DyadicMatrix.concatenate(y, axis=1)
+
+
+	def simulate_rounded(self, u, prec=53, rounding='n'):
+		"""
+		Given a vector of inputs u this function simulates the output of the dSS system on these inputs,
+		when the states and the outputs are rounded to prec bits (mantissa) after each iteration
+		(the sums-of-products are computed exactly before the rounding).
 
-			xk = mpmath.matrix([float(sollya.round(mpf_matrix_to_sollya(xkp1)[0][j], prec, sollya.RN)) for j in range(0, self._n)])
-			yk_sollya[i] = sollya.round(mpf_matrix_to_sollya(yk[:, i])[0][0], prec, sollya.RN)
+		Parameters
+		----------
+		u - vector of inputs in the format numpy.matrix or mpmath.matrix of size q x T
+		prec - number of bits of the mantissa of the states and outputs (53 for double precision)
+		rounding - rounding mode ('n' to nearest (default), 'f' floor, 'c' ceiling, 'd' toward zero, 'u' away from zero)
 
-		return yk_sollya
+		Returns
+		-------
+		y - p x T mpmath matrix of (rounded) outputs
+		"""
+		return self._simulate_dyadic(u, prec=prec, rounding=rounding, round_outputs=True).to_mpmath()
 
 
 
-	def simulate(self, u, exact=True, x0=None):
+	def simulate(self, u, exact=True, x0=None, prec=53):
 		"""
 		Given a vector of inputs u this function simulates
 		the output of the dSS system on these inputs.
 
 		If the flag exact is set to True (default) then the simulation is performed
 		exactly. Otherwise, on each iteration the SoPs are computed exactly and then the state variables
-		are rounded to double precision.
+		are rounded to prec bits (double precision by default).
 
 		Parameters
 		----------
 		u - vector of inputs in the format numpy.matrix or mpmath.matrix of size q x T
 		x0 - vector of inital states, if specified must be of size n x 1
 		exact - a flag wether to perform simulations in exact (by default) or to perform
+		prec - number of bits of the mantissa of the states (when exact is False)
 
 		Returns
 		-------
 		y -  p x T matrix of outputs
 
 		"""
-
-		if not isinstance(u, mpmath.matrix):
-			if isinstance(u, numpy.matrix):
-				u = python2mpf_matrix(u)
-			else:
-				raise ValueError('Cannot perform simulation: u must be either mpmath.matrix or numpy.matrix')
-
-		if u.rows != self._q:
-			raise ValueError('Cannot perform somulation: u is of incorrect size')
-
-		xk = mpmath.mp.zeros(self._n, 1)
-		if x0:
-			if not isinstance(x0, mpmath.matrix):
-				if isinstance(x0, numpy.matrix):
-					xk = python2mpf_matrix(x0)
-				else:
-					raise ValueError('Cannot perform simulation: initial state specified in incorrect format')
-
-		if xk.rows != self._n:
-			raise ValueError('Cannot perform simulation: initial state is of incorrect size')
-
-		T = u.cols
-		yk = mpmath.mp.zeros(self._p, T)
-
-		if exact:
-			for i in range(0, T):
-				xkp1 = mpf_matrix_fmul(self._A, xk)
-				xkp1 = mpf_matrix_fadd(xkp1, mpf_matrix_fmul(self._B, u[:, i]))
-
-				yk[:, i] = mpf_matrix_fmul(self._C, xk)
-				yk[:, i] = mpf_matrix_fadd(yk[:, i], mpf_matrix_fmul(self._D, u[:, i]))
-
-				xk = xkp1
-
-		else:
-			for i in range(0, T):
-				xkp1 = mpf_matrix_fmul(self._A, xk)
-				xkp1 = mpf_matrix_fadd(xkp1, mpf_matrix_fmul(self._B, u[:, i]))
-
-				yk[:, i] = mpf_matrix_fmul(self._C, xk)
-				yk[:, i] = mpf_matrix_fadd(yk[:, i], mpf_matrix_fmul(self._D, u[:, i]))
-
-			for i in range(0, xk.rows):
-				xk[i, 0] = mpmath.fadd(xkp1[i, 0], mpmath.mp.zero, prec=64, rounding='n')
-
-
-		return yk
+		return self._simulate_dyadic(u, x0, prec=None if exact else prec).to_mpmath()
 
 
 
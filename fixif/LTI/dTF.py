@@ -15,7 +15,10 @@ __email__ = "thibault.hilaire@lip6.fr"
 __status__ = "Beta"
 
 
-from fixif.WCPG import WCPG_TF
+try:
+	from fixif.WCPG import WCPG_TF
+except ImportError:
+	pass
 from numpy import ndenumerate, array, linspace
 from numpy import matrix as mat, polymul, polyadd
 from numpy import diagflat, zeros, ones, r_, atleast_2d, fliplr
@@ -245,7 +248,10 @@ class dTF(object):
 		"""
 		# compute the WCPG value if it's not already done
 		if self._WCPG is None:
-			self._WCPG = WCPG_TF(self._num, self._den)
+			try:
+				self._WCPG = WCPG_TF(self._num, self._den)
+			except NameError:
+				raise ImportError("dTF.WCPG: the WCPG library is not installed")
 		return self._WCPG
 
 
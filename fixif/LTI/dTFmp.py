@@ -10,21 +10,24 @@ __email__ = "Anastasia.Volkova@lip6.fr"
 __status__ = "Beta"
 
 from numpy.random.mtrand import randint, rand
-from fixif.func_aux import python2mpf_matrix, mpf_to_numpy, mpf_matrix_to_sollya
+from fixif.func_aux import python2mpf_matrix, mpf_to_numpy, mpf_matrix_to_sollya, mp_context
 import mpmath
 import numpy
+from mpmath.libmp import mpf_div
 # import sollya
 
 
 class dTFmp(object):
 
-	def __init__(self, b, a):
+	def __init__(self, b, a, ctx=None):
 		"""
 		define a discrete transfer function with multiple precision coefficients
 		Parameters
 		----------
 		b -  deg_b x 1 matrix of filter coefficients
 		a -  deg_a x 1 matrix of filter coefficients
+		ctx - mpmath context used to normalize the coefficients (when a[0] is not 1). By default, the divisions
+		are done with twice the precision of the coefficients
 
 		Returns
 		-------
@@ -48,12 +51,22 @@ class dTFmp(object):
 			raise ValueError('Cannot create a dTFmp pbject: incorrect sizes')
 
 
+		if ctx is not None:
+			ctx = mp_context(ctx)
+
 		n = a.rows
+		if a[0, 0] == mpmath.mp.zero:
+			raise ValueError('Cannot create a dTFmp object: a[0] cannot be zero')
 		if a[0, 0] != mpmath.mp.one:
-			for i in range(0, n):
-				# division cannot be performed exactly but we do it with doubled precision
-				a[i, 0] = mpmath.fdiv(a[i, 0], a[0, 0], prec=a[i, 0]._mpf_[3] * 2)
-				b[i, 0] = mpmath.fdiv(b[i, 0], b[0, 0], prec=b[i, 0]._mpf_[3] * 2)
+			# division cannot be performed exactly but we do it with doubled precision (or in the context ctx)
+			# (the global precision mpmath.mp.prec is not used)
+			a0 = a[0, 0]
+			a = a.copy()
+			b = b.copy()
+			for X in (a, b):
+				for i in range(0, X.rows):
+					prec = ctx.prec if ctx is not None else 2 * max(X[i, 0]._mpf_[3], a0._mpf_[3], 53)
+					X[i, 0] = mpmath.mp.make_mpf(mpf_div(X[i, 0]._mpf_, a0._mpf_, prec, 'n'))
 
 		self._order = n - 1
 		self._num = b
@@ -124,7 +137,8 @@ class dTFmp(object):
 		N = self.order + 1
 
 		A = mpmath.mp.zeros(N - 1, N - 1)
-		A[0, :] = -self.den.transpose()[0, 1:N]
+		for i in range(0, N - 1):
+			A[0, i] = mpmath.fneg(self.den[i + 1, 0], exact=True)
 		for i in range(1, N - 1):
 			A[i, i - 1] = mpmath.mp.one
 		B = mpmath.mp.zeros(N - 1, 1)
@@ -18,13 +18,13 @@ __status__ = "Beta"
 
 import pytest
 import mpmath
-from numpy import array, zeros, absolute, eye, all
+from numpy import array, zeros, absolute, eye, all, diag, isfinite
 from numpy import matrix as mat
 from numpy.linalg import eigvals, norm
 from numpy.testing import assert_allclose
 from numpy.random import randint
 
-from fixif.LTI import dSS, iter_random_dSS
+from fixif.LTI import dSS, iter_random_dSS, compute_gramians, WCPGCache, random_Filter
 
 
 # FIXME: move this test somewhere else...
@@ -107,11 +107,13 @@ def test_random_dSS(S):
 @pytest.mark.parametrize("S", iter_random_dSS(20, stable=True, n=(2, 40), p=(2, 15), q=(2, 15)))
 def test_Gramians(S):
 	"""
-	Test calculation of :math:`W_o` and :math:`W_c` with the two different methods (``linalg`` from scipy and ``slycot``from Slycot)
+	Test calculation of :math:`W_o` and :math:`W_c` with the three different methods (``linalg`` from scipy, ``slycot``from Slycot
+	and ``schur``)
 	"""
 
 	relative_tolerance_linalg = 1e-3
 	relative_tolerance_slycot = 1e-5
+	relative_tolerance_schur = 1e-6
 
 
 	# test with 'linalg' method
@@ -128,6 +130,14 @@ def test_Gramians(S):
 	assert_allclose(array(S.A * S.Wc * S.A.transpose() + S.B * S.B.transpose()), array(S.Wc), rtol=relative_tolerance_slycot)
 	assert_allclose(array(S.A.transpose() * S.Wo * S.A + S.C.transpose() * S.C), array(S.Wo), rtol=relative_tolerance_slycot)
 
+	S._Wo = None
+	S._Wc = None
+
+	# test for 'schur' method (Bartels-Stewart)
+	dSS._W_method = 'schur'
+	assert_allclose(array(S.A * S.Wc * S.A.transpose() + S.B * S.B.transpose()), array(S.Wc), rtol=relative_tolerance_schur)
+	assert_allclose(array(S.A.transpose() * S.Wo * S.A + S.C.transpose() * S.C), array(S.Wo), rtol=relative_tolerance_schur)
+
 	# test with non-existing method
 	dSS._W_method = 'toto'
 	S._Wc = None
@@ -140,6 +150,32 @@ def test_Gramians(S):
 	dSS._W_method = 'slycot'
 
 
+def test_compute_gramians():
+	# some systems with the same sizes
+	systems = [dSS(S.A, S.B, S.C, S.D) for S in iter_random_dSS(20, True, (3, 6), (1, 3), (1, 3))]
+	systems.extend(dSS(S.A, S.B, S.C, S.D) for S in iter_random_dSS(5, True, (3, 4), (2, 3), (2, 3)))
+
+	res = compute_gramians(systems)
+
+	for S, (Wo, Wc) in zip(systems, res):
+		assert S._Wo is Wo and S._Wc is Wc
+		Wo_ref = S.spectral.solve_stein(S.C.transpose() * S.C, transpose=True)
+		Wc_ref = S.spectral.solve_stein(S.B * S.B.transpose())
+		assert_allclose(array(Wo), Wo_ref, rtol=1e-6, atol=1e-10)
+		assert_allclose(array(Wc), Wc_ref, rtol=1e-6, atol=1e-10)
+
+	# with a process pool (and several chunks)
+	systems2 = [dSS(S.A, S.B, S.C, S.D) for S in systems]
+	res2 = compute_gramians(systems2, processes=2, chunksize=4)
+	for (Wo, Wc), (Wo2, Wc2) in zip(res, res2):
+		assert_allclose(Wo, Wo2)
+		assert_allclose(Wc, Wc2)
+
+	# unstable systems
+	with pytest.raises(ValueError):
+		compute_gramians([S for S in iter_random_dSS(2, False, (3, 5), (1, 2), (1, 2))])
+
+
 @pytest.mark.parametrize("S", iter_random_dSS(1, True, (5, 10), (1, 5), (1, 5), pBCmask=0.1))
 def test_wcpgMP(S):
 
@@ -179,6 +215,74 @@ def test_wcpg(S):
 	assert norm(array(W) - array(wcpg)) < 1e-2
 
 
+@pytest.mark.parametrize("S", iter_random_dSS(20, True, (5, 15), (1, 5), (1, 5)))
+def test_wcpg_estimate(S):
+	"""
+	Test the numpy WCPG estimate (and its error estimate)
+	"""
+	W, errest = S.WCPG_estimate(eps=1e-12)
+	wcpg = calc_wcpg_approx(S, 20000)
+	assert all(absolute(array(W) - array(wcpg)) <= array(errest) + 1e-9 * array(wcpg))
+
+	# the WCPG is not defined for unstable systems
+	with pytest.raises(ValueError):
+		dSS(S.A * 2 / max(absolute(eigvals(S.A))), S.B, S.C, S.D).WCPG_estimate()
+
+
+def test_wcpg_without_library(monkeypatch):
+	from sys import modules
+	monkeypatch.delattr(modules['fixif.LTI.dSS'], 'WCPG_ABCD', raising=False)
+	S = next(iter_random_dSS(1, True, (5, 10), (1, 2), (1, 2)))
+	with pytest.raises(ImportError):
+		S.WCPG()
+
+
+def test_wcpg_cache(tmpdir, monkeypatch):
+	"""
+	Test the persistent WCPG cache
+	"""
+	from sys import modules
+	dSSmodule = modules['fixif.LTI.dSS']		# (fixif.LTI.dSS is the class, not the module)
+	calls = []
+	WCPG_ABCD = dSSmodule.WCPG_ABCD
+
+	def counted_WCPG_ABCD(*args):
+		calls.append(args)
+		return WCPG_ABCD(*args)
+	monkeypatch.setattr(dSSmodule, 'WCPG_ABCD', counted_WCPG_ABCD)
+
+	cache = WCPGCache(str(tmpdir), max_size=2**20)
+	monkeypatch.setattr(dSS, '_WCPG_cache', cache)
+
+	systems = list(iter_random_dSS(5, True, (5, 10), (1, 3), (1, 3)))
+	W = [S.WCPG() for S in systems]
+	assert len(calls) == 5
+	assert len(cache) == 5
+
+	# same matrices (new objects) -> results taken from the cache
+	W2 = [dSS(S.A, S.B, S.C, S.D).WCPG() for S in systems]
+	assert len(calls) == 5
+	for w, w2 in zip(W, W2):
+		assert_allclose(w, w2, rtol=0)
+		assert isinstance(w2, mat)
+
+	# different precision/method -> different key
+	S = systems[0]
+	assert cache.key(S.A, S.B, S.C, S.D, 1) != cache.key(S.A, S.B, S.C, S.D, 2)
+
+	# (the result is a matrix, with or without the cache)
+	monkeypatch.setattr(dSS, '_WCPG_cache', None)
+	assert isinstance(dSS(S.A, S.B, S.C, S.D).WCPG(), mat)
+
+	# LRU eviction
+	small_cache = WCPGCache(str(tmpdir.mkdir('small')), max_size=600)
+	for i in range(10):
+		small_cache.put('%d' % i, eye(3))
+	assert 0 < len(small_cache) < 10
+	assert small_cache.get('9') is not None
+	assert small_cache.get('0') is None
+
+
 @pytest.mark.parametrize("S", iter_random_dSS(50, True, (5, 10), (1, 5), (1, 5)))
 def test_subsystems(S):
 
@@ -216,6 +320,23 @@ def test_to_dTF(S):
 		S.assert_close(SS, 1e-4)
 
 
+@pytest.mark.parametrize("S", iter_random_dSS(20, True, (5, 20), (1, 2), (1, 2)))
+def test_spectral(S):
+	sd = S.spectral
+	T, U = sd.schur
+	assert_allclose(U.dot(T).dot(U.T), S.A, atol=1e-10)
+	lam, X = sd.eig
+	assert_allclose(array(S.A).dot(X), X.dot(diag(lam)), atol=1e-10)
+	assert_allclose(sorted(absolute(lam)), sorted(absolute(eigvals(S.A))), atol=1e-10)
+	# shared by the dSS with the same A, but not after a similarity
+	S2 = dSS(S.A, S.B, S.C, S.D)
+	assert S2.spectral is sd
+	T = eye(S.n)
+	T[0, 1:] = 1
+	S2.similarity(mat(T))
+	assert S2.spectral is not sd
+
+
 @pytest.mark.parametrize("S", iter_random_dSS(5, stable=True, n=(1, 15), p=(1, 5), q=(1, 5)))
 def test_balanced(S):
 	try:
@@ -237,3 +358,21 @@ def test_balanced(S):
 # addition
 # multiplication
 # TODO: filter `RandomFilter-12/1/1-833056621` cannot be converted in rhoDFIIt without NaN... to be investigated
+
+
+def test_gramians_ill_conditioned():
+	"""
+	Check the Gramians of a system with ill-conditioned eigenvectors (the equivalent state-space of the rho-DFII
+	realization of a 15th-order filter, the condition number of the eigenvectors of A is about 1e14)
+	"""
+	from fixif.Structures import rhoDFII
+	F = random_Filter(15, 1, 1, seed=5)
+	S = rhoDFII.makeRealization(F, equiv_dSS=True).dSS
+
+	# the result of the Bartels-Stewart algorithm is not positive semi-definite, so it is rejected
+	assert S._stein_schur_checked(S.B * S.B.transpose()) is None
+	assert all(diag(S.Wc) > 0)
+
+	# so the l2-scaling of the rho-DFII (that uses the square roots of the diagonal of Wc) can be done
+	R = rhoDFII.makeRealization(F, scaling='l2-relaxed')
+	assert all(isfinite(R.Z))
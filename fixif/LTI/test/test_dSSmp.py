@@ -11,6 +11,7 @@ __status__ = "Beta"
 import pytest
 import numpy
 import mpmath
+from concurrent.futures import ThreadPoolExecutor
 # from numpy.testing import assert_allclose
 # from fixif.func_aux import *
 
@@ -74,12 +75,102 @@ def test_to_dSS(S):
 	my_assertAlmostEqual_matrix(S.D, Sdd.D)
 
 
-# @pytest.mark.parametrize("S", iter_random_dSSmp(1, False, n=(3, 4), p=(1, 2), q=(3, 4)))
-# def test_simulate( S ):
-# 	u = numpy.matrix([[-1, -1, -1], [1, 1, 1], [-1, 1, -1], [1, -1, 1]])
-# 	y = S.simulate(u.transpose(), exact=False)
-#
-# 	Sd = S.to_dSS()
+def exact_sop(X, Y, x, y):
+	"""Compute exactly X*x + Y*y, element by element with mpmath"""
+	r = mpmath.zeros(X.rows, 1)
+	for i in range(X.rows):
+		for k in range(X.cols):
+			r[i] = mpmath.fadd(r[i], mpmath.fmul(X[i, k], x[k], exact=True), exact=True)
+		for k in range(Y.cols):
+			r[i] = mpmath.fadd(r[i], mpmath.fmul(Y[i, k], y[k], exact=True), exact=True)
+	return r
+
+
+def simulate_mpmath(S, u, prec=None):
+	"""Reference simulation with mpmath (states and outputs rounded to nearest with prec bits if prec is given)"""
+	xk = mpmath.zeros(S.n, 1)
+	y = mpmath.zeros(S.p, u.cols)
+	for k in range(u.cols):
+		yk = exact_sop(S.C, S.D, xk, u[:, k])
+		xk = exact_sop(S.A, S.B, xk, u[:, k])
+		if prec:
+			yk = yk.apply(lambda x: mpmath.fadd(x, 0, prec=prec, rounding='n'))
+			xk = xk.apply(lambda x: mpmath.fadd(x, 0, prec=prec, rounding='n'))
+		y[:, k] = yk
+	return y
+
+
+@pytest.mark.parametrize("S", iter_random_dSSmp(10, True, n=(2, 6), p=(1, 3), q=(1, 3)))
+def test_simulate(S):
+	u = numpy.matrix(numpy.random.rand(S.q, 15))
+	ump = mpmath.matrix(u)
+
+	# exact simulation
+	y = S.simulate(u)
+	my_assertEqual_matrix(y, simulate_mpmath(S, ump))
+
+	# rounded simulation
+	yr = S.simulate_rounded(u, prec=53)
+	my_assertEqual_matrix(yr, simulate_mpmath(S, ump, prec=53))
+
+	# and the rounded simulation is close to the floating-point one
+	y_float = S.to_dSS().simulate(u)
+	assert numpy.allclose(numpy.matrix(yr.tolist(), dtype=float), y_float, rtol=1e-10, atol=1e-12)
+
+	# states rounded to 20 bits
+	y20 = S.simulate(u, exact=False, prec=20)
+	assert y20.rows == S.p and y20.cols == 15
+
+	with pytest.raises(ValueError):
+		S.simulate(numpy.matrix(numpy.random.rand(S.q + 1, 15)))
+	with pytest.raises(ValueError):
+		S.simulate(u, x0=numpy.matrix(numpy.ones((S.n + 1, 1))))
+
+@pytest.mark.parametrize("S", iter_random_dSSmp(10, True, n=(2, 12), p=(1, 2), q=(1, 2)))
+def test_to_dTFmp(S):
+	oldprec = mpmath.mp.prec
+	H = S.to_dTFmp(prec=100)
+	# the global precision is not modified
+	assert mpmath.mp.prec == oldprec
+
+	# compare to the transfer function computed in double
+	tf = S.to_dSS().to_dTF()
+	assert numpy.allclose(numpy.array(H.num.tolist(), dtype=float).ravel(), numpy.ravel(tf.num), rtol=1e-8, atol=1e-10)
+	assert numpy.allclose(numpy.array(H.den.tolist(), dtype=float).ravel(), numpy.ravel(tf.den), rtol=1e-8, atol=1e-10)
+
+	# exact method and Hessenberg method
+	old = dSSmp._dTFmp_exact_order
+	dSSmp._dTFmp_exact_order = 0
+	try:
+		H2 = S.to_dTFmp(prec=100)
+	finally:
+		dSSmp._dTFmp_exact_order = old
+	assert mpmath.mp.prec == oldprec
+	scale = max(mpmath.norm(H.num), mpmath.norm(H.den))
+	my_assertAlmostEqual_matrix(H.num, H2.num, abs_eps=scale * 2**-96)
+	my_assertAlmostEqual_matrix(H.den, H2.den, abs_eps=scale * 2**-96)
+
+	with pytest.raises(ValueError):
+		dSSmp(S.A, mpmath.ones(S.n, 2), mpmath.ones(1, S.n), mpmath.zeros(1, 2)).to_dTFmp()
+
+
+def test_threads():
+	# the conversions (exact or with a local mpmath context) can run concurrently, and do not depend on the global precision
+	systems = list(iter_random_dSSmp(8, True, n=(3, 10), p=(1, 2), q=(1, 2)))
+	systems = [dSSmp(S.A, S.B[:, 0], S.C[0, :], S.D[0, 0:1]) for S in systems]
+	old = dSSmp._dTFmp_exact_order
+	dSSmp._dTFmp_exact_order = 5
+	try:
+		ref = [S.to_dTFmp(prec=80) for S in systems]
+		with mpmath.workprec(20):
+			with ThreadPoolExecutor(4) as executor:
+				res = list(executor.map(lambda S: S.to_dTFmp(prec=80), systems))
+	finally:
+		dSSmp._dTFmp_exact_order = old
+	for H1, H2 in zip(ref, res):
+		my_assertEqual_matrix(H1.num, H2.num)
+		my_assertEqual_matrix(H1.den, H2.den)
+
 
 @pytest.mark.parametrize("S", iter_random_dSS(25, True, (5, 10), (1, 2), (1, 2), pBCmask=0.1))
 def test_WCPGmp(S):
@@ -11,7 +11,7 @@ __status__ = "Beta"
 
 import mpmath
 import pytest
-from fixif.LTI import iter_random_dTFmp, dTF
+from fixif.LTI import iter_random_dTFmp, dTF, dTFmp
 
 
 def my_assertEqual_matrix(A, B):
@@ -63,3 +63,29 @@ def test_to_dSSmp(H):
 
 
 
+
+
+def test_normalization():
+	b = mpmath.matrix([3, 1, 2])
+	a = mpmath.matrix([2, 1, 4])
+	H = dTFmp(b, a)
+	my_assertEqual_matrix(H.den, mpmath.matrix([1, 0.5, 2]))
+	my_assertEqual_matrix(H.num, mpmath.matrix([1.5, 0.5, 1]))
+	# the inputs are not modified
+	assert a[0] == 2 and b[0] == 3
+
+	# with a given context, the result does not depend on the global precision
+	ctx = mpmath.MPContext()
+	ctx.prec = 200
+	a = mpmath.matrix([3, 1, 2])
+	H1 = dTFmp(b, a, ctx=ctx)
+	with mpmath.workprec(10):
+		H2 = dTFmp(b, a, ctx=ctx)
+	my_assertEqual_matrix(H1.den, H2.den)
+	assert abs(ctx.mpf(H1.den[1]) * 3 - 1) < ctx.ldexp(1, -190)
+	assert abs(ctx.mpf(H1.den[2]) * 3 - 2) < ctx.ldexp(1, -190)
+
+	with pytest.raises(ValueError):
+		dTFmp(b, mpmath.matrix([0, 1, 2]))
+	with pytest.raises(ValueError):
+		dTFmp(b, a, ctx=200)
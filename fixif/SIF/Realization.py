@@ -42,7 +42,7 @@ class Realization(SIF, R_algorithm, R_FxP, R_implementation):
 	http://www.qtrac.eu/pyclassmulti.html
 	"""
 
-	def __init__(self, filt, JtoS, dJtodS=None, structureName="", shortName="", surnameVarT=None, surnameVarX=None):
+	def __init__(self, filt, JtoS, dJtodS=None, structureName="", shortName="", surnameVarT=None, surnameVarX=None, sparse=False):
 		"""
 		the Realization object is built from the matrices J, K, L, M, N, P, Q, R and S, and a filter
 		Parameters
@@ -55,6 +55,7 @@ class Realization(SIF, R_algorithm, R_FxP, R_implementation):
 		of the variables T and X
 		- filter: the filter implemented by the Realization
 		- strucureName: name of a structure
+		- sparse: if True, Z and dZ are stored as scipy.sparse matrices (see SIF)
 
 		Returns
 		-------
@@ -62,7 +63,7 @@ class Realization(SIF, R_algorithm, R_FxP, R_implementation):
 		"""
 
 		# call the parent class constructor
-		super(Realization, self).__init__(JtoS, dJtodS)
+		super(Realization, self).__init__(JtoS, dJtodS, sparse)
 
 
 		# names (list) of the variables t, x, u and y
@@ -11,9 +11,9 @@ __status__ = "Beta"
 
 
 from os import path
-import mpmath
+import numpy
 from numpy import zeros, ones, matrix, power, ndenumerate, kron, multiply, nditer
-from numpy import floor, log2, ceil, bmat, inf
+from numpy import floor, log2, ceil, bmat, inf, isinf, isfinite, asarray, float64, frexp, ldexp, full, all, any, minimum
 from string import Template
 
 from fixif.config import SIF_TEMPLATES_PATH
@@ -41,6 +41,289 @@ def generateAMPLParam(name, val, format="%f"):
 
 
 
+def _dyadic(x):
+	"""Returns the (integer) mantissa and exponent (M,e) of a double x, such that x = M.2^e exactly"""
+	num, den = float(x).as_integer_ratio()
+	return num, -(den.bit_length() - 1)
+
+
+
+def _MSB_wtilde(zeta_bar):
+	"""
+	Returns the vectors m and w_tilde such that (component-wise)
+		m = ceil(log2(zeta_bar))
+		w_tilde = 1 + m - floor(log2(2^m - zeta_bar))     (+inf if zeta_bar is a power of 2)
+	computed exactly (without logarithms) from the binary representation of the doubles zeta_bar = f.2^e (f in [0.5,1)):
+	- m = e, or e-1 if zeta_bar is a power of 2 (f=0.5)
+	- 2^m - zeta_bar is exactly computed (Sterbenz lemma, since 2^(m-1) <= zeta_bar <= 2^m), and its floor(log2) is
+	given by its exponent
+	zeta_bar should be a vector of positive (finite) doubles
+	"""
+	x = asarray(zeta_bar, dtype=float64).ravel()
+	if not all(isfinite(x)) or any(x <= 0):
+		raise ValueError('The bounds zeta_bar should be positive finite numbers')
+	f, e = frexp(x)
+	m = e - (f == 0.5)
+	d = ldexp(1.0, m) - x
+	wtilde = full(x.shape, inf)
+	nz = d > 0
+	wtilde[nz] = 2 + m[nz] - frexp(d[nz])[1]
+	return m, wtilde
+
+
+
+def _WLcost(w, w_tilde):
+	"""Returns the vector 2^(-w+delta) with delta_j = 1 if w_j < w_tilde_j (and 0 otherwise)"""
+	return numpy.ldexp(1.0, -w + (w < w_tilde))
+
+
+def _surrogateWL(s, target, lo, hi, w_tilde, ub=None):
+	"""
+	Solve exactly the relaxed problem (one constraint, obtained as a non-negative combination of the constraints)
+		minimize sum(w) subject to  sum_j s_j 2^(-w_j+delta_j) <= target  and  lo <= w <= hi
+	Each unit increment of w_j reduces the error by a gain that decreases with w_j (the cost is convex, even with the
+	delta jump), so the optimum is given by the largest gains (greedy algorithm).
+	If an upper bound ub on the optimal cost is given, the bounds lo and hi are also tightened (reduced-cost fixing):
+	forcing t more (or less) increments on w_j gives a lower bound of the cost, and the values of w_j that lead to a
+	lower bound greater or equal to ub can be removed.
+	Returns the optimal w and the tightened bounds (lo, hi), or None if the problem is infeasible
+	"""
+	need = numpy.dot(s, _WLcost(lo, w_tilde)) - target
+	if need <= 0:
+		return lo.copy(), lo, hi
+	L = int((hi - lo).max())
+	W = lo[:, None] + numpy.arange(L)[None, :]
+	gains = s[:, None] * (_WLcost(W, w_tilde[:, None]) - _WLcost(W + 1, w_tilde[:, None]))
+	gains[W >= hi[:, None]] = 0
+	sorted_gains = numpy.sort(gains, axis=None)[::-1]
+	cumgains = numpy.concatenate(([0], numpy.cumsum(sorted_gains)))
+	# the required reduction is slightly reduced, so that the rounding errors do not cut off the optimal solution
+	need *= 1 - 1e-12
+	K = numpy.searchsorted(cumgains, need)
+	if K > (hi - lo).sum():
+		return None
+	# the K largest gains (the gains of each w_j are decreasing, the ties are broken by taking the first ones)
+	theta = sorted_gains[K - 1]
+	k = (gains > theta).sum(axis=1)
+	for j in numpy.flatnonzero((gains == theta).any(axis=1)):
+		r = K - k.sum()
+		if r <= 0:
+			break
+		k[j] += min(r, (gains[j] == theta).sum())
+	w = lo + k
+
+	if ub is None:
+		return w, lo, hi
+
+	# reduced-cost fixing
+	# the best gains obtained with m increments on the other variables than j is lower than
+	# cumgains[m+k_j] - Gj[k_j] (Gj being the cumulated gains of w_j), so forcing a_j increments on w_j
+	# requires M + a_j - k_j increments, with M the smallest such that cumgains[M] >= need - Gj[a_j] + Gj[k_j]
+	G = numpy.concatenate((numpy.zeros((lo.size, 1)), numpy.cumsum(gains, axis=1)), axis=1)
+	Gk = G[numpy.arange(lo.size), k][:, None]
+	a = numpy.arange(L + 1)[None, :]
+	M = numpy.searchsorted(cumgains, (need - G + Gk).ravel()).reshape(G.shape)
+	LB = lo.sum() + numpy.maximum(M, k[:, None]) + a - k[:, None]
+	LB[a > (hi - lo)[:, None]] = ub
+	# above k_j, the bound is for w_j >= lo_j + a (suffix min), below, for w_j <= lo_j + a (prefix min)
+	up = numpy.minimum.accumulate(LB[:, ::-1], axis=1)[:, ::-1]
+	down = numpy.minimum.accumulate(LB, axis=1)
+	ok_up = (up < ub) | (a <= k[:, None])
+	ok_down = (down < ub) | (a >= k[:, None])
+	hi = lo + (ok_up & ok_down).shape[1] - 1 - numpy.argmax((ok_up & ok_down)[:, ::-1], axis=1)
+	lo = lo + numpy.argmax(ok_up & ok_down, axis=1)
+	return w, lo, hi
+
+
+def _repairWL(E, eps, w, lo, hi, w_tilde):
+	"""
+	Heuristic for the word-length problem: from w (that may not satisfy the constraints), increase greedily the
+	word-lengths until all the constraints are satisfied, and then decrease them while they are still satisfied
+	Returns the new w (or None if no feasible solution is found)
+	"""
+	w = w.copy()
+	err = E.dot(_WLcost(w, w_tilde))
+	while any(err > eps):
+		# increase the w_j that reduces the most the (relative) excess of the violated constraints
+		v = err > eps
+		excess = (err - eps)[v][:, None]
+		gains = E[v] * (_WLcost(w, w_tilde) - _WLcost(w + 1, w_tilde))
+		score = (numpy.minimum(gains, excess) / excess).sum(axis=0)
+		score[w >= hi] = -1
+		j = numpy.argmax(score)
+		if score[j] <= 0:
+			return None
+		w[j] += 1
+		err = E.dot(_WLcost(w, w_tilde))
+	# decrease the word-lengths (the least costly first) while the constraints are satisfied
+	slack = eps - err
+	decreased = True
+	while decreased:
+		decreased = False
+		loss = E * (_WLcost(w - 1, w_tilde) - _WLcost(w, w_tilde))
+		for j in numpy.argsort((loss / eps[:, None]).max(axis=0), kind='stable'):
+			if w[j] > lo[j] and all(loss[:, j] <= slack):
+				w[j] -= 1
+				slack -= loss[:, j]
+				decreased = True
+	return w
+
+
+def solveOptimalWL(E, eps, w_tilde, wmin=2, wmax=64, maxnodes=500, niter=10):
+	"""
+	Solve the multiple word-length optimization problem (see ARITH26 article, and the AMPL model w_optimal.mod)
+		minimize sum_j w_j
+		subject to sum_j E_ij 2^(-w_j + delta_j) <= eps_i    for all i
+		with delta_j = 1 if w_j < w_tilde_j (and 0 otherwise) and wmin <= w_j <= wmax
+	with a branch-and-bound algorithm:
+	- the lower bounds are given by surrogate relaxations (non-negative combinations of the constraints) that are solved
+	exactly with a greedy algorithm (the error of each variable is decreasing and convex), the weights of the combination
+	being updated with the violation of the constraints. The relaxations are also used to tighten the bounds on each w_j
+	- the upper bounds (feasible solutions) are given by a greedy heuristic (see _repairWL)
+	- the branching uses the monotonicity: when the relaxed solution w* violates a constraint, any feasible solution has
+	at least one w_j > w*_j (among the variables of that constraint), so the branches are
+	{w_j1 > w*_j1}, {w_j1 <= w*_j1 and w_j2 > w*_j2}, etc.
+	When p=1, the relaxation is the problem itself, and it is solved without branching.
+	When p>1, the number of nodes explored is limited by maxnodes; when this limit is reached, the best solution found so
+	far is returned (it satisfies the constraints, but may not be optimal)
+
+	Parameters:
+		- E: p*N matrix of the (non-negative) error coefficients
+		- eps: vector of p constraints on the output errors
+		- w_tilde: vector of the N thresholds w_tilde (can be +inf)
+		- wmin, wmax: bounds on the word-lengths (int, or vectors of N int)
+		- maxnodes: maximum number of nodes explored
+		- niter: number of updates of the weights of the surrogate relaxation per node
+	Returns: the list of the N optimal word-lengths
+	"""
+	E = numpy.atleast_2d(numpy.asarray(E, dtype=float64))
+	p, N = E.shape
+	eps = numpy.asarray(eps, dtype=float64).ravel()
+	w_tilde = numpy.asarray(w_tilde, dtype=float64).ravel()
+	lo = numpy.asarray(wmin, dtype=int).ravel()
+	hi = numpy.asarray(wmax, dtype=int).ravel()
+	if eps.size != p or w_tilde.size != N or lo.size not in (1, N) or hi.size not in (1, N):
+		raise ValueError('solveOptimalWL: incorrect sizes')
+	lo = lo + numpy.zeros(N, dtype=int)
+	hi = hi + numpy.zeros(N, dtype=int)
+	if any(E < 0) or any(eps <= 0):
+		raise ValueError('solveOptimalWL: E should be non-negative and eps positive')
+	if any(lo > hi):
+		raise ValueError('solveOptimalWL: wmin should be lower than wmax')
+
+	def feasible(w):
+		return all(E.dot(_WLcost(w, w_tilde)) <= eps)
+
+	if not feasible(hi):
+		raise ValueError('solveOptimalWL: the problem is infeasible (wmax is too small)')
+
+	# initial solution
+	best = _repairWL(E, eps, hi, lo, hi, w_tilde)
+	bestcost = best.sum()
+
+	# depth-first branch-and-bound (each node is given by the bounds on w and the weights of the relaxation)
+	stack = [(lo, hi, 1 / eps)]
+	nodes = 0
+	while stack and nodes < maxnodes:
+		lo, hi, lam = stack.pop()
+		nodes += 1
+		LB = lo.sum()
+		wstar = None
+		for it in range(niter if p > 1 else 1):
+			if LB >= bestcost or not feasible(hi):
+				break
+			relax = _surrogateWL(lam.dot(E), lam.dot(eps), lo, hi, w_tilde, bestcost)
+			if relax is None:
+				break
+			w, lo, hi = relax
+			LB = max(LB, w.sum(), lo.sum())
+			if LB >= bestcost:
+				break
+			err = E.dot(_WLcost(w, w_tilde))
+			if all(err <= eps):
+				# w is optimal for this node
+				best, bestcost = w, w.sum()
+				break
+			if wstar is None:
+				# look for a better feasible solution
+				wh = _repairWL(E, eps, w, lo, hi, w_tilde)
+				if wh is not None and wh.sum() < bestcost:
+					best, bestcost = wh, wh.sum()
+			wstar = w
+			# increase the weights of the violated constraints
+			lam = lam * numpy.maximum(err / eps, 0.5)
+			lam /= lam.max()
+		else:
+			# the node is neither solved nor pruned: branching on the most violated constraint of wstar
+			i = numpy.argmax(E.dot(_WLcost(wstar, w_tilde)) / eps)
+			gain = E[i] * (_WLcost(wstar, w_tilde) - _WLcost(wstar + 1, w_tilde))
+			children = []
+			hic = hi.copy()
+			for j in numpy.argsort(-gain, kind='stable'):
+				if gain[j] > 0 and wstar[j] < hi[j]:
+					loc = lo.copy()
+					loc[j] = wstar[j] + 1
+					children.append((loc, hic.copy(), lam))
+					hic[j] = wstar[j]
+			stack.extend(reversed(children))
+
+	return [int(x) for x in best]
+
+
+
+def _uniformWL(E, eps, w_tilde):
+	"""
+	Compute the minimal uniform wordlengths for several constraints eps at once (see R_FxP.optimalUniformWL)
+	Parameters:
+		- E: p*N matrix of the error coefficients
+		- eps: p*K array (each column is a vector of constraints on the outputs)
+		- w_tilde: vector of the N thresholds w_tilde
+	Returns: a vector of K word-lengths
+	"""
+	E = asarray(E, dtype=float64)
+	eps = asarray(eps, dtype=float64).reshape(E.shape[0], -1)
+	w_tilde = asarray(w_tilde, dtype=float64).reshape(-1, 1)
+	# first guess, given by sum_j E_ij 2^-w <= eps_i
+	w = ceil(numpy.max(log2(E.sum(axis=1)).reshape(-1, 1) - log2(eps), axis=0)).astype(int)
+	# check it with delta(w)
+	ok = all(E.dot(ldexp(1.0, -w + (w < w_tilde))) < eps, axis=0)
+	return w + ~ok
+
+
+def sweepWL(filt, eps, u_bar, optimal=True, wmax=64):
+	"""
+	Word-length design-space exploration: compute the uniform (and optimal) word-lengths of all the realizations
+	of a filter, for several constraints on the output error
+	The data of the problems (E, m_tilde and w_tilde, see R_FxP.WLproblem) are computed only once per realization,
+	and the uniform word-lengths are computed for all the constraints at once
+	Parameters:
+		- filt: the filter (Filter object)
+		- eps: list of constraints on the outputs (each one is a vector, or a scalar used for all the outputs)
+		- u_bar: vector of bounds on the inputs of the system
+		- optimal: (boolean) also compute the optimal word-lengths with solveOptimalWL
+		- wmax: maximum value for the word-lengths (for the optimal word-lengths)
+	Returns: a list of dictionaries (one per realization and eps), with keys
+		- 'realization': the realization
+		- 'eps': the vector of constraints
+		- 'uniformWL', 'uniformCost': the uniform word-length, and the sum of the word-lengths
+		- 'WL', 'cost': the optimal word-lengths and its sum (only if optimal is True)
+	"""
+	table = []
+	for R in filt.iterAllRealizations():
+		E, _, w_tilde = R.WLproblem(u_bar)
+		epsR = numpy.column_stack([asarray(e, dtype=float64).ravel() * ones(R.p) for e in eps])
+		wu = _uniformWL(E, epsR, w_tilde)
+		N = R.l + R.n + R.p
+		for k in range(epsR.shape[1]):
+			row = {'realization': R, 'eps': epsR[:, k], 'uniformWL': int(wu[k]), 'uniformCost': int(wu[k]) * N}
+			if optimal:
+				row['WL'] = solveOptimalWL(E, epsR[:, k], w_tilde, wmin=2, wmax=wmax)
+				row['cost'] = sum(row['WL'])
+			table.append(row)
+	return table
+
+
+
 class R_FxP:
 	"""
 	Mixin class (see https://groups.google.com/forum/?hl=en#!topic/comp.lang.python/goLBrqcozNY)
@@ -62,16 +345,14 @@ class R_FxP:
 		WHEN WE DO NOT THE ROUNDOFF ERRORS INTO ACCOUNT
 
 		we just use the equation  m = ceil( log2( <<Hzeta>>. u_bar ) )
+		(computed exactly from the binary representation of the doubles, see _MSB_wtilde)
 		"""
 		# compute the WCPG of Hzeta
 		zeta_bar = self.Hzeta.WCPG(output_info) * u_bar
 
 		# TODO: Do it as it should be done, as in FxPF (see Nastia thesis p113)
-		with mpmath.workprec(500):
-			# and then the log2
-			msb = [int(mpmath.ceil(mpmath.log(x[0], 2))) for x in zeta_bar.tolist()]
-
-		return msb
+		msb, _ = _MSB_wtilde(zeta_bar)
+		return [int(m) for m in msb]
 
 
 	def _w_tilde(self, u_bar):
@@ -82,18 +363,38 @@ class R_FxP:
 		See ARITH26 paper
 		Parameters:
 			- u_bar: vector of bounds on the inputs of the system
-		Returns: a vector of thresholds w_tilde
+		Returns: a vector of thresholds w_tilde (+inf when zeta_bar is a power of 2: the MSB is always computeNaiveMSB+1)
 
 		We use:  w_tilde = 1 + ceil(log2(zeta_bar)) - floor(log2( 2^ceil(log2(zeta_bar)) - zeta_bar ))
 		with zeta_bar = <<Hzeta>>.u_bar
+		(computed exactly from the binary representation of the doubles, see _MSB_wtilde)
 		"""
-		#TODO: test if zeta_bar is a power of 2 (should be +Inf in that case)
 		zeta_bar = self.Hzeta.WCPG() * u_bar
+		_, wtilde = _MSB_wtilde(zeta_bar)
+		return [w if isinf(w) else int(w) for w in wtilde]
 
-		with mpmath.workprec(500):  # TODO: compute how many bit we need !!
-			wtilde = [int(1+mpmath.ceil(mpmath.log(x[0], 2)) - mpmath.floor(mpmath.log(mpmath.power(2, mpmath.ceil(mpmath.log(x[0], 2))) - x[0], 2))) for x in zeta_bar.tolist()]
 
-		return wtilde
+	def WLproblem(self, u_bar):
+		"""
+		Compute the data of the word-length problems (see ARITH26 article), that only depend on the realization and
+		the bounds on the inputs:
+			- E: p x (l+n+p) matrix of the error coefficients, E_ij = <<Hepsilon>>_ij 2^m_tilde_j
+			- m_tilde: the naive MSB (see computeNaiveMSB)
+			- w_tilde: the thresholds on the word-lengths (see _w_tilde)
+		so that the output errors are bounded by E * 2^(-w + delta(w)), with delta_j(w) = 1 if w_j < w_tilde_j
+		Parameters:
+			- u_bar: vector of bounds on the inputs of the system
+		Returns: the tuple (E, m_tilde, w_tilde), E as a numpy matrix, m_tilde and w_tilde as column matrices
+		"""
+		zeta_bar = self.Hzeta.WCPG() * u_bar
+		m_tilde, w_tilde = _MSB_wtilde(zeta_bar)
+		m_tilde = matrix(m_tilde).transpose()
+		w_tilde = matrix(w_tilde).transpose()
+
+		# error
+		Weps = self.Hepsilon.WCPG()
+		E = multiply(Weps, kron(ones((self.p, 1)), power(2.0, m_tilde.transpose())))
+		return E, m_tilde, w_tilde
 
 
 	def optimalUniformWL(self, u_bar, eps):
@@ -106,79 +407,52 @@ class R_FxP:
 		Returns: (integer) the wordlength that, when used for the intermediate variables, the states and the oututs,
 		satisfies the output error constraints
 		"""
+		E, _, w_tilde = self.WLproblem(u_bar)
+		return int(_uniformWL(E, eps, w_tilde)[0])
 
-		def delta(w):
-			"""function that compute delta(w), a vector of 0 or 1"""
-			d = zeros(w.shape)
-			for i in range(w.size):
-				d[i] = 1 if w[i] < w_tilde[i] else 0
-			return d
-
-		# determining the MSB and w_tilde
-		m_tilde = matrix(self._computeNaiveMSB(u_bar)).transpose()
-		w_tilde = matrix(self._w_tilde(u_bar)).transpose()
-
-		# error
-		Weps = self.Hepsilon.WCPG()
-		E = multiply(Weps, kron(ones((self.p, 1)), power(2, m_tilde.transpose())))
 
-		# determining the minimal word-length with uniform scheme
-		w_guess = int(max(ceil(log2(E * ones((self.l + self.n + self.p, 1))) - log2(eps)))[0, 0])
-		return w_guess if all(E * power(2, -w_guess + delta(w_guess * ones((self.l + self.n + self.p, 1)))) < eps) else w_guess + 1
-
-
-	def optimalWL(self, u_bar, eps, AMPLfilename='xmpl.dat', AMPLpath='.', wmax=64):
+	def optimalWL(self, u_bar, eps, AMPLfilename=None, AMPLpath='.', wmax=64):
 		""" see ARITH26 article
 		Compute the minimal wordlength such that the output error is less than eps (component-wise)
 		when the SoPC are done with KCM
-		-> define the optimal problem
-		-> generate the AMPL solver
-		#TODO: run the solver, and get back the result
+		-> define the optimal problem (the w_optimal.mod AMPL model)
+		-> solve it with the built-in branch-and-bound solver (see solveOptimalWL)
+		-> generate the AMPL data file (if a filename is given), to be used with an external AMPL solver
 
 		Parameters:
 			- u_bar: vector of bounds on the inputs of the system
 			- eps: vector of constraints on the output (each output must be less than the associate eps)
-			- AMPLfilename: (string) name of the AMPL file generated
+			- AMPLfilename: (string) name of the AMPL file generated (None to not generate it)
 			- path: (string) path where to store the AMPL file
 			- wmax: int maximum value for the word-length
 
-		#TODO: Returns: (integer) the wordlength that, when used for the intermediate variables, the states and the oututs,
-		satisfies the output error constraints
-		Returns: (inter) sub-optimal solution (but easy to get; works well when p=1)
+		Returns: (list of integers) the optimal wordlengths of the intermediate variables, the states and the outputs,
+		that satisfy the output error constraints
 		"""
 		# make wmax a vector
 		wmax = wmax * ones((self.l + self.n + self.p, 1))
 
-		# determining the MSB
-		m_tilde = matrix(self._computeNaiveMSB(u_bar)).transpose()
-		w_tilde = matrix(self._w_tilde(u_bar)).transpose()
+		# error coefficients and thresholds
+		E, _, w_tilde = self.WLproblem(u_bar)
 
-		# error
-		Weps = self.Hepsilon.WCPG()
-		E = multiply(Weps, kron(ones((self.p, 1)), power(2, m_tilde.transpose())))
-
-		# generate the .dat file
-		AMPLcode = {
-			'def_p': generateAMPLParam('p', self.p),
-			'def_np': generateAMPLParam('np', self.p + self.n + self.l),
-			'def_u': generateAMPLParam('u', wmax, "%d"),
-			'def_E': generateAMPLParam('E', E),
-			'def_eps': generateAMPLParam('eps', eps),
-			'def_wtilde': generateAMPLParam('wtilde', w_tilde, "%d")}
-
-		# generate the xmpl.dat file
-		with open(SIF_TEMPLATES_PATH + "xmpl.dat.template") as f:
-			AMPL = Template(f.read())
-		with open(path.join(AMPLpath, AMPLfilename), 'w') as f:
-			f.write(AMPL.substitute(AMPLcode))
-
-		if self.p == 1:
-			return [ int(ceil(log2(Ei*(self.n+self.p+self.l)) - log2(eps[0,0]))) for Ei in nditer(E) ]
-		else:
-			weq=[]
-			for j in range(self.l+self.n+self.p):
-				weq.append( int(max(ceil(log2(E[i,j]*(self.n+self.p+self.l)) - log2(eps[i,0])) for i in range(self.p)) ))
-			return weq
+		if AMPLfilename:
+			# generate the .dat file
+			AMPLcode = {
+				'def_p': generateAMPLParam('p', self.p),
+				'def_np': generateAMPLParam('np', self.p + self.n + self.l),
+				'def_u': generateAMPLParam('u', wmax, "%d"),
+				'def_E': generateAMPLParam('E', E),
+				'def_eps': generateAMPLParam('eps', eps),
+				'def_wtilde': generateAMPLParam('wtilde', minimum(w_tilde, wmax + 1), "%d")}	# w_tilde=+inf is equivalent to wmax+1
+
+			# generate the xmpl.dat file
+			with open(SIF_TEMPLATES_PATH + "xmpl.dat.template") as f:
+				AMPL = Template(f.read())
+			with open(path.join(AMPLpath, AMPLfilename), 'w') as f:
+				f.write(AMPL.substitute(AMPLcode))
+
+		# solve the problem (with the default lower bound l=2 of the w_optimal.mod model)
+		return solveOptimalWL(E, eps, w_tilde, wmin=2, wmax=wmax)
 
 
 
@@ -218,3 +492,119 @@ class R_FxP:
 		lsb = bmat(l_y_out - g - 1)
 
 		return lsb, error_budget_y
+
+
+
+	def simulateFxP(self, u, MSB=None, LSB=None, u_LSB=0, rounding='nearest', overflow='wrap', x0=None, integer=False):
+		"""
+		Bit-accurate fixed-point simulation of the realization
+		Each Sum-of-Products (row of Zcomp) is computed exactly with integers (the coefficients are exactly represented
+		as dyadic numbers M.2^e), and then rounded to the LSB of the variable it computes (and its overflow is
+		treated according to its MSB):
+			t_i(k+1), x_i(k+1) and y_i(k) = round( sum_j Zcomp[i,j] v_j ),  with v = (t(k+1), x(k), u(k))
+		The variables are stored as integers T (the value is T.2^LSB), in int64 numpy arrays when the words are small
+		enough (no intermediate result exceeds 62 bits), and as arrays of Python integers otherwise.
+		The computation is vectorized over the input sequences (and over the rows of x and y).
+		J should be unit lower triangular (the intermediate variables are computed one after the other).
+
+		Parameters:
+			- u: the inputs, a q*N matrix or a (batch, q, N) array (their values are rounded to the nearest multiple of 2^u_LSB)
+			- MSB, LSB: vectors of the MSB and LSB of the intermediate variables t, the states x and the outputs y
+			(l+n+p elements); if None, the MSB/LSB of the realization are used
+			- u_LSB: LSB of the inputs (int, or vector of q ints)
+			- rounding: 'nearest' (round to nearest, ties up) or 'truncate' (round toward -infinity)
+			- overflow: 'wrap' (2's complement wrap-around) or 'saturate'
+			- x0: initial state (n-vector or (batch, n) array), zero by default (it is rounded with the LSB of the states)
+			- integer: if True, returns the integer outputs Y (y = Y.2^LSB_y), instead of their values (as doubles)
+		Returns:
+			- y: the outputs, a p*N matrix (or a (batch, p, N) array)
+		"""
+		l, n, p, q = self.l, self.n, self.p, self.q
+		if not self._Jsolver._unit:
+			raise ValueError("simulateFxP: J should be lower triangular with 1s on its diagonal")
+		nrows = l + n + p
+		MSB = self._MSB if MSB is None else MSB
+		LSB = self._LSB if LSB is None else LSB
+		if MSB is None or LSB is None:
+			raise ValueError("simulateFxP: the MSB and LSB of the variables should be given")
+		MSB = [int(m) for m in numpy.ravel(MSB)]
+		LSB = [int(m) for m in numpy.ravel(LSB)]
+		if len(MSB) != nrows or len(LSB) != nrows:
+			raise ValueError("simulateFxP: MSB and LSB should have %d elements" % nrows)
+		wl = [m - lsb + 1 for m, lsb in zip(MSB, LSB)]
+		if min(wl) < 1:
+			raise ValueError("simulateFxP: the MSB should be greater than or equal to the LSB")
+		if rounding not in ('nearest', 'truncate'):
+			raise ValueError("simulateFxP: unknown rounding mode (%s)" % rounding)
+		if overflow not in ('wrap', 'saturate'):
+			raise ValueError("simulateFxP: unknown overflow mode (%s)" % overflow)
+
+		# inputs (as integers)
+		single = (numpy.ndim(u) == 2)
+		U = numpy.asarray(u, dtype=numpy.float64)
+		if single:
+			U = U[None, :, :]
+		if U.ndim != 3 or U.shape[1] != q:
+			raise ValueError("simulateFxP: u should be a %d*N matrix or a (batch, %d, N) array" % (q, q))
+		batch, _, N = U.shape
+		u_LSB = [int(x) for x in numpy.ravel(u_LSB)] * (q if numpy.size(u_LSB) == 1 else 1)
+		Uint = numpy.rint(U * numpy.power(2.0, -numpy.array(u_LSB, dtype=float))[None, :, None])
+		Umax = int(numpy.max(numpy.abs(Uint))) if Uint.size else 0
+
+		# LSB and (bound on the) magnitude of the columns v = (t(k+1), x(k), u(k))
+		colLSB = LSB[:l] + LSB[l:l + n] + u_LSB
+		colMax = [2**(w - 1) for w in wl[:l + n]] + [Umax] * q
+
+		# integer coefficients K[i,j] such that the SoP i is sum_j K[i,j] V_j, with a result with LSB accLSB[i]
+		Zcomp = self.Zcomp.toarray() if self.isSparse() else numpy.asarray(self.Zcomp)
+		dyadic = [[_dyadic(Zcomp[i, j]) for j in range(l + n + q)] for i in range(nrows)]
+		accLSB = []
+		K = []
+		for i in range(nrows):
+			e = min([LSB[i]] + [dyadic[i][j][1] + colLSB[j] for j in range(l + n + q) if dyadic[i][j][0] != 0])
+			accLSB.append(e)
+			K.append([dyadic[i][j][0] * 2**(dyadic[i][j][1] + colLSB[j] - e) if dyadic[i][j][0] != 0 else 0 for j in range(l + n + q)])
+		shift = [LSB[i] - accLSB[i] for i in range(nrows)]
+
+		# choose int64 or Python integers, from a bound on the accumulators (and the rounding)
+		bound = max([sum(abs(K[i][j]) * colMax[j] for j in range(l + n + q)) + 2**shift[i] for i in range(nrows)] + colMax + [2**w for w in wl])
+		dtype = numpy.int64 if bound.bit_length() <= 62 else object
+		K = numpy.array(K, dtype=dtype)
+		Uint = Uint.astype(numpy.int64).astype(dtype) if dtype is not object else numpy.vectorize(int, otypes=[object])(Uint)
+
+		shift = numpy.array(shift, dtype=dtype)
+		half = numpy.array([2**(w - 1) for w in wl], dtype=dtype)
+		roundoff = numpy.array([2**(s - 1) if (s > 0 and rounding == 'nearest') else 0 for s in shift], dtype=dtype)
+
+		def quantize(acc, rows):
+			"""round the accumulators acc (rows x batch) to the LSB of the variables, and treat the overflows"""
+			T = (acc + roundoff[rows, None]) >> shift[rows, None]
+			if overflow == 'wrap':
+				return (T + half[rows, None]) % (2 * half[rows, None]) - half[rows, None]
+			else:
+				return numpy.minimum(numpy.maximum(T, -half[rows, None]), half[rows, None] - 1)
+
+		# state (x0 rounded to the LSB of the states)
+		V = zeros((l + n + q, batch), dtype=dtype)
+		if x0 is not None:
+			X0 = numpy.broadcast_to(numpy.asarray(x0, dtype=numpy.float64).reshape(-1, n), (batch, n)).T
+			X0 = numpy.rint(X0 * numpy.power(2.0, -numpy.array(LSB[l:l + n], dtype=float))[:, None])
+			V[l:l + n, :] = X0.astype(numpy.int64).astype(dtype) if dtype is not object else numpy.vectorize(int, otypes=[object])(X0)
+
+		Y = zeros((batch, p, N), dtype=dtype)
+		rows_t = [numpy.array([i]) for i in range(l)]
+		rows_xy = numpy.arange(l, nrows)
+		for k in range(N):
+			V[l + n:, :] = Uint[:, :, k].T
+			# intermediate variables t(k+1) (sequentially, J is lower triangular)
+			for i in range(l):
+				V[i, :] = quantize(K[i:i + 1, :].dot(V), rows_t[i])[0]
+			# states x(k+1) and outputs y(k)
+			XY = quantize(K[l:, :].dot(V), rows_xy)
+			Y[:, :, k] = XY[n:, :].T
+			V[l:l + n, :] = XY[:n, :]
+
+		if not integer:
+			Y = Y.astype(numpy.float64) * numpy.power(2.0, numpy.array(LSB[l + n:], dtype=float))[None, :, None]
+			return matrix(Y[0]) if single else Y
+		return Y[0] if single else Y
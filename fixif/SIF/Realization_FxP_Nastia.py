@@ -12,7 +12,8 @@ __status__ = "Beta"
 
 import numpy as np
 from fixif.SIF import SIF
-from mpmath import ceil, floor, log, workprec, power
+from mpmath import ceil, log
+from fixif.SIF.Realization_FxP import _MSB_wtilde
 
 
 
@@ -98,24 +99,22 @@ class R_FxP_Nastia:
 		# compute the WCPG of Hzeta
 		zeta_bar = self.Hzeta.WCPG(output_info) * u_bar
 
-		with workprec(500):  # TODO: use right precision !! Or do it as it should be done, as in FxPF (see Nastia thesis p113)
-			# and then the log2
-			msb = [int(ceil(log(x[0], 2))) for x in zeta_bar.tolist()]
-
-		return msb
+		# TODO: Do it as it should be done, as in FxPF (see Nastia thesis p113)
+		# the log2 is computed exactly from the binary representation of zeta_bar
+		msb, _ = _MSB_wtilde(zeta_bar)
+		return [int(m) for m in msb]
 
 	def w_tilde(self, u_bar):
 		"""compute w_tilde, the threshold for the word-length w such that
 		MSB = computeNaiveMSB    if w >= w_tilde
 		MSB = computeNaiveMSB+1  if w < w_tilde
-		(this doesn't count into account the roundoff error, as in FxPF"""
+		(this doesn't count into account the roundoff error, as in FxPF
+		w_tilde is +inf when zeta_bar is a power of 2"""
 
 		zeta_bar = self.Hzeta.WCPG() * u_bar
 
-		with workprec(500):  # TODO: compute how many bit we need !!
-			wtilde = [int(1+ceil(log(x[0], 2)) - floor(log(power(2, ceil(log(x[0], 2))) - x[0], 2))) for x in zeta_bar.tolist()]
-
-		return wtilde
+		_, wtilde = _MSB_wtilde(zeta_bar)
+		return [w if np.isinf(w) else int(w) for w in wtilde]
 
 
 	def compute_MSB_allvar_extended(self, u_bar, lsb_t, lsb_x, lsb_y):
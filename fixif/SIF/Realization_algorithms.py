@@ -134,13 +134,14 @@ class R_algorithm:
 
 		# iter over all SoP
 		algoStr = []
-		for i in range(self._l + self._n + self._p):
-			# sum of product
-			sop1 = SoP(self.Zcomp[i, :].tolist()[0], varTXU, varTXY[i])     # varTXU is used for dst and the comparison with src
+		for i, (cols, values) in enumerate(self.ZcompRows):
+			# sum of product (only with the non-zero coefficients)
+			coefs = values.tolist()
+			sop1 = SoP(coefs, [varTXU[j] for j in cols], varTXY[i])     # varTXU is used for dst and the comparison with src
 			# check if sop1 is not empty
 			if sop1.toAlgoStr('', coefFormat):
 				# finally, we use the varTXUnoTime for the result
-				sop2 = SoP(self.Zcomp[i, :].tolist()[0], varTXUnoTime, varTXYnoTime[i])
+				sop2 = SoP(coefs, [varTXUnoTime[j] for j in cols], varTXYnoTime[i])
 				newLine = sop2.toAlgoStr(assign, coefFormat)
 				if newLine and newLine not in algoStr:  # to avoid redondant lines (append for DFI with surname)
 					algoStr.append(newLine)
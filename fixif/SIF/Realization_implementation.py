@@ -12,7 +12,7 @@ __status__ = "Beta"
 
 
 from jinja2 import Environment, FileSystemLoader
-from numpy import tril, all, zeros, matrix as mat
+from numpy import zeros, matrix as mat
 from datetime import datetime
 from subprocess import Popen, PIPE
 from ctypes import CDLL, POINTER, c_double
@@ -78,7 +78,7 @@ class R_implementation:
 		# Lower triangular part non-null ?
 		# in that case, we can directly store the computation of x(k+1) in x(k)
 		# (no need to first compute x(k+1), and then store x(k+1) in x(k) to prepare the next step)
-		isPlt = all(tril(self.P, -1) == 0)
+		isPlt = not self.isPnut()
 
 		# input(s), output(s), states, intermediate variables
 		strU = genCvarNames('u', q)
@@ -123,8 +123,8 @@ class R_implementation:
 		# states x(k+1) =  K.t + P.x(k) + Q.u(k)
 		# and outputs y(k) = L.t + R.x(k) + S.u(k)
 		comp = []
-		for i in range(0, l+n+p):
-			sop = SoP(self.Zcomp[i, :].tolist()[0], strTXU, strTXY[i])      # TODO: not tested yet (tested when it used productScalarOld function)
+		for i, (cols, values) in enumerate(self.ZcompRows):
+			sop = SoP(values.tolist(), [strTXU[j] for j in cols], strTXY[i])      # TODO: not tested yet (tested when it used productScalarOld function)
 			comp.append("\t" + sop.toAlgoStr(" =") + ";\n")
 		cDict["InterComp"] = "".join("\tdouble " + t for t in comp[0:l])
 		cDict["StatesComp"] = "".join(comp[l:l+n])
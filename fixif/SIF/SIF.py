@@ -20,11 +20,15 @@ __status__ = "Beta"
 from fixif.LTI import dSS
 import numpy as np
 
-from numpy import c_, r_, eye, zeros, matrix as mat, tril, all, count_nonzero
-from numpy.linalg import inv
+from numpy import c_, r_, eye, zeros, matrix as mat, tril, triu, all, any, count_nonzero, asarray, diag, flatnonzero
+from numpy.linalg import LinAlgError
+from numpy.random import rand, randint
+from scipy.linalg import solve_triangular, lu_factor, lu_solve
+from scipy.sparse import csr_matrix, issparse, bmat as sparse_bmat, tril as sparse_tril, triu as sparse_triu, diags as sparse_diags
+from scipy.sparse.linalg import splu
 from math import log
 from copy import copy
-from fixif.func_aux import mpf_matrix_lt_inverse, mpf_matrix_fadd, mpf_matrix_fmul
+from fixif.func_aux import DyadicMatrix, dyadic_lt_solve
 from fixif.SIF.SIF_sensibility import SIF_sensibility
 
 def isTrivial(x, epsilon):
@@ -50,6 +54,27 @@ def isTrivial(x, epsilon):
 	return abs(alpha) < epsilon*(1-epsilon/2)
 
 
+def isTrivialMask(X, epsilon):
+	"""
+	isTrivialMask(X, epsilon)
+
+	Vectorized version of isTrivial: checks which elements of the array X are trivial (0 or a power of 2,
+	with the same relative error epsilon), with one call to frexp and log2 on the whole array
+
+	X is written as X = m 2^e with 0.5 <= |m| < 1, so log2(|X|) - round(log2(|X|)) = log2(|m|) - round(log2(|m|))
+
+	return value is a boolean array (same shape as X)
+	"""
+	m, _ = np.frexp(np.abs(np.asarray(X, dtype=np.float64)))
+	logm = np.log2(m, out=np.zeros_like(m), where=(m != 0))
+	return (m == 0) | (np.abs(logm - np.rint(logm)) < epsilon*(1-epsilon/2))
+
+
+def _dense(X):
+	"""Returns X as a numpy matrix (X can be a scipy.sparse matrix)"""
+	return mat(X.toarray()) if issparse(X) else mat(X)
+
+
 def _check_dimensions(JtoS):
 	"""
 	Compute the size 'l, n, p, q' of a SIF
@@ -65,7 +90,7 @@ def _check_dimensions(JtoS):
 
 	# we check every matrix
 	for X, (name, a, b) in zip(JtoS, matrices):
-		X = mat(X)
+		X = X if issparse(X) else mat(X)
 		# get the size if it's the first time we see them
 		if not a:
 			a.extend([X.shape[0], name])
@@ -81,6 +106,129 @@ def _check_dimensions(JtoS):
 
 
 
+class _JSolver(object):
+	"""
+	Solve the systems J X = B and X J = B (to compute inv(J)*B and B*inv(J) without inverting J), for a matrix J
+	given once:
+	- J lower triangular (the usual case): forward substitutions (solve_triangular). When J is large and sparse (with
+	1s on the diagonal), a level-scheduled sparse substitution is used instead: the rows (or columns) are grouped by
+	levels, each level only depending on the previous ones, so each level is solved with one sparse product
+	- otherwise: LU factorization (computed once)
+	When J is given as a scipy.sparse matrix (sparse SIF), J is never made dense: the level-scheduled substitutions
+	are used for every lower triangular J (with a diagonal scaling when the diagonal is not made of 1s), and a sparse
+	LU factorization (splu) otherwise
+	"""
+
+	sparse_min_size = 512			# minimal size of J to use the sparse substitutions
+	sparse_max_density = 0.05		# maximal density (ratio of non-zero coefficients) of J to use the sparse substitutions
+
+	def __init__(self, J):
+		self._lu = None
+		self._splu = None
+		self._levels = None
+		self._rlevels = None
+		self._d = None
+		if issparse(J):
+			self._init_sparse(csr_matrix(J, dtype=float))
+			return
+		self._J = asarray(J, dtype=float)
+		l = self._J.shape[0]
+		self._l = l
+		self._lower = not any(triu(self._J, 1))
+		self._unit = self._lower and all(diag(self._J) == 1)
+		if l == 0:
+			return
+		if not self._lower:
+			self._lu = lu_factor(self._J, check_finite=False)
+			if any(diag(self._lu[0]) == 0):
+				raise LinAlgError('Singular matrix J')
+		elif not all(diag(self._J)):
+			raise LinAlgError('Singular matrix J')
+		elif self._unit and l >= self.sparse_min_size and count_nonzero(self._J) <= self.sparse_max_density * l * l:
+			# J = I + T, with T strictly lower triangular
+			self._set_levels(csr_matrix(tril(self._J, -1)))
+
+	def _init_sparse(self, J):
+		"""Prepare the resolutions for a sparse J (in CSR format)"""
+		self._J = J
+		l = J.shape[0]
+		self._l = l
+		self._lower = sparse_triu(J, 1).count_nonzero() == 0
+		d = J.diagonal()
+		self._unit = self._lower and all(d == 1)
+		if l == 0:
+			return
+		if not self._lower:
+			try:
+				self._splu = splu(J.tocsc())
+			except RuntimeError:
+				raise LinAlgError('Singular matrix J')
+		elif not all(d):
+			raise LinAlgError('Singular matrix J')
+		else:
+			# J = D (I + T), with D the diagonal of J and T strictly lower triangular
+			if not self._unit:
+				self._d = d
+			T = csr_matrix(sparse_diags(1 / d).dot(sparse_tril(J, -1)))
+			T.eliminate_zeros()
+			self._set_levels(T)
+
+	def _set_levels(self, T):
+		"""Prepare the level-scheduled substitutions with I + T, for a strictly lower triangular T (in CSR format)"""
+		l = T.shape[0]
+		TT = csr_matrix(T.T)
+		# (I+T) X = B: the row i of X depends on the rows j<i with T_ij!=0
+		self._levels = [(rows, T[rows]) for rows in self._build_levels(T, range(l))]
+		# X (I+T) = B: the column j of X depends on the columns i>j with T_ij!=0
+		self._rlevels = [(cols, TT[cols]) for cols in self._build_levels(TT, range(l - 1, -1, -1))]
+
+	@staticmethod
+	def _build_levels(T, order):
+		"""
+		Returns the list of the indexes of each level (excepted the level 0), when the index i depends on the indexes
+		T.indices[T.indptr[i]:T.indptr[i+1]] (T in CSR format), and the indexes are treated in the given order
+		"""
+		lev = zeros(T.shape[0], dtype=int)
+		for i in order:
+			dep = T.indices[T.indptr[i]:T.indptr[i + 1]]
+			if dep.size:
+				lev[i] = lev[dep].max() + 1
+		return [flatnonzero(lev == k) for k in range(1, lev.max(initial=0) + 1)]
+
+	def solve(self, B):
+		"""Returns inv(J)*B"""
+		B = B.toarray() if issparse(B) else asarray(B, dtype=float)
+		if self._l == 0:
+			return B.copy()
+		if self._lu is not None:
+			return lu_solve(self._lu, B, check_finite=False)
+		if self._splu is not None:
+			return self._splu.solve(B)
+		if self._levels is not None:
+			X = B / self._d[:, None] if self._d is not None else B.copy()
+			for rows, Tk in self._levels:
+				X[rows] -= Tk.dot(X)
+			return X
+		return solve_triangular(self._J, B, lower=True, unit_diagonal=self._unit, check_finite=False)
+
+	def rsolve(self, B):
+		"""Returns B*inv(J)"""
+		B = B.toarray() if issparse(B) else asarray(B, dtype=float)
+		if self._l == 0:
+			return B.copy()
+		if self._lu is not None:
+			return lu_solve(self._lu, B.T, trans=1, check_finite=False).T
+		if self._splu is not None:
+			return self._splu.solve(B.T, trans='T').T
+		if self._rlevels is not None:
+			X = B.copy()
+			for cols, TTk in self._rlevels:
+				X[:, cols] -= TTk.dot(X.T).T
+			return X / self._d[None, :] if self._d is not None else X
+		return solve_triangular(self._J, B.T, trans='T', lower=True, unit_diagonal=self._unit, check_finite=False).T
+
+
+
 class SIF(SIF_sensibility):
 	"""
 	Special Implicit Form (formely FWR, Finite Wordlength Realization)
@@ -125,13 +273,15 @@ class SIF(SIF_sensibility):
 	epsilondZ = 1e-8    # used to deduced dJ, dK, dL, dM, dN, dP, dQ, dR and dS matrices when they are not specified
 
 
-	def __init__(self, JtoS, dJtodS=None):
+	def __init__(self, JtoS, dJtodS=None, sparse=False):
 		"""
 		the SIF object is built from the matrices J, K, L, M, N, P, Q, R and S
 		Parameters
 		----------
 		JtoS: tuple (J, K, L, M, N, P, Q, R, S)
 		dJtodS: tuple (dJ, dK, dL, dM, dN, dP, dQ, dR, dS) -> if None, they are computed from J to S matrices (0 if the coefficient is close to a power of 2 (with epsilondZ error))
+		sparse: if True, Z and dZ (and so J to S and dJ to dS) are stored as scipy.sparse matrices (CSR format), and
+		J is never converted into a dense matrix (for the realizations with a large number of intermediate variables)
 
 		Returns
 		-------
@@ -139,38 +289,67 @@ class SIF(SIF_sensibility):
 		"""
 		#  set and check sizes
 		self._l, self._n, self._p, self._q = _check_dimensions(JtoS)
+		self._sparse = sparse
 		self._Z = None
 		self._build_Z(JtoS)
-		self._invJ = inv(JtoS[0])		# TODO: do it properly (no need to call inv() )
-		self._build_fromZ()
+		self._build_Jsolver()
+		self._reset_fromZ()
 
-		# build _dZ, the associated state space _dSS (contains AZ, BZ, CZ, DZ, gramians, etc.), _M1 _M2 _N1 _N2 and the *_bar matrices
+		# dZ is built now only if it is given, otherwise it is deduced from Z the 1st time it is required (see dZ)
 		self._dZ = None
-		self._build_dZ(dJtodS)
+		if dJtodS is not None:
+			self._build_dZ(dJtodS)
 
-		# extra state-space associated (computed only the 1st time they are required)
-		self._Hu = None
-		self._Hepsilon = None
-		self._Hzeta = None
+		# the associated state space _dSS (contains AZ, BZ, CZ, DZ, gramians, etc.), _M1 _M2 _N1 _N2 and the extra
+		# state-spaces are computed only the 1st time they are required (see dSS and _build_AZtoDZ)
 
 
 	def _build_Z(self, JtoS):
 		"""
 		build Z or dZ depending on provided matrix tuple
 		"""
-		J, K, L, M, N, P, Q, R, S = [np.matrix(X) for X in JtoS]
-		self._Z = np.bmat([[-J, M, N], [K, P, Q], [L, R, S]])
+		if self._sparse:
+			J, K, L, M, N, P, Q, R, S = [csr_matrix(X, dtype=float) for X in JtoS]
+			self._Z = sparse_bmat([[-J, M, N], [K, P, Q], [L, R, S]], format='csr')
+		else:
+			J, K, L, M, N, P, Q, R, S = [_dense(X) for X in JtoS]
+			self._Z = np.bmat([[-J, M, N], [K, P, Q], [L, R, S]])
+
+
 
+	def _build_Jsolver(self):
+		"""Prepare the resolution of the systems with J (inv(J) itself is only computed if required, see invJ)"""
+		self._Jsolver = _JSolver(self.J)
+		self._invJ = None
 
 
 	def _build_AZtoDZ(self):
-		# compute AZ, BZ, CZ and DZ matrices
-		AZ = self.K * self._invJ * self.M + self.P
-		BZ = self.K * self._invJ * self.N + self.Q
-		CZ = self.L * self._invJ * self.M + self.R
-		DZ = self.L * self._invJ * self.N + self.S
-		# and store them in a dSS object
-		self._dSS = dSS(AZ, BZ, CZ, DZ)
+		# compute inv(J)*[M N] and [K; L]*inv(J) (with triangular solves)
+		l, n = self._l, self._n
+		self._invJMN = mat(self._Jsolver.solve(self._Z[0:l, l:]))
+		self._KLinvJ = mat(self._Jsolver.rsolve(self._Z[l:, 0:l]))
+		# compute AZ, BZ, CZ and DZ matrices: [AZ BZ; CZ DZ] = [K; L]*inv(J)*[M N] + [P Q; R S]
+		self._set_ABCD(mat(self._Z[l:, 0:l].dot(self._invJMN)) + _dense(self._Z[l:, l:]))
+
+
+	def _set_ABCD(self, ABCD, keepWo=False, keepWc=False):
+		"""
+		Store the matrices AZ, BZ, CZ and DZ (given by [AZ BZ; CZ DZ]) in a dSS object, and reset the associated
+		state-spaces. The Gramians of the previous dSS can be kept (when AZ and CZ, or AZ and BZ, are unchanged)
+		"""
+		n = self._n
+		previous = self._dSS
+		self._ABCD = ABCD
+		self._dSS = dSS(ABCD[0:n, 0:n], ABCD[0:n, n:], ABCD[n:, 0:n], ABCD[n:, n:])
+		if keepWo:
+			self._dSS._Wo = previous._Wo
+		if keepWc:
+			self._dSS._Wc = previous._Wc
+		# the associated state-spaces will be rebuilt from these ones
+		self._Hu = None
+		self._Hepsilon = None
+		self._Hzeta = None
+		self._Hsensitivity = None
 
 
 	def to_dSSexact(self):
@@ -181,31 +360,24 @@ class SIF(SIF_sensibility):
 		# particular case when the SIF is already a state-space
 		if self.l == 0:
 			from fixif.LTI import dSSmp
-			return dSSmp(self.P, self.Q, self.R, self.S)
+			return dSSmp(_dense(self.P), _dense(self.Q), _dense(self.R), _dense(self.S))
 
 		# otherwise
-		# compute inv(J)
-		invJ = mpf_matrix_lt_inverse(self.J)
-
-		# AZ = K*inv(J)*M+P
-		AZ = mpf_matrix_fmul(invJ, self.M)
-		AZ = mpf_matrix_fmul(self.K, AZ)
-		AZ = mpf_matrix_fadd(AZ, self.P)
-
-		# BZ = K*inv(J)*N+Q
-		BZ = mpf_matrix_fmul(invJ, self.N)
-		BZ = mpf_matrix_fmul(self.K, BZ)
-		BZ = mpf_matrix_fadd(BZ, self.Q)
-
-		# CZ = L*inv(J)*M+R
-		CZ = mpf_matrix_fmul(invJ, self.M)
-		CZ = mpf_matrix_fmul(self.L, CZ)
-		CZ = mpf_matrix_fadd(CZ, self.R)
-
-		# DZ = M*inv(J)*N+S
-		DZ = mpf_matrix_fmul(invJ, self.N)
-		DZ = mpf_matrix_fmul(self.L, DZ)
-		DZ = mpf_matrix_fadd(DZ, self.S)
+		# compute X = inv(J)*[M N] exactly (without computing inv(J)), with a sparse forward substitution
+		l = self._l
+		n = self._n
+		try:
+			X = dyadic_lt_solve(DyadicMatrix.from_numpy(_dense(self.J)), DyadicMatrix.from_numpy(_dense(self._Z[0:l, l:])))
+		except ValueError as e:
+			raise ValueError('Cannot compute the exact state-space. %s' % e)
+
+		# [AZ BZ; CZ DZ] = [K; L]*inv(J)*[M N] + [P Q; R S]
+		ABCD = DyadicMatrix.from_numpy(_dense(self._Z[l:, 0:l])) * X + DyadicMatrix.from_numpy(_dense(self._Z[l:, l:]))
+		ABCD = ABCD.to_mpmath()
+		AZ = ABCD[0:n, 0:n]
+		BZ = ABCD[0:n, n:]
+		CZ = ABCD[n:, 0:n]
+		DZ = ABCD[n:, n:]
 
 		from fixif.LTI import dSSmp
 		return dSSmp(AZ, BZ, CZ, DZ)
@@ -215,10 +387,39 @@ class SIF(SIF_sensibility):
 
 	def _build_M1M2N1N2(self):
 		# compute the useful matrices M1, M2, N1 and N2
-		self._M1 = c_[self.K * self._invJ, eye(self._n), zeros((self._n, self._p))]
-		self._M2 = c_[self.L * self._invJ, zeros((self._p, self._n)), eye(self._p)]
-		self._N1 = r_[self._invJ * self.M, self.AZ, self.CZ]
-		self._N2 = r_[self._invJ * self.N, self.BZ, self.DZ]
+		# (inv(J)*[M N] and [K; L]*inv(J) are computed in _build_AZtoDZ)
+		S = self.dSS
+		n = self._n
+		M1 = c_[self._KLinvJ[0:n], eye(self._n), zeros((self._n, self._p))]
+		M2 = c_[self._KLinvJ[n:], zeros((self._p, self._n)), eye(self._p)]
+		N1 = r_[self._invJMN[:, 0:n], S.A, S.C]
+		N2 = r_[self._invJMN[:, n:], S.B, S.D]
+		self._M1M2N1N2 = (M1, M2, N1, N2)
+
+	# M1, M2, N1 and N2 are only computed when required
+	@property
+	def _M1(self):
+		if self._M1M2N1N2 is None:
+			self._build_M1M2N1N2()
+		return self._M1M2N1N2[0]
+
+	@property
+	def _M2(self):
+		if self._M1M2N1N2 is None:
+			self._build_M1M2N1N2()
+		return self._M1M2N1N2[1]
+
+	@property
+	def _N1(self):
+		if self._M1M2N1N2 is None:
+			self._build_M1M2N1N2()
+		return self._M1M2N1N2[2]
+
+	@property
+	def _N2(self):
+		if self._M1M2N1N2 is None:
+			self._build_M1M2N1N2()
+		return self._M1M2N1N2[3]
 
 
 	def _build_dZ(self, dJtodS):
@@ -235,55 +436,80 @@ class SIF(SIF_sensibility):
 		'dZ' is :math:`\delta Z`
 		"""
 		if dJtodS is None:
-			self._dZ = np.vectorize(lambda x: int(not isTrivial(x, SIF.epsilondZ)))(self._Z)
+			if self._sparse:
+				# only the non-zero coefficients of Z are checked
+				self._dZ = self._Z.copy().astype(int)
+				self._dZ.data = (~isTrivialMask(self._Z.data, SIF.epsilondZ)).astype(int)
+				self._dZ.eliminate_zeros()
+			else:
+				self._dZ = mat(~isTrivialMask(self._Z, SIF.epsilondZ), dtype=int)
+		elif self._sparse:
+			dJ, dK, dL, dM, dN, dP, dQ, dR, dS = [csr_matrix(X) for X in dJtodS]
+			self._dZ = sparse_bmat([[dJ, dM, dN], [dK, dP, dQ], [dL, dR, dS]], format='csr')
 		else:
-			dJ, dK, dL, dM, dN, dP, dQ, dR, dS = [np.matrix(X) for X in dJtodS]
+			dJ, dK, dL, dM, dN, dP, dQ, dR, dS = [_dense(X) for X in dJtodS]
 			self._dZ = np.bmat([[dJ, dM, dN], [dK, dP, dQ], [dL, dR, dS]])
 
 
 
 
-	def _build_fromZ(self):
-		self._build_AZtoDZ()
-		self._build_M1M2N1N2()
+	def _reset_fromZ(self):
+		"""Forget all the objects deduced from Z (they will be built again when required)"""
+		self._Zcomp = None
+		self._ZcompRows = None
+		self._invJMN = None
+		self._KLinvJ = None
+		self._ABCD = None
+		self._dSS = None
+		self._M1M2N1N2 = None
+		self._Hu = None
+		self._Hepsilon = None
+		self._Hzeta = None
+		self._Hsensitivity = None
 
 
 	# Only matrix Z is kept in memory
 	# JtoS extracted from Z matrix, dJtodS from dZ resp.
 	@property
 	def invJ(self):
+		"""inv(J), only computed when required (the computations use triangular solves instead)"""
+		if self._invJ is None:
+			self._invJ = mat(self._Jsolver.solve(eye(self._l)))
 		return self._invJ
 
 	# AZ to DZ getters
 	@property
 	def AZ(self):
-		return self._dSS.A
+		return self.dSS.A
 
 	@property
 	def BZ(self):
-		return self._dSS.B
+		return self.dSS.B
 
 	@property
 	def CZ(self):
-		return self._dSS.C
+		return self.dSS.C
 
 	@property
 	def DZ(self):
-		return self._dSS.D
+		return self.dSS.D
 
 	@property
 	def dSS(self):
+		"""state-space (AZ, BZ, CZ, DZ), only computed when required"""
+		if self._dSS is None:
+			self._build_AZtoDZ()
 		return self._dSS
 
 
 	# Wo and Wc are from AZ to DZ state space
 	@property
 	def Wo(self):
-		return self._dSS.Wo
+		return self.dSS.Wo
 
 	@property
 	def Wc(self):
-		return self._dSS.Wc
+		return self.dSS.Wc
 
 
 	# Z, dZ getters
@@ -296,22 +522,42 @@ class SIF(SIF_sensibility):
 		"""
 		Zcomp is the matrix Z modified, used for the computation
 		it's Z, except that the term `J` has zeros on its diagonal
+		(it is computed once, and should not be modified)
+		"""
+		if self._Zcomp is None:
+			if self._sparse:
+				l = self._l
+				self._Zcomp = self._Z + csr_matrix((np.ones(l), (np.arange(l), np.arange(l))), shape=self._Z.shape)
+				self._Zcomp.eliminate_zeros()
+			else:
+				self._Zcomp = copy(self._Z)
+				self._Zcomp[0:self._l, 0:self._l] = -self.J + eye(self._l)  # to set to 0 the diagonal terms of J
+		return self._Zcomp
+
+	@property
+	def ZcompRows(self):
 		"""
-		Zcomp = copy(self._Z)
-		Zcomp[0:self._l, 0:self._l] = -self.J + eye(self._l)  # to set to 0 the diagonal terms of J
-		return Zcomp
+		Sparse view of the rows of Zcomp: list of the tuples (indices, values) of the non-zero
+		coefficients of each row (used to generate the Sum-of-Products of the algorithms)
+		"""
+		if self._ZcompRows is None:
+			S = self.Zcomp if self._sparse else csr_matrix(self.Zcomp)
+			self._ZcompRows = [(S.indices[S.indptr[i]:S.indptr[i + 1]], S.data[S.indptr[i]:S.indptr[i + 1]]) for i in range(S.shape[0])]
+		return self._ZcompRows
 
 
 	@property
 	def dZ(self):
+		if self._dZ is None:
+			self._build_dZ(None)
 		return self._dZ
 
 	# Z, dZ setters
 	@Z.setter
 	def Z(self, mymat):
-		self._Z = mymat
-		self._invJ = inv(self.J)
-		self._build_fromZ()
+		self._Z = csr_matrix(mymat, dtype=float) if self._sparse else mymat
+		self._build_Jsolver()
+		self._reset_fromZ()
 
 	@dZ.setter
 	def dZ(self, mymat):
@@ -367,39 +613,39 @@ class SIF(SIF_sensibility):
 
 	@property
 	def dJ(self):
-		return -self._dZ[0: self._l, 0: self._l]
+		return -self.dZ[0: self._l, 0: self._l]
 
 	@property
 	def dK(self):
-		return self._dZ[self._l: self._l + self._n, 0: self._l]
+		return self.dZ[self._l: self._l + self._n, 0: self._l]
 
 	@property
 	def dL(self):
-		return self._dZ[self._l + self._n: self._l + self._n + self._p, 0:self._l]
+		return self.dZ[self._l + self._n: self._l + self._n + self._p, 0:self._l]
 
 	@property
 	def dM(self):
-		return self._dZ[0: self._l, self._l: self._l + self._n]
+		return self.dZ[0: self._l, self._l: self._l + self._n]
 
 	@property
 	def dN(self):
-		return self._dZ[0: self._l, self._l + self._n: self._l + self._n + self._q]
+		return self.dZ[0: self._l, self._l + self._n: self._l + self._n + self._q]
 
 	@property
 	def dP(self):
-		return self._dZ[self._l: self._l + self._n, self._l: self._l + self._n]
+		return self.dZ[self._l: self._l + self._n, self._l: self._l + self._n]
 
 	@property
 	def dQ(self):
-		return self._dZ[self._l: self._l + self._n, self._l + self._n: self._l + self._n + self._q]
+		return self.dZ[self._l: self._l + self._n, self._l + self._n: self._l + self._n + self._q]
 
 	@property
 	def dR(self):
-		return self._dZ[self._l + self._n: self._l + self._n + self._p, self._l: self._l + self._n]
+		return self.dZ[self._l + self._n: self._l + self._n + self._p, self._l: self._l + self._n]
 
 	@property
 	def dS(self):
-		return self._dZ[self._l + self._n: self._l + self._n + self._p, self._l + self._n: self._l + self._n + self._q]
+		return self.dZ[self._l + self._n: self._l + self._n + self._p, self._l + self._n: self._l + self._n + self._q]
 
 
 	# JtoS setters
@@ -408,92 +654,189 @@ class SIF(SIF_sensibility):
 	@J.setter
 	def J(self, mymat):
 		self._Z[0: self._l, 0: self._l] = - mymat
-		self._invJ = inv(mymat)
-		self._build_fromZ()
+		self._build_Jsolver()
+		self._reset_fromZ()
 
 	@K.setter
 	def K(self, mymat):
 		self._Z[self._l: self._l + self._n, 0: self._l] = mymat
-		self._build_fromZ()
+		self._reset_fromZ()
 
 	@L.setter
 	def L(self, mymat):
 		self._Z[self._l + self._n: self._l + self._n + self._p, 0:self._l] = mymat
-		self._build_fromZ()
+		self._reset_fromZ()
 
 	@M.setter
 	def M(self, mymat):
 		self._Z[0: self._l, self._l: self._l + self._n] = mymat
-		self._build_fromZ()
+		self._reset_fromZ()
 
 	@N.setter
 	def N(self, mymat):
 		self._Z[0: self._l, self._l + self._n: self._l + self._n + self._q] = mymat
-		self._build_fromZ()
+		self._reset_fromZ()
 
 	@P.setter
 	def P(self, mymat):
 		self._Z[self._l: self._l + self._n, self._l: self._l + self._n] = mymat
-		self._build_dZ(None)  # TODO: all these setters should call _build_dZ(None) !!
-		self._build_AZtoDZ()
+		self._dZ = None  # TODO: all these setters should reset dZ !!
+		self._reset_fromZ()
 
 	@Q.setter
 	def Q(self, mymat):
 		self._Z[self._l: self._l + self._n, self._l + self._n: self._l + self._n + self._q] = mymat
-		self._build_fromZ()
+		self._reset_fromZ()
 
 	@R.setter
 	def R(self, mymat):
 		self._Z[self._l + self._n: self._l + self._n + self._p, self._l: self._l + self._n] = mymat
-		self._build_fromZ()
+		self._reset_fromZ()
 
 	@S.setter
 	def S(self, mymat):
 		self._Z[self._l + self._n: self._l + self._n + self._p, self._l + self._n: self._l + self._n + self._q] = mymat
-		self._build_fromZ()
+		self._reset_fromZ()
+
+
+	def update_coefficient(self, i, j, value):
+		"""
+		Change the coefficient Z[i,j] (Z = [-J M N; K P Q; L R S]), without rebuilding everything from scratch:
+		the products inv(J)*[M N] and [K; L]*inv(J) and the matrices AZ to DZ are updated with a rank-one
+		update (with the Sherman-Morrison formula when the coefficient belongs to J), dZ[i,j] is updated, and only
+		the objects that depend on the coefficient are reset (the associated state-spaces, and the Gramians and WCPG
+		of the dSS when they depend on the coefficient). Nothing is updated if these objects are not computed yet
+		Parameters:
+			- i, j: position of the coefficient in Z
+			- value: new value of Z[i,j] (so -value for the coefficient of J)
+		"""
+		l, n = self._l, self._n
+		if not (0 <= i < self._Z.shape[0] and 0 <= j < self._Z.shape[1]):
+			raise ValueError("SIF: the coefficient (%d,%d) is out of Z" % (i, j))
+		delta = value - self._Z[i, j]
+		if delta == 0:
+			return
+
+		if self._dSS is None:
+			# nothing has been computed yet, only Z (and the resolution with J) is changed
+			previous = self._Z[i, j]
+			self._Z[i, j] = value
+			if i < l and j < l:
+				try:
+					self._build_Jsolver()
+				except LinAlgError:
+					self._Z[i, j] = previous
+					raise
+			self._reset_fromZ()
+		else:
+			self._update_fromZ(i, j, value, delta)
+			self._Zcomp = None
+			self._ZcompRows = None
+
+		# dZ is updated locally (if it is already built)
+		if self._dZ is not None:
+			self._dZ[i, j] = int(not isTrivial(value, SIF.epsilondZ))
+
+
+	def _update_fromZ(self, i, j, value, delta):
+		"""Update inv(J)*[M N], [K; L]*inv(J) and AZ to DZ when Z[i,j] is changed (see update_coefficient)"""
+		l, n = self._l, self._n
+		ABCD = self._ABCD.copy()
+		if i < l and j < l:
+			# J becomes J - delta e_i e_j^T, so (Sherman-Morrison)
+			# inv(J') = inv(J) + delta/(1 - delta c_j) c r, with c = inv(J) e_i and r = e_j^T inv(J)
+			c = mat(self._Jsolver.solve(self._eye_col(l, i)))
+			den = 1 - delta * c[j, 0]
+			if den == 0:
+				raise LinAlgError('Singular matrix J')
+			r = mat(self._Jsolver.rsolve(self._eye_col(l, j).T))
+			alpha = delta / den
+			# the columns K inv(J) e_i and rows e_j^T inv(J) [M N] are taken before the update
+			KLc = self._KLinvJ[:, i].copy()
+			rMN = self._invJMN[j, :].copy()
+			self._invJMN = self._invJMN + alpha * c * rMN
+			self._KLinvJ = self._KLinvJ + alpha * KLc * r
+			ABCD += alpha * KLc * rMN
+			self._Z[i, j] = value
+			self._build_Jsolver()		# (and inv(J) will be computed again if required)
+		elif i < l:
+			# [M N] is modified
+			c = mat(self._Jsolver.solve(self._eye_col(l, i)))
+			self._invJMN[:, j - l] += delta * c
+			ABCD[:, j - l] += delta * self._KLinvJ[:, i]
+			self._Z[i, j] = value
+		elif j < l:
+			# [K; L] is modified
+			r = mat(self._Jsolver.rsolve(self._eye_col(l, j).T))
+			self._KLinvJ[i - l, :] += delta * r
+			ABCD[i - l, :] += delta * self._invJMN[j, :]
+			self._Z[i, j] = value
+		else:
+			# [P Q; R S] is modified
+			ABCD[i - l, j - l] += delta
+			self._Z[i, j] = value
+
+		# the Gramian Wo (resp. Wc) only depends on AZ and CZ (resp. AZ and BZ), i.e. on the n first columns (resp. rows)
+		changed = (ABCD != self._ABCD)
+		self._set_ABCD(ABCD, keepWo=not any(changed[:, 0:n]), keepWc=not any(changed[0:n, :]))
+		self._M1M2N1N2 = None
+
+
+	@staticmethod
+	def _eye_col(l, i):
+		"""Returns the i-th column of the identity matrix of size l"""
+		e = zeros((l, 1))
+		e[i] = 1
+		return e
 
 
 	# dJtodS setters
 	# we only modify dZ matrix so no need to rebuild anything
 	@dJ.setter
 	def dJ(self, mymat):
-		self._dZ[0: self._l, 0: self._l] = mymat
+		self.dZ[0: self._l, 0: self._l] = mymat
 
 	@dK.setter
 	def dK(self, mymat):
-		self._dZ[self._l: self._l + self._n, 0: self._l] = mymat
+		self.dZ[self._l: self._l + self._n, 0: self._l] = mymat
 
 	@dL.setter
 	def dL(self, mymat):
-		self._dZ[self._l + self._n: self._l + self._n + self._p, 0:self._l] = mymat
+		self.dZ[self._l + self._n: self._l + self._n + self._p, 0:self._l] = mymat
 
 	@dM.setter
 	def dM(self, mymat):
-		self._dZ[0: self._l, self._l: self._l + self._n] = mymat
+		self.dZ[0: self._l, self._l: self._l + self._n] = mymat
 
 	@dN.setter
 	def dN(self, mymat):
-		self._dZ[0: self._l, self._l + self._n: self._l + self._n + self._q] = mymat
+		self.dZ[0: self._l, self._l + self._n: self._l + self._n + self._q] = mymat
 
 	@dP.setter
 	def dP(self, mymat):
-		self._dZ[self._l: self._l + self._n, self._l: self._l + self._n] = mymat
+		self.dZ[self._l: self._l + self._n, self._l: self._l + self._n] = mymat
 
 	@dQ.setter
 	def dQ(self, mymat):
-		self._dZ[self._l: self._l + self._n, self._l + self._n: self._l + self._n + self._q] = mymat
+		self.dZ[self._l: self._l + self._n, self._l + self._n: self._l + self._n + self._q] = mymat
 
 	@dR.setter
 	def dR(self, mymat):
-		self._dZ[self._l + self._n: self._l + self._n + self._p, self._l: self._l + self._n] = mymat
+		self.dZ[self._l + self._n: self._l + self._n + self._p, self._l: self._l + self._n] = mymat
 
 	@dS.setter
 	def dS(self, mymat):
-		self._dZ[self._l + self._n: self._l + self._n + self._p, self._l + self._n: self._l + self._n + self._q] = mymat
+		self.dZ[self._l + self._n: self._l + self._n + self._p, self._l + self._n: self._l + self._n + self._q] = mymat
 
 
 
 
+	def isSparse(self):
+		"""
+		Returns True if Z and dZ are stored as scipy.sparse matrices
+		"""
+		return self._sparse
+
 	@property
 	def size(self):
 		"""
@@ -528,7 +871,7 @@ class SIF(SIF_sensibility):
 			self._l, self._n, self._p, self._q, plural(self._l), plural(self._n), plural(self._p), plural(self._q))
 		mystr += "Z = \n" + str(self._Z) + "\n"
 
-		mystr += "dZ = \n" + str(self._dZ) + "\n"
+		mystr += "dZ = \n" + str(self.dZ) + "\n"
 
 		return mystr
 
@@ -540,11 +883,13 @@ class SIF(SIF_sensibility):
 		such that the output is the largest possible for u \in [-u_bar; u_bar] .
 		For this,
 
-		u[i] = u_bar * sign( h(N - i) ),
+		u(k) = u_bar * sign( h(N - 1 - k) ),
 
-		where h(k) is the filter's impulse response.
+		where h(k) is the filter's impulse response, so that |y(N-1)| is maximal
+		(for MIMO filters, each output has its own worst-case input).
 
-		We compute it by passing to the state-space representation.
+		The impulse response is computed by blocks with a forward recursion (see dSS.iter_markov), so
+		the cost is linear in N.
 
 
 		Parameters
@@ -554,48 +899,44 @@ class SIF(SIF_sensibility):
 
 		Returns
 		-------
-		u - a numpy vector of size q x N
+		u - a numpy matrix of size q x N (for a single output filter)
+		or a p x q x N array u (for p outputs) where u[i] is the worst-case input for the i-th output
 
 		"""
-
+		q = self.dSS.q
+		p = self.dSS.p
 		u_bar = np.matrix(u_bar)
-		if u_bar.shape != (self._dSS.q, 1):
-			if u_bar.shape == (1, self._dSS.q):
-				u_bar.transpose()
-			else:
-				raise ValueError('Cannot generate inputs: u_bar is of incorrect size')
+		if u_bar.shape == (1, q):
+			u_bar = u_bar.transpose()
+		elif u_bar.shape != (q, 1):
+			raise ValueError('Cannot generate inputs: u_bar is of incorrect size')
+		u_bar = np.asarray(u_bar).ravel()
+
+		u = np.zeros((p, q, N))
+		k = 0
+		for H in self.dSS.iter_markov(N):
+			m = H.shape[0]
+			# u[:, :, N-1-k-r] = u_bar * sign(h(k+r)) for r in 0..m-1
+			u[:, :, N - k - m:N - k] = (np.sign(H) * u_bar[None, None, :]).transpose(1, 2, 0)[:, :, ::-1]
+			k += m
 
-		u = np.matrix(np.zeros([self._dSS.q, N]))
-		u[:, 0] = self.dSS.D
-		for i in range(1, N):
-			u[:, i] = u_bar * np.sign(self.dSS.B * (self.dSS.A ** (N - i)) * self.dSS.C)		# TODO: ugly A**(N-i) !!
-		return u
+		return np.matrix(u[0]) if p == 1 else u
 
 
-	def simulate(self, u):
+	def simulate(self, u, x0=None):
 		"""
 		Compute the outputs of the SIF with the inputs u
 		2 dimension is time (N samples)
 		Parameters:
-			- u: a q*N matrix
+			- u: a q*N matrix, or a (batch, q, N) array for several input sequences
+			- x0: the initial state (n-vector or (batch,n) array), zero by default
 		Returns:
-			- y: a p*N matrix
+			- y: a p*N matrix (or a (batch, p, N) array)
+		The simulation is done with the equivalent state-space (AZ, BZ, CZ, DZ), see dSS.simulate
 		"""
-		u = mat(u)
-		N = u.shape[1]
-		if u.shape[0] != self._q:
-			raise ValueError("SIF.simulate: u should be a %d*N matrix", self._q)
-		y = mat(zeros((self._p, N)))
-
-		xk = mat(zeros((self._n, 1)))  # TODO: add the possibility to start with a non-zero state
-
-		# loop to compute the outputs
-		for i in range(N):
-			xkp1 = self.AZ*xk + self.BZ*u[:, i]
-			y[:, i] = self.CZ*xk + self.DZ*u[:, i]
-			xk = xkp1
-
-		return y
+		if np.ndim(u) == 2 and np.shape(u)[0] != self._q:
+			raise ValueError("SIF.simulate: u should be a %d*N matrix" % self._q)
+		return self.dSS.simulate(u, x0)
 
 
 
@@ -631,13 +972,12 @@ class SIF(SIF_sensibility):
 		"""Hzeta system is a state-space where the temporary variables and states are given on the output
 		Used for determining the MSB position"""
 		if self._Hzeta is None:
-			# associated matrices
-			C1 = np.bmat([[np.eye(self.l, self.l)], [np.zeros([self.n, self.l])], [self.L]])  # L
-			C2 = np.bmat([[np.zeros([self.l, self.n])], [np.eye(self.n, self.n)], [self.R]])  # R
-			C3 = np.bmat([[np.zeros([self.l, self.q])], [np.zeros([self.n, self.q])], [self.S]])  # S
-
-			# building an extended SIF
-			self._Hzeta = SIF((self.J, self.K, C1, self.M, self.N, self.P, self.Q, C2, C3)).dSS
+			# it is the state-space of the extended SIF (J, K, [I;0;L], M, N, P, Q, [0;I;R], [0;0;S]), built
+			# from inv(J)M and inv(J)N (already computed) instead of a new SIF
+			S = self.dSS
+			C = np.r_[self._invJMN[:, 0:self.n], np.eye(self.n), S.C]
+			D = np.r_[self._invJMN[:, self.n:], np.zeros((self.n, self.q)), S.D]
+			self._Hzeta = dSS(S.A, S.B, C, D)
 		return self._Hzeta
 
 
@@ -656,6 +996,49 @@ class SIF(SIF_sensibility):
 		return self._Hepsilon
 
 
+	_metrics = ('nbOp', 'H2norm', 'Hepsilon_WCPG', 'deltaH_WCPG', 'Hzeta_WCPG', 'dTFsensitivity', 'poleSensitivity')
+
+	def analyze(self, metrics=None):
+		"""
+		Compute several metrics of the SIF at once, sharing the intermediate objects (inv(J), M1, M2, N1, N2,
+		the associated state-spaces, the Schur form of AZ and the Gramians)
+		Parameters:
+			- metrics: list of the metrics to compute (all by default), among:
+				- 'nbOp': number of multiplications and additions (see nbOp)
+				- 'H2norm': H2-norm of the system
+				- 'Hepsilon_WCPG': WCPG of Hepsilon (from the roundoff errors to the output)
+				- 'deltaH_WCPG': WCPG of computeDeltaSIF().dSS (it is the same state-space as Hepsilon)
+				- 'Hzeta_WCPG': WCPG of Hzeta (from the inputs to the intermediate variables, states and outputs)
+				- 'dTFsensitivity': transfer function sensitivity measure and matrix (see dTFsensitivity)
+				- 'poleSensitivity': pole sensitivity measure and matrices (see poleSensitivity)
+		Returns: a dictionary metric -> value
+		"""
+		if metrics is None:
+			metrics = SIF._metrics
+		unknown = [m for m in metrics if m not in SIF._metrics]
+		if unknown:
+			raise ValueError("SIF: Unknown metrics %s" % ", ".join(str(m) for m in unknown))
+
+		record = {}
+		# the order of the computations is such that the shared objects are computed only once
+		for m in SIF._metrics:
+			if m not in metrics:
+				continue
+			if m == 'nbOp':
+				record[m] = self.nbOp()
+			elif m == 'H2norm':
+				record[m] = self.dSS.H2norm()
+			elif m in ('Hepsilon_WCPG', 'deltaH_WCPG'):
+				record[m] = self.Hepsilon.WCPG()
+			elif m == 'Hzeta_WCPG':
+				record[m] = self.Hzeta.WCPG()
+			elif m == 'dTFsensitivity':
+				record[m] = self.dTFsensitivity()
+			elif m == 'poleSensitivity':
+				record[m] = self.poleSensitivity()
+		return record
+
+
 	def nbOp(self):
 		"""
 		Returns the number of multiplication and the number of additions required
@@ -663,6 +1046,8 @@ class SIF(SIF_sensibility):
 		# per line, the number of addition is equal to the number of non-zero coefficients - 1
 		# for the l first SoP, we need to decrease by 1 this number (the diagonal terms of J should not be counted)
 		# number of multiplication is equal to the number of non-trivial coefficients
+		if self._sparse:
+			return self.dZ.count_nonzero(), self.Z.count_nonzero() - self.l - (self.l+self.n+self.p)
 		return count_nonzero(self.dZ), count_nonzero(self.Z) - self.l - (self.l+self.n+self.p)
 
 	def isPnut(self):
@@ -670,7 +1055,7 @@ class SIF(SIF_sensibility):
 		Returns true if the Lower triangular part non-null
 		"""
 		isPnut = True
-		if all(tril(self.P,  -1) == 0):
+		if all(tril(_dense(self.P),  -1) == 0):
 			isPnut = False
 		return isPnut
 
@@ -741,3 +1126,34 @@ class SIF(SIF_sensibility):
 		return r"""
 		\begin{tpmatrix}[{\mvline[dashed]{%d}\mvline[dashed]{%d}\mhline[dashed]{%d}\mhline[dashed]{%d}}]{}
 		%s\end{tpmatrix}""" % (l, l+n, l, l+n, "".join(code))
+
+
+
+def random_JtoS(S, l=(1, 5), density=1., J=None):
+	"""
+	Generate random J to S matrices of a SIF that realizes (up to the random coefficients) the state-space S:
+	P, Q, R, S are the matrices A, B, C, D of S, and J, K, L, M, N are random
+
+	Parameters:
+	- S: the dSS
+	- l: number of intermediate variables, or tuple (mini,maxi) (random between mini and maxi-1)
+	- density: probability that a coefficient of the strictly lower part of J is not zero (J is lower triangular
+	with unit diagonal)
+	- J: the matrix J to use instead of a random one (l is then given by J)
+
+	Returns a tuple (J, K, L, M, N, P, Q, R, S)
+	"""
+	if J is None:
+		if isinstance(l, tuple):
+			l = randint(*l)
+		J = eye(l) + tril(rand(l, l), -1) * (rand(l, l) < density)
+	l = J.shape[0]
+	return J, rand(S.n, l), rand(S.p, l), rand(l, S.n), rand(l, S.q), S.A, S.B, S.C, S.D
+
+
+
+def random_SIF(S, l=(1, 5), density=1., J=None, sparse=False):
+	"""
+	Generate a random SIF from the state-space S (see random_JtoS for the parameters)
+	"""
+	return SIF(random_JtoS(S, l, density, J), sparse=sparse)
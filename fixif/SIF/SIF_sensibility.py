@@ -10,8 +10,10 @@ __status__ = "Beta"
 
 
 from fixif.LTI import dSS
-from numpy import zeros, matrix as mat, multiply, conj, transpose, real, diag
+from numpy import zeros, multiply, conj, real
+from numpy import asarray, eye, einsum, sqrt, maximum, r_
 from numpy.linalg import norm, eig, inv
+from scipy.sparse import issparse
 
 
 def _w_norm_prod(G, H, W):
@@ -46,7 +48,100 @@ def _w_norm_prod(G, H, W):
 
 
 
-def deigdZ(A, M1, M2, shapeZ, moduli=True):
+def _w_norm_prod_gramians(G, H, W):
+	r"""Compute the weighting $L_2$-norm of the system composed by $G \cd H = Vec(G).(Vec(H ^\top)) ^ \top$
+	in closed form, without building (and solving the Lyapunov equations of) one system per coefficient.
+	G and H must share the same state matrix A (it is the case for the SIF, with A=AZ).
+
+	Let $g_i$ be the impulse response of $G_{:,i}$ and $h_j$ the one of $H_{j,:}$. Since
+	$\|G_{:,i} H_{j,:}\|_2^2 = \sum_{m\in\mathbb{Z}} r_{g_i}(m) r_{h_j}(m)$ (with $r$ the autocorrelations),
+	we have $MX_{ij}^2 = r_{g_i}(0) r_{h_j}(0) + 2 \sum_{k\geq 0} (u_i^\top A^k b_i)(c_j A^k w_j)$ with
+		- $r_{g_i}(0) = d_i^\top d_i + b_i^\top W_o b_i$ and $u_i = C^\top d_i + A^\top W_o b_i$
+		- $r_{h_j}(0) = d_j d_j^\top + c_j W_c c_j^\top$ and $w_j = B d_j^\top + A W_c c_j^\top$
+	and the last sum is given, for all (i,j) at once, by the solution of $X = (A \otimes A) X + I$ (i.e. $n^2$ Stein equations).
+	So only the two Gramians (Wo of G, Wc of H) and one Kronecker system are required.
+
+	Returns:
+		- M: weighted norm
+		- MX: sensibility matrix of $G \cd 	H$
+	Parameters :
+		- systems G and H
+		- W: weighting matrix
+	"""
+	A = asarray(G.A)
+	n = G.n
+	b, d = asarray(G.B), asarray(G.D)		# b_i = G.B[:,i], d_i = G.D[:,i]
+	c, e = asarray(H.C), asarray(H.D)		# c_j = H.C[j,:], d_j = H.D[j,:]
+
+	Wo = asarray(G.Wo)
+	Wc = asarray(H.Wc)
+
+	# autocorrelations at 0
+	R0g = einsum('ki,ki->i', d, d) + einsum('ki,kl,li->i', b, Wo, b)
+	R0h = einsum('jk,jk->j', e, e) + einsum('jk,kl,jl->j', c, Wc, c)
+
+	# u_i and w_j (stored as columns/rows of U and Wr)
+	U = asarray(G.C).T.dot(d) + A.T.dot(Wo).dot(b)						# n x rows(W)
+	Wr = e.dot(asarray(H.B).T) + c.dot(Wc).dot(A.T)						# cols(W) x n
+
+	# Kronecker resolvent K = (I - A (x) A)^{-1}, rearranged so that K[(p,q),(a,b)] -> Kr[(p,a),(q,b)]
+	# the column (a,b) of K is the solution Y of Y = A Y A^T + E_ab (with E_ab = e_a e_b^T), so the n^2 Stein equations
+	# are solved at once with the Schur form of A
+	E = eye(n * n).reshape(n * n, n, n)
+	Y = G.spectral.solve_stein(E).reshape(n, n, n, n)		# Y[a,b,p,q] = K[(p,q),(a,b)]
+	Kr = Y.transpose(2, 0, 3, 1).reshape(n * n, n * n)
+
+	KR1 = einsum('pi,ai->pai', U, b).reshape(n * n, -1)
+	KR2 = einsum('jq,jb->qbj', c, Wr).reshape(n * n, -1)
+	S = KR1.T.dot(Kr).dot(KR2)
+
+	MX2 = R0g[:, None] * R0h[None, :] + 2 * S
+	MX = sqrt(maximum(MX2, 0))		# remove the (tiny) negative values due to rounding
+
+	MX = multiply(MX, W)
+
+	N = norm(MX, 'fro')
+	N = N * N
+
+	return N, MX
+
+
+
+class PoleSensitivityTensor(object):
+	r"""
+	Pole sensitivity matrices for each pole, $\dd{\lambda_k}{Z}_{i,j}$ (hypermatrix of size shapeZ x n),
+	stored as the two factors Y and X such that $\dd{\lambda_k}{Z}_{i,j} = f(Y_{i,k} X_{j,k})$
+	(with f the real part when the moduli are considered, identity otherwise).
+	The hypermatrix is only built when it is indexed or converted to a numpy array.
+	"""
+
+	def __init__(self, Y, X, moduli):
+		self._Y = Y
+		self._X = X
+		self._moduli = moduli
+		self._array = None
+
+	@property
+	def shape(self):
+		return self._Y.shape[0], self._X.shape[0], self._Y.shape[1]
+
+	def pole(self, k):
+		"""Returns the pole sensitivity matrix of the k-th pole"""
+		dlk = self._Y[:, k:k+1] * self._X[:, k].T
+		return real(dlk) if self._moduli else dlk
+
+	def __array__(self, dtype=None):
+		if self._array is None:
+			dlk = einsum('ik,jk->ijk', self._Y, self._X)
+			self._array = real(dlk) if self._moduli else dlk
+		return self._array if dtype is None else self._array.astype(dtype)
+
+	def __getitem__(self, item):
+		return self.__array__()[item]
+
+
+
+def deigdZ(A, M1, M2, shapeZ, moduli=True, lazy=False, eigen=None):
 	"""
 	Compute $M_1^\top \dd{\lambda}{A} M_2^\top$.
 	Returns:
@@ -57,46 +152,52 @@ def deigdZ(A, M1, M2, shapeZ, moduli=True):
 	- M1,M2: such that $\dd{\lambda}{Z} = M1^\top \dd{\lambda}{A} M2^\top$
 	- moduli : True (default value) : compute $\dd{\abs{\lambda}}{Z}$ (the sensitivity of the moduli of the eigenvalues)
             : False: compute $\dd{\lambda}{Z}$ (without the moduli)
-	"""
+	- lazy: if True, dlk_dZ is a PoleSensitivityTensor (built only when accessed), otherwise a numpy array
+	- eigen: eigenvalues and right eigenvectors of A (as given by numpy.linalg.eig), if they are already known
 
-	mylambda, Mx = eig(A)
+	All the poles are treated at once: with $M_x$ the right eigenvectors and $M_y$ the left ones,
+	$\dd{\lambda_k}{Z}_{i,j} = (M_1^\top M_y)_{i,k} (M_2 M_x)_{j,k}$, so dlambda_dZ is obtained with
+	two matrix products, without building the hypermatrix dlk_dZ.
+	"""
 
-	Mx = mat(Mx)
+	if eigen is None:
+		mylambda, Mx = eig(asarray(A))
+	else:
+		mylambda, Mx = eigen
 
 	My = inv(Mx).transpose()
 
 	# numpy gives conjugate solutions (vs. matlab)
-	My = mat(conj(My))
+	My = conj(My)
 
 	# order of eigenvalues is not guaranteed to be the same in matlab and numpy so
 	# that discrepancies appear in resulting matrixes.
 	# the ideal check of compliance would check if there is the same value at some, or at another position in the matrix
 	# the check should be careful about repeating coefficients (count them etc.)
-	mylambda = mat(conj(mylambda))
-
-	# sensitivity matrix
-	dlk_dZ = zeros((shapeZ[0], shapeZ[1], mylambda.shape[1]))  #  numpy does not know about hypermatrixes
-
-	for k in range(0, mylambda.shape[1]):
-		if moduli == 1:
-			dlk_dZ[:, :, k] = transpose(M1) * (1 / abs(mylambda[0, k]) * real(
-				conj(mylambda[0, k] * conj(My[:, k]) * transpose(Mx[:, k])))) * transpose(M2)
-		else:
-			dlk_dZ[:, :, k] = transpose(M1) * (conj(My[:, k]) * transpose(Mx[:, k])) * transpose(M2)
-
-	# dlambda_dZ
-
-	dlambda_dZ = zeros(shapeZ)
-
-	for i in range(0, shapeZ[0]):
-		for j in range(0, shapeZ[1]):
-
-			if len(dlk_dZ[i, j, :].shape) == 1:
-				norm_target = mat(diag(dlk_dZ[i, j, :]))  # maybe there's a missing func or bug in numpy here, cannot calculate froebenius norm on a 1D vector
-			else:
-				norm_target = dlk_dZ[i, j, :]
-
-			dlambda_dZ[i, j] = norm(norm_target, 'fro')
+	mylambda = conj(mylambda)
+
+	# factors of the sensitivity matrices: dlk_dZ[i,j,k] = f(Y[i,k] * X[j,k])
+	Y = asarray(M1).T.dot(conj(My))
+	X = asarray(M2).dot(Mx)
+	if moduli:
+		Y = Y * (mylambda / abs(mylambda))
+
+	if Y.shape[0] != shapeZ[0] or X.shape[0] != shapeZ[1]:
+		raise ValueError("deigdZ: M1 and M2 are not consistent with the shape of Z")
+
+	# dlambda_dZ[i,j]^2 = sum_k |dlk_dZ[i,j,k]|^2
+	Y2 = abs(Y) ** 2
+	X2 = abs(X) ** 2
+	if moduli:
+		# sum_k Re(y x)^2 = 1/2 sum_k ( |y|^2 |x|^2 + Re(y^2 x^2) )
+		dlambda_dZ = 0.5 * (Y2.dot(X2.T) + real((Y ** 2).dot((X ** 2).T)))
+	else:
+		dlambda_dZ = Y2.dot(X2.T)
+	dlambda_dZ = sqrt(maximum(dlambda_dZ, 0))
+
+	dlk_dZ = PoleSensitivityTensor(Y, X, moduli)
+	if not lazy:
+		dlk_dZ = dlk_dZ.__array__()
 
 	return dlambda_dZ, dlk_dZ
 
@@ -112,33 +213,68 @@ class SIF_sensibility:
 	This class adds methods to compute the sensibility (wrt Z)
 	"""
 
-	def dTFsensitivity(self):
+	_sensitivity_method = 'gramians'  # gramians, naive
+
+
+	def _sensitivity_N1N2(self):
+		r"""Returns the matrices N1 and N2 such that $\dd{A_Z}{Z} = M_1 \dd{Z}{Z} N_1$, $\dd{B_Z}{Z} = M_1 \dd{Z}{Z} N_2$, etc.
+		(with N1 = [inv(J)M; I_n; 0] and N2 = [inv(J)N; 0; I_q])
+		They differ from self._N1 and self._N2 (used to build Hu)
+		"""
+		N1 = r_[self._N1[0:self.l], eye(self.n), zeros((self.q, self.n))]
+		N2 = r_[self._N2[0:self.l], zeros((self.n, self.q)), eye(self.q)]
+		return N1, N2
+
+	def dTFsensitivity(self, method=None):
 		"""Compute the transfer function sensitivity measure and matrix
+		Parameters:
+			- method: 'gramians' (closed form, from the Gramians of the two systems)
+			or 'naive' (one H2-norm per non-zero coefficient), or None to use the class default (_sensitivity_method)
 		Returns
 			- M: tf sensitivity measure
 			- MX: tf sensitivity matrix
 		"""
-		return _w_norm_prod(dSS(self.AZ, self._M1, self.CZ, self._M2), dSS(self.AZ, self.BZ, self._N1, self._N2), self.dZ)
+		if method is None:
+			method = self._sensitivity_method
+		# G is Hepsilon, and H is built only once
+		G = self.Hepsilon
+		if self._Hsensitivity is None:
+			N1, N2 = self._sensitivity_N1N2()
+			self._Hsensitivity = dSS(self.AZ, self.BZ, N1, N2)
+		H = self._Hsensitivity
+		if method == 'gramians' and H._Wc is None:
+			# H and the SIF's state-space have the same A and B, so the same controllability Gramian
+			H._Wc = self.dSS.Wc
+		# (the weighting matrix is dense, even for a sparse SIF)
+		dZ = self.dZ.toarray() if issparse(self.dZ) else self.dZ
+		if method == 'gramians':
+			return _w_norm_prod_gramians(G, H, dZ)
+		elif method == 'naive':
+			return _w_norm_prod(G, H, dZ)
+		else:
+			raise ValueError("SIF: Unknown method to compute the transfer function sensitivity (method=%s)" % method)
 		#TODO: check if the object is a controller, and use M1bar, M2bar, N1bar and N2bar instead of M1, M2, N1 and N2
 
 
-	def poleSensitivity(self, moduli=True):
+	def poleSensitivity(self, moduli=True, lazy=False):
 		"""Compute the pole sensitivity measure and matrices
 		Paramters:
 			- moduli: (boolean) sensitivity of the poles (False) or of the moduli of the poles (True)
+			- lazy: (boolean) if True, MXk is a PoleSensitivityTensor, built only when accessed
 		Returns:
 			- M: pole sensitivity measure
 			- MX: pole sensitivity matrix
-			- MXk: pole sensitivity matrices for each pole
+			- MXk: pole sensitivity matrices for each pole (numpy array, or PoleSensitivityTensor if lazy)
 		"""
 
-		dlambda_dZ, dlk_dZ = deigdZ(self.AZ, self._M1, self._N1, self.Z.shape, moduli)
+		N1, _ = self._sensitivity_N1N2()
+		dlambda_dZ, dlk_dZ = deigdZ(self.AZ, self._M1, N1, self.Z.shape, moduli, lazy=lazy, eigen=self.dSS.spectral.eig)
 
 		#TODO: check if the object is a controller, and then
 		# Abar, Bbar, Cbar, Dbar, M1bar, M2bar, N1bar, N2bar = calc_plantSIF(R, plant)
 		# dlambda_dZ, dlk_dZ = deigdZ(R.Abar, R.M1bar, R.N1bar, R.Z.shape, moduli)
 
-		M = norm(multiply(dlambda_dZ, self.dZ), 'fro')
+		M = norm(multiply(dlambda_dZ, self.dZ.toarray() if issparse(self.dZ) else self.dZ), 'fro')
 		M = M * M
 
 		return M, dlambda_dZ, dlk_dZ
@@ -1,5 +1,5 @@
 # coding: utf-8
 
-from fixif.SIF.SIF import SIF
+from fixif.SIF.SIF import SIF, random_SIF, random_JtoS
 from fixif.SIF.Realization import Realization
 
@@ -0,0 +1,179 @@
+# coding: utf8
+
+"""
+This file contains tests for the fixed-point methods of the Realization class (R_FxP)
+"""
+
+__author__ = "Thibault Hilaire"
+__copyright__ = "Copyright 2015, FiXiF Project, LIP6"
+__credits__ = ["Thibault Hilaire"]
+
+__license__ = "GPL v3"
+__version__ = "0.4"
+__maintainer__ = "Thibault Hilaire"
+__email__ = "thibault.hilaire@lip6.fr"
+__status__ = "Beta"
+
+
+import pytest
+import numpy
+from numpy import eye, tril, round, zeros, all
+from numpy.random import rand, randint
+from numpy.testing import assert_allclose
+
+from fixif.SIF import Realization
+from fixif.LTI import Filter, iter_random_dSS
+
+
+def random_Realization(S, wl=16):
+	"""Build a random realization (with lower triangular J, K=0 and coefficients on wl bits) from a dSS"""
+	l = randint(0, 4)
+	J = eye(l) + tril(rand(l, l), -1)
+	JtoS = [J, zeros((S.n, l)), rand(S.p, l), rand(l, S.n), rand(l, S.q), S.A, S.B, S.C, S.D]
+	JtoS = [round(X * 2**wl) / 2**wl for X in JtoS]
+	return Realization(Filter(ss=S), JtoS)
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(5, n=(2, 8), p=(1, 3), q=(1, 3)))
+def test_simulateFxP(S):
+	R = random_Realization(S)
+	N = 200
+	U = rand(4, S.q, N) * 2 - 1
+	U = round(U * 2**10) / 2**10
+	y = R.simulate(U)
+
+	nb = R.l + R.n + R.p
+	MSB = [int(numpy.ceil(numpy.log2(x + 1))) + 1 for x in numpy.ravel(R.Hzeta.WCPG_estimate()[0] * numpy.ones((S.q, 1)))]
+
+	# with large word-lengths, the fixed-point simulation is close to the floating-point one
+	LSB = [-40] * nb
+	yFxP = R.simulateFxP(U, MSB, LSB, u_LSB=-10)
+	assert yFxP.shape == (4, S.p, N)
+	assert_allclose(yFxP, y, atol=2**-30 * nb * (1 + abs(y).max()))
+
+	# the two rounding modes have a small difference
+	yFxP_t = R.simulateFxP(U, MSB, LSB, u_LSB=-10, rounding='truncate')
+	assert_allclose(yFxP_t, y, atol=2**-30 * nb * (1 + abs(y).max()))
+
+	# very large word-lengths: Python integers are used (and the same outputs are obtained, with the integers)
+	LSB = [-100] * nb
+	Y = R.simulateFxP(U[0], MSB, LSB, u_LSB=-10, integer=True)
+	assert Y.dtype == object
+	assert_allclose(Y.astype(float) * 2.0**-100, y[0], atol=1e-12 * (1 + abs(y).max()))
+
+	# overflows (MSB too small): saturation or wrap-around
+	MSB = [0] * nb
+	LSB = [-8] * nb
+	ys = R.simulateFxP(U, MSB, LSB, u_LSB=-10, overflow='saturate')
+	yw = R.simulateFxP(U, MSB, LSB, u_LSB=-10, overflow='wrap')
+	assert all(ys >= -1) and all(ys <= 1 - 2**-8)
+	assert all(yw >= -1) and all(yw <= 1 - 2**-8)
+
+	with pytest.raises(ValueError):
+		R.simulateFxP(U, MSB[1:], LSB)
+	with pytest.raises(ValueError):
+		R.simulateFxP(U, MSB, LSB, rounding='toto')
+
+	# J should be unit lower triangular
+	JtoS = [numpy.array([[2, 0], [0.5, 1]]), zeros((S.n, 2)), rand(S.p, 2), rand(2, S.n), rand(2, S.q), S.A, S.B, S.C, S.D]
+	R2 = Realization(Filter(ss=S), JtoS)
+	with pytest.raises(ValueError):
+		R2.simulateFxP(U, [0] * (R2.l + R2.n + R2.p), [-8] * (R2.l + R2.n + R2.p))
+
+
+def test_MSB_wtilde():
+	import mpmath
+	from fixif.SIF.Realization_FxP import _MSB_wtilde
+
+	x = numpy.r_[rand(50) * 2.0**randint(-30, 30, 50), 2.0**randint(-30, 30, 5), [1.0, 0.75, 3.0, 2.0**-1074, 1 - 2**-53]]
+	m, wt = _MSB_wtilde(numpy.matrix(x).transpose())
+
+	# reference with mpmath (500 bits)
+	with mpmath.workprec(500):
+		for xi, mi, wi in zip(x, m, wt):
+			assert mi == int(mpmath.ceil(mpmath.log(xi, 2)))
+			d = mpmath.power(2, mi) - xi
+			if d == 0:
+				assert wi == numpy.inf
+			else:
+				assert wi == int(1 + mi - mpmath.floor(mpmath.log(d, 2)))
+
+	with pytest.raises(ValueError):
+		_MSB_wtilde([1.0, 0.0])
+	with pytest.raises(ValueError):
+		_MSB_wtilde([numpy.nan])
+
+
+def brute_force_WL(E, eps, w_tilde, wmin, wmax):
+	"""Reference optimal solution of the word-length problem (exhaustive search)"""
+	from itertools import product
+	best = None
+	for w in product(range(wmin, wmax + 1), repeat=E.shape[1]):
+		w = numpy.array(w)
+		if all(E.dot(2.0 ** (-w + (w < w_tilde))) <= eps) and (best is None or w.sum() < sum(best)):
+			best = list(w)
+	return best
+
+
+@pytest.mark.parametrize("N, p", [(1, 1), (3, 1), (3, 2), (4, 3), (4, 2)])
+def test_solveOptimalWL(N, p):
+	from fixif.SIF.Realization_FxP import solveOptimalWL
+
+	for _ in range(5):
+		E = rand(p, N) * 2.0**randint(-3, 4, (p, N))
+		E[rand(p, N) < 0.2] = 0
+		w_tilde = randint(3, 12, N).astype(float)
+		w_tilde[rand(N) < 0.2] = numpy.inf
+		eps = 2.0**randint(-7, -2, p) * rand(p)
+		ref = brute_force_WL(E, eps, w_tilde, 2, 12)
+		if ref is None:
+			with pytest.raises(ValueError):
+				solveOptimalWL(E, eps, w_tilde, wmin=2, wmax=12)
+		else:
+			w = solveOptimalWL(E, eps, w_tilde, wmin=2, wmax=12)
+			assert sum(w) == sum(ref)
+			assert all(E.dot(2.0 ** (-numpy.array(w) + (numpy.array(w) < w_tilde))) <= eps)
+
+
+@pytest.mark.parametrize("p", [1, 3])
+def test_solveOptimalWL_size(p):
+	from fixif.SIF.Realization_FxP import solveOptimalWL
+
+	N = 100
+	E = rand(p, N) * 2.0**randint(-20, 5, (p, N))
+	w_tilde = randint(10, 40, N).astype(float)
+	eps = 2.0**-20 * (1 + rand(p))
+	w = solveOptimalWL(E, eps, w_tilde)
+	w = numpy.array(w)
+	assert all(E.dot(2.0 ** (-w + (w < w_tilde))) <= eps)
+
+
+def test_uniformWL():
+	from fixif.SIF.Realization_FxP import _uniformWL
+
+	p, N = 3, 20
+	E = rand(p, N) * 2.0**randint(-10, 5, (p, N))
+	w_tilde = randint(5, 30, N).astype(float)
+	eps = 2.0**-randint(5, 30, (p, 8)) * (1 + rand(p, 8))
+	W = _uniformWL(E, eps, w_tilde)
+	for k in range(eps.shape[1]):
+		# smallest w that satisfies the constraints
+		err = lambda w: E.dot(2.0 ** (-w + (w < w_tilde)))
+		w = next(w for w in range(1, 100) if all(err(w * numpy.ones(N)) < eps[:, k]))
+		assert W[k] == w
+		assert _uniformWL(E, eps[:, k], w_tilde)[0] == w
+
+
+def test_sweepWL():
+	from fixif.LTI import random_Filter
+	from fixif.SIF.Realization_FxP import sweepWL
+
+	F = random_Filter(3, 1, 1)
+	eps = [2.0**-8, 2.0**-12, 2.0**-16]
+	table = sweepWL(F, eps, numpy.matrix([[1.0]]))
+	assert len(table) == len(eps) * len(list(F.iterAllRealizations()))
+	for row in table[::4]:
+		R = row['realization']
+		assert row['uniformWL'] == R.optimalUniformWL(numpy.matrix([[1.0]]), numpy.matrix(row['eps']).transpose())
+		assert row['WL'] == R.optimalWL(numpy.matrix([[1.0]]), numpy.matrix(row['eps']).transpose())
+		assert row['cost'] == sum(row['WL']) <= row['uniformCost']
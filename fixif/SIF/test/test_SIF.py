@@ -17,11 +17,13 @@ __status__ = "Beta"
 import pytest
 import numpy
 
-from fixif.SIF import SIF
+from fixif.SIF import SIF, random_SIF, random_JtoS
+from fixif.SIF.SIF import isTrivial, isTrivialMask
+from scipy.sparse import issparse
 from numpy import matrix as mat
 from fixif.LTI import iter_random_dSS
 
-from fixif.func_aux import mpf_to_numpy
+from fixif.func_aux import mpf_to_numpy, mpf_matrix_lt_inverse, mpf_matrix_fmul, mpf_matrix_fadd
 
 
 from numpy.random import rand, randint, shuffle
@@ -46,6 +48,24 @@ def test_dSSexact(S):
 
 
 
+@pytest.mark.parametrize("S", iter_random_dSS(10, n=(2, 8), p=(1, 3), q=(1, 3)))
+def test_dSSexact_J(S):
+	# lower triangular (sparse) J, and non-zero K and L
+	mySIF = random_SIF(S, l=(1, 10), density=0.3)
+	Sexact = mySIF.to_dSSexact()
+
+	# exact reference: AZ = K*inv(J)*M+P, etc.
+	invJ = mpf_matrix_lt_inverse(mySIF.J)
+	for (X, Y, Z, W) in ((Sexact.A, mySIF.K, mySIF.M, mySIF.P), (Sexact.B, mySIF.K, mySIF.N, mySIF.Q),
+	                     (Sexact.C, mySIF.L, mySIF.M, mySIF.R), (Sexact.D, mySIF.L, mySIF.N, mySIF.S)):
+		assert X == mpf_matrix_fadd(mpf_matrix_fmul(Y, mpf_matrix_fmul(invJ, Z)), W)
+
+	SS = mySIF.dSS
+	assert_allclose(SS.A, mpf_to_numpy(Sexact.A), rtol=1e-10, atol=1e-10)
+	assert_allclose(SS.D, mpf_to_numpy(Sexact.D), rtol=1e-10, atol=1e-10)
+
+
+
 
 def test_construction():
 
@@ -102,3 +122,303 @@ def test_construction():
 			with pytest.raises(ValueError):
 				_ = SIF(myJtoS)
 
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(5, n=(5, 15), p=(1, 5), q=(1, 5)))
+def test_shared_spectral_data(S):
+
+	mySIF = random_SIF(S, l=(1, 10))
+
+	# all the state-spaces built on AZ share the same spectral data
+	sd = mySIF.dSS.spectral
+	assert mySIF.Hzeta.spectral is sd
+	assert mySIF.Hepsilon.spectral is sd
+	assert mySIF.Hu.spectral is sd
+
+	# and AZ is factorized only once
+	mySIF.poleSensitivity()
+	mySIF.poleSensitivity(moduli=False)
+	assert sd.nb_factorizations == 1
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(10, n=(2, 15), p=(1, 4), q=(1, 4)))
+def test_simulate(S):
+
+	mySIF = random_SIF(S, l=(0, 5))
+	A, B, C, D = mySIF.AZ, mySIF.BZ, mySIF.CZ, mySIF.DZ
+
+	def simulate_loop(u, x0):
+		y = mat(numpy.zeros((S.p, u.shape[1])))
+		x = mat(x0).reshape(S.n, 1)
+		for k in range(u.shape[1]):
+			y[:, k] = C * x + D * u[:, k]
+			x = A * x + B * u[:, k]
+		return y
+
+	# one input sequence (N is not a multiple of the block size)
+	N = randint(50, 200)
+	u = mat(rand(S.q, N))
+	y = mySIF.simulate(u)
+	assert isinstance(y, numpy.matrix) and y.shape == (S.p, N)
+	assert_allclose(y, simulate_loop(u, numpy.zeros(S.n)), atol=1e-10)
+
+	# batch of input sequences, with initial states
+	U = rand(3, S.q, N)
+	x0 = rand(3, S.n)
+	Y = mySIF.simulate(U, x0)
+	assert Y.shape == (3, S.p, N)
+	for b in range(3):
+		assert_allclose(Y[b], simulate_loop(mat(U[b]), x0[b]), atol=1e-10)
+
+	# other block sizes (a single partial block, only full blocks, etc.)
+	for L in (1, 7, N, N + 5):
+		assert_allclose(mySIF.dSS.simulate(U, x0, blocksize=L), Y, atol=1e-10)
+
+	with pytest.raises(ValueError):
+		mySIF.simulate(rand(S.q + 1, N))
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(10, n=(2, 10), p=(1, 4), q=(1, 4)))
+def test_generate_inputs(S):
+
+	mySIF = SIF((numpy.eye(0), numpy.zeros((S.n, 0)), numpy.zeros((S.p, 0)), numpy.zeros((0, S.n)), numpy.zeros((0, S.q)), S.A, S.B, S.C, S.D))
+
+	# Markov parameters
+	N = randint(5, 100)
+	H = numpy.concatenate(list(S.iter_markov(N, blocksize=7)))
+	assert H.shape == (N, S.p, S.q)
+	assert_allclose(H[0], S.D)
+	for k in range(1, N):
+		assert_allclose(H[k], S.C * S.A ** (k - 1) * S.B, atol=1e-12)
+
+	# worst-case inputs: y(N-1) reaches the WCPG computed on N terms
+	u_bar = rand(S.q)
+	u = mySIF.generate_inputs(u_bar, N)
+	u = [u] if S.p == 1 else [mat(u[i]) for i in range(S.p)]
+	for i in range(S.p):
+		assert u[i].shape == (S.q, N)
+		assert numpy.all(abs(u[i]) <= u_bar[:, None] + 1e-15)
+		y = mySIF.simulate(u[i])
+		assert_allclose(y[i, N - 1], numpy.sum(abs(H[:, i, :]) * u_bar[None, :]))
+
+	with pytest.raises(ValueError):
+		mySIF.generate_inputs(rand(S.q + 1), N)
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(5, n=(2, 8), p=(1, 3), q=(1, 3)))
+def test_analyze(S):
+
+	JtoS = random_JtoS(S, l=(0, 5))
+	l = JtoS[0].shape[0]
+	mySIF = SIF(JtoS)
+	record = mySIF.analyze()
+	assert set(record) == set(SIF._metrics)
+
+	# compare with the metrics computed on a new SIF
+	ref = SIF(JtoS)
+	assert record['nbOp'] == ref.nbOp()
+	assert_allclose(record['H2norm'], ref.dSS.H2norm())
+	assert_allclose(record['deltaH_WCPG'], ref.computeDeltaSIF().dSS.WCPG(), rtol=1e-10)
+	assert_allclose(record['Hepsilon_WCPG'], ref.Hepsilon.WCPG(), rtol=1e-10)
+	assert_allclose(record['dTFsensitivity'][1], ref.dTFsensitivity()[1], rtol=1e-10, atol=1e-12)
+	assert_allclose(record['poleSensitivity'][1], ref.poleSensitivity()[1], rtol=1e-10, atol=1e-12)
+
+	# Hzeta is the state-space of an extended SIF
+	C1 = numpy.bmat([[numpy.eye(l)], [numpy.zeros((S.n, l))], [JtoS[2]]])
+	C2 = numpy.bmat([[numpy.zeros((l, S.n))], [numpy.eye(S.n)], [S.C]])
+	C3 = numpy.bmat([[numpy.zeros((l, S.q))], [numpy.zeros((S.n, S.q))], [S.D]])
+	Hzeta = SIF((JtoS[0], JtoS[1], C1, JtoS[3], JtoS[4], S.A, S.B, C2, C3)).dSS
+	assert_allclose(mySIF.Hzeta.C, Hzeta.C, atol=1e-12)
+	assert_allclose(mySIF.Hzeta.D, Hzeta.D, atol=1e-12)
+	assert_allclose(record['Hzeta_WCPG'], Hzeta.WCPG(), rtol=1e-10)
+
+	# only some metrics
+	assert set(mySIF.analyze(['nbOp', 'H2norm'])) == {'nbOp', 'H2norm'}
+	with pytest.raises(ValueError):
+		mySIF.analyze(['toto'])
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(3, n=(2, 8), p=(1, 3), q=(1, 3)))
+@pytest.mark.parametrize("Jtype", ['triangular', 'sparse', 'full'])
+def test_Jsolve(S, Jtype, monkeypatch):
+	from fixif.SIF.SIF import _JSolver
+
+	l = randint(1, 40)
+	if Jtype == 'full':
+		J = numpy.eye(l) + rand(l, l) / l
+	else:
+		J = numpy.eye(l) + numpy.tril(rand(l, l) * (rand(l, l) < 0.1), -1)
+	if Jtype == 'sparse':
+		# the sparse substitutions are used for all the sizes
+		monkeypatch.setattr(_JSolver, 'sparse_min_size', 0)
+		monkeypatch.setattr(_JSolver, 'sparse_max_density', 1)
+	JtoS = random_JtoS(S, J=J)
+	mySIF = SIF(JtoS)
+	assert (mySIF._Jsolver._levels is not None) == (Jtype == 'sparse')
+
+	# compare with inv(J)
+	invJ = numpy.linalg.inv(J)
+	assert_allclose(mySIF.invJ, invJ, atol=1e-12)
+	assert_allclose(mySIF.AZ, JtoS[1].dot(invJ).dot(JtoS[3]) + S.A, atol=1e-12)
+	assert_allclose(mySIF.BZ, JtoS[1].dot(invJ).dot(JtoS[4]) + S.B, atol=1e-12)
+	assert_allclose(mySIF.CZ, JtoS[2].dot(invJ).dot(JtoS[3]) + S.C, atol=1e-12)
+	assert_allclose(mySIF.DZ, JtoS[2].dot(invJ).dot(JtoS[4]) + S.D, atol=1e-12)
+	assert_allclose(mySIF._M1[:, 0:l], JtoS[1].dot(invJ), atol=1e-12)
+	assert_allclose(mySIF._N2[0:l], invJ.dot(JtoS[4]), atol=1e-12)
+
+	# changing J
+	mySIF.J = 2 * J
+	assert_allclose(mySIF.invJ, invJ / 2, atol=1e-12)
+
+	with pytest.raises(numpy.linalg.LinAlgError):
+		SIF((numpy.zeros((l, l)),) + JtoS[1:])
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(5, n=(2, 8), p=(1, 3), q=(1, 3)))
+def test_update_coefficient(S):
+
+	mySIF = random_SIF(S, l=(0, 6))
+	l = mySIF.l
+	m1, m2 = mySIF.Z.shape
+
+	for _ in range(20):
+		i, j = randint(0, m1), randint(0, m2)
+		value = 0.5 if rand() < 0.2 else rand()
+		if i < l and j <= i:
+			# keep a non-singular J
+			value = -1 if i == j else value
+		mySIF.update_coefficient(i, j, value)
+		assert mySIF.Z[i, j] == value
+
+		# compare with a new SIF
+		ref = SIF(mySIF.JtoS)
+		assert (mySIF.dZ == ref.dZ).all()
+		for X in ('AZ', 'BZ', 'CZ', 'DZ', 'invJ', '_M1', '_M2', '_N1', '_N2'):
+			assert_allclose(getattr(mySIF, X), getattr(ref, X), atol=1e-10)
+
+	# the Gramians are kept when they do not depend on the coefficient
+	Wo, Wc = mySIF.dSS.Wo, mySIF.dSS.Wc
+	mySIF.update_coefficient(m1 - 1, m2 - 1, 3.0)		# coefficient of S
+	assert mySIF.dSS._Wo is Wo and mySIF.dSS._Wc is Wc
+	mySIF.update_coefficient(m1 - 1, l, 3.0)			# coefficient of R
+	assert mySIF.dSS._Wo is None and mySIF.dSS._Wc is Wc
+	assert_allclose(mySIF.dSS.Wo, SIF(mySIF.JtoS).dSS.Wo, atol=1e-10)
+
+	with pytest.raises(ValueError):
+		mySIF.update_coefficient(m1, 0, 1.0)
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(5, n=(2, 8), p=(1, 3), q=(1, 3)))
+def test_lazy_construction(S):
+
+	JtoS = random_JtoS(S, l=(1, 6))
+	l = JtoS[0].shape[0]
+	mySIF = SIF(JtoS)
+
+	# nothing is computed at the construction
+	assert mySIF._dSS is None and mySIF._M1M2N1N2 is None and mySIF._dZ is None
+
+	# changing a coefficient before anything is computed
+	mySIF.update_coefficient(l, 0, 0.5)
+	assert mySIF._dSS is None and mySIF._dZ is None
+
+	# the objects are built on demand, and are the same as if they were built directly
+	ref = SIF(mySIF.JtoS)
+	assert (mySIF.dZ == ref.dZ).all()
+	assert mySIF._dSS is None
+	assert_allclose(mySIF._N1, ref._N1, atol=1e-12)
+	assert mySIF._dSS is not None
+	for X in ('AZ', 'BZ', 'CZ', 'DZ', '_M1', '_M2', '_N2'):
+		assert_allclose(getattr(mySIF, X), getattr(ref, X), atol=1e-12)
+
+	# a setter resets them
+	mySIF.P = 2 * S.A
+	assert mySIF._dSS is None and mySIF._M1M2N1N2 is None
+	assert_allclose(mySIF._N1[l:l + S.n], mySIF.K * mySIF.invJ * mySIF.M + 2 * S.A, atol=1e-12)
+
+
+def test_isTrivialMask():
+
+	eps = SIF.epsilondZ
+	# powers of 2, values close to powers of 2 (inside and outside the threshold), zeros and random values
+	P = 2.0 ** randint(-60, 60, 200)
+	X = numpy.concatenate([P, -P, P * (1 + eps / 4), P * (1 - 4 * eps), P * (1 + 4 * eps), numpy.zeros(10), rand(200) * 100 - 50])
+	shuffle(X)
+	X = X.reshape(10, -1)
+
+	mask = isTrivialMask(X, eps)
+	assert mask.shape == X.shape
+	assert all(mask[i, j] == isTrivial(X[i, j], eps) for i in range(X.shape[0]) for j in range(X.shape[1]))
+
+	# dZ of a SIF
+	l = 3
+	S = next(iter_random_dSS(1, n=(2, 5), p=(1, 3), q=(1, 3)))
+	mySIF = random_SIF(S, l, density=0)
+	assert (mySIF.dZ == numpy.vectorize(lambda x: int(not isTrivial(x, SIF.epsilondZ)))(mySIF.Z)).all()
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(3, n=(2, 8), p=(1, 3), q=(1, 3)))
+def test_Zcomp(S):
+
+	mySIF = random_SIF(S, l=(1, 6), density=0.5)
+	l = mySIF.l
+
+	def check():
+		Zcomp = numpy.array(mySIF.Z)
+		Zcomp[0:l, 0:l] = -mySIF.J + numpy.eye(l)
+		assert (mySIF.Zcomp == Zcomp).all()
+		assert len(mySIF.ZcompRows) == Zcomp.shape[0]
+		for i, (cols, values) in enumerate(mySIF.ZcompRows):
+			assert list(cols) == list(numpy.flatnonzero(Zcomp[i]))
+			assert (values == Zcomp[i, cols]).all()
+
+	# Zcomp is computed once
+	check()
+	assert mySIF.Zcomp is mySIF.Zcomp
+	# and built again when Z is modified
+	mySIF.update_coefficient(l - 1, 0, 0.25)
+	check()
+	mySIF.M = numpy.zeros((l, S.n))
+	check()
+
+
+@pytest.mark.parametrize("Jtype", ['unit', 'lower', 'full', 'empty'])
+@pytest.mark.parametrize("S", iter_random_dSS(3, n=(2, 6), p=(1, 3), q=(1, 3)))
+def test_sparse(S, Jtype):
+
+	l = 0 if Jtype == 'empty' else randint(1, 8)
+	if Jtype == 'unit':
+		J = numpy.eye(l) + numpy.tril(rand(l, l), -1) * (rand(l, l) < 0.4)
+	elif Jtype == 'lower':
+		J = numpy.diag(rand(l) + 1) + numpy.tril(rand(l, l), -1) * (rand(l, l) < 0.4)
+	else:
+		J = rand(l, l) + l * numpy.eye(l)
+	JtoS = random_JtoS(S, J=J)
+	# sparse K
+	JtoS = (J, JtoS[1] * (rand(S.n, l) < 0.5)) + JtoS[2:]
+	dense = SIF(JtoS)
+	sparse = SIF(JtoS, sparse=True)
+	assert sparse.isSparse() and not dense.isSparse()
+
+	# same Z, dZ, J to S, Zcomp and number of operations
+	assert issparse(sparse.Z) and issparse(sparse.dZ) and issparse(sparse.J)
+	for X in ('Z', 'dZ', 'Zcomp', 'J', 'K', 'L', 'M', 'N', 'P', 'Q', 'R', 'S', 'dJ', 'dS'):
+		assert (getattr(sparse, X).toarray() == getattr(dense, X)).all()
+	assert sparse.nbOp() == dense.nbOp()
+	for (c1, v1), (c2, v2) in zip(sparse.ZcompRows, dense.ZcompRows):
+		assert list(c1) == list(c2) and (v1 == v2).all()
+
+	# same state-space and sensitivities
+	for X in ('AZ', 'BZ', 'CZ', 'DZ', 'invJ', '_M1', '_M2', '_N1', '_N2'):
+		assert_allclose(getattr(sparse, X), getattr(dense, X), atol=1e-10)
+	assert_allclose(sparse.dTFsensitivity()[0], dense.dTFsensitivity()[0], rtol=1e-6)
+
+	# update of a coefficient
+	if l > 0:
+		sparse.update_coefficient(0, l, 0.5)
+		dense.update_coefficient(0, l, 0.5)
+		assert_allclose(sparse.AZ, dense.AZ, atol=1e-10)
+		assert sparse.nbOp() == dense.nbOp()
+
+	with pytest.raises(numpy.linalg.LinAlgError):
+		SIF((numpy.zeros((2, 2)),) + (numpy.ones((S.n, 2)), numpy.ones((S.p, 2)), numpy.ones((2, S.n)), numpy.ones((2, S.q))) + JtoS[5:], sparse=True)
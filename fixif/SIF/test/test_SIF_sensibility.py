@@ -0,0 +1,128 @@
+# coding: utf8
+
+"""
+This file contains tests for the sensibility measures of the SIF class
+"""
+
+__author__ = "Thibault Hilaire"
+__copyright__ = "Copyright 2015, FiXiF Project, LIP6"
+__credits__ = ["Thibault Hilaire"]
+
+__license__ = "GPL v3"
+__version__ = "0.4"
+__maintainer__ = "Thibault Hilaire"
+__email__ = "thibault.hilaire@lip6.fr"
+__status__ = "Beta"
+
+import pytest
+
+from fixif.SIF import SIF, random_SIF, random_JtoS
+from fixif.SIF.SIF_sensibility import deigdZ
+from fixif.LTI import iter_random_dSS, random_dSS
+
+from numpy import isfinite, all, zeros, conj, real, transpose, asarray, sqrt, log, concatenate, nonzero
+from numpy.linalg import eig, eigvals, inv
+from numpy.random import permutation
+from numpy.testing import assert_allclose
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(10, n=(3, 10), p=(1, 4), q=(1, 4)))
+def test_dTFsensitivity(S):
+
+	R = random_SIF(S)
+
+	M1, MX1 = R.dTFsensitivity(method='naive')
+	M2, MX2 = R.dTFsensitivity(method='gramians')
+
+	# the naive method may give NaN for (almost) zero norms (negative trace due to rounding errors)
+	mask = isfinite(MX1)
+	assert_allclose(MX1[mask], MX2[mask], rtol=1e-5, atol=1e-6)
+	assert all(MX2[~mask] < 1e-6)
+
+	# default method
+	M3, MX3 = R.dTFsensitivity()
+	assert_allclose(MX2, MX3)
+
+	with pytest.raises(ValueError):
+		R.dTFsensitivity(method='unknown')
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(5, n=(3, 8), p=(1, 4), q=(1, 4)))
+def test_dTFsensitivity_finite_difference(S):
+	"""Compare the transfer function sensitivity with the central finite difference of H wrt some coefficients of Z
+	(the H2-norm of the difference is computed from the Markov parameters)"""
+	# K = 0, so AZ = A is stable
+	JtoS = random_JtoS(S)
+	R = SIF((JtoS[0], 0 * JtoS[1]) + JtoS[2:])
+	M, MX = R.dTFsensitivity()
+	dZ = asarray(R.dZ)
+	JtoS = (R.J, R.K, R.L, R.M, R.N, R.P, R.Q, R.R, R.S)
+	rho = max(abs(eigvals(R.AZ)))
+	N = min(int(log(1e-12) / log(rho)) + 1, 50000)
+	h = 1e-6
+
+	def markov(i, j, delta):
+		Rd = SIF(JtoS)
+		Z = Rd.Z.copy()
+		Z[i, j] += delta
+		Rd.Z = Z
+		return concatenate(list(Rd.dSS.iter_markov(N)))
+
+	# some non-trivial coefficients
+	ij = transpose(nonzero(dZ))
+	for i, j in ij[permutation(len(ij))[:8]]:
+		dH = (markov(i, j, h) - markov(i, j, -h)) / (2 * h)
+		assert_allclose(MX[i, j], dZ[i, j] * sqrt((dH * dH).sum()), rtol=1e-4, atol=1e-8)
+
+
+def deigdZ_loop(A, M1, M2, shapeZ, moduli, eigen=None):
+	"""Reference implementation of deigdZ (one pole at a time)"""
+	mylambda, Mx = eig(A) if eigen is None else eigen
+	My = conj(inv(Mx).transpose())
+	mylambda = conj(mylambda)
+	dlk_dZ = zeros((shapeZ[0], shapeZ[1], len(mylambda)), dtype=float if moduli else complex)
+	for k in range(len(mylambda)):
+		P = conj(My[:, k:k+1]) * transpose(Mx[:, k:k+1])
+		if moduli:
+			P = real(conj(mylambda[k] * P)) / abs(mylambda[k])
+		dlk_dZ[:, :, k] = transpose(M1).dot(P).dot(transpose(M2))
+	return sqrt((abs(dlk_dZ) ** 2).sum(axis=2)), dlk_dZ
+
+
+@pytest.mark.parametrize("S", iter_random_dSS(10, n=(3, 10), p=(1, 4), q=(1, 4)))
+@pytest.mark.parametrize("moduli", [True, False])
+def test_poleSensitivity(S, moduli):
+
+	R = random_SIF(S)
+	N1, _ = R._sensitivity_N1N2()
+	M1 = asarray(R._M1)
+
+	dl, dlk = deigdZ(asarray(R.AZ), M1, asarray(N1), R.Z.shape, moduli)
+	dl_ref, dlk_ref = deigdZ_loop(asarray(R.AZ), M1, asarray(N1), R.Z.shape, moduli)
+
+	assert_allclose(dl, dl_ref, rtol=1e-8, atol=1e-10)
+	assert_allclose(dlk, dlk_ref, rtol=1e-8, atol=1e-10)
+
+	# lazy hypermatrix (the eigenvalues come from the shared Schur form of AZ, so their order may differ)
+	dl_ref, dlk_ref = deigdZ_loop(asarray(R.AZ), M1, asarray(N1), R.Z.shape, moduli, R.dSS.spectral.eig)
+	M, dl2, dlk2 = R.poleSensitivity(moduli, lazy=True)
+	assert dlk2.shape == dlk_ref.shape
+	assert_allclose(dl2, dl_ref, rtol=1e-8, atol=1e-10)
+	assert_allclose(dlk2.pole(0), dlk_ref[:, :, 0], rtol=1e-8, atol=1e-10)
+	assert_allclose(dlk2[1, :, :], dlk_ref[1, :, :], rtol=1e-8, atol=1e-10)
+	# by default, the hypermatrix is a numpy array
+	M3, dl3, dlk3 = R.poleSensitivity(moduli)
+	assert_allclose(M3, M, rtol=1e-10)
+	assert_allclose(dlk3, dlk_ref, rtol=1e-8, atol=1e-10)
+
+
+def test_dTFsensitivity_large():
+	# the closed form gives the same results as the naive method on a larger system
+	R = random_SIF(random_dSS(12, 2, 2))
+
+	M1, MX1 = R.dTFsensitivity(method='naive')
+	M2, MX2 = R.dTFsensitivity(method='gramians')
+
+	mask = isfinite(MX1)
+	assert_allclose(MX1[mask], MX2[mask], rtol=1e-5, atol=1e-6)
+	assert all(MX2[~mask] < 1e-6)
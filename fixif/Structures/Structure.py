@@ -79,12 +79,13 @@ class Structure(object):
 		"""
 		return self._accept(filt, **options)
 
-	def makeRealization(self, filt, structName=None, shortName=None, **options):
+	def makeRealization(self, filt, structName=None, shortName=None, sparse=False, **options):
 		"""
 		Factory function
 		Return the structured realization of a given filter
 		the options passed should correspond to the possible options of the structure
 		if no value is passed for a given option, the DEFAULT value for is option (FIRST value in the tuple of possible values) is chosen
+		sparse: if True, the realization is stored with scipy.sparse matrices (see SIF)
 		"""
 		if self._options:
 			Ropt = {k: v[0] for k, v in self._options.items()}
@@ -113,7 +114,7 @@ class Structure(object):
 			shortName = self._shortName
 
 		# build the realization
-		return Realization(filt, structureName=structName, shortName=shortName, **d)
+		return Realization(filt, structureName=structName, shortName=shortName, sparse=sparse, **d)
 
 	def __call__(self, *args, **kwargs):
 		"""
@@ -10,11 +10,12 @@ __maintainer__ = "Thibault Hilaire"
 __email__ = "thibault.hilaire@lip6.fr"
 __status__ = "Beta"
 
-from fixif.Structures import LWDF
+from fixif.Structures import LWDF, DFI, DFII, State_Space, rhoDFII, LGS
 from fixif.LTI import Filter, iter_random_Filter, random_Filter
 from fixif.LTI import iter_random_dTF
 import pytest
 import numpy
+from random import seed
 
 
 @pytest.mark.parametrize("H", iter_random_dTF(20))
@@ -84,3 +85,26 @@ def test_LWDF1():
 		F = Filter(num=b, den=a)
 		R = LWDF.makeRealization(F)
 		F.dTF.assert_close(R.to_dTF(), eps=1e-8)
+
+
+@pytest.mark.parametrize("F", iter_random_Filter(5, n=(5, 10), p=(1, 2), q=(1, 2)))
+def test_sparseRealizations(F):
+	"""
+	Check the realizations stored with sparse matrices
+	check that they are equal to the dense realizations
+	"""
+	for st in (DFI, DFII, State_Space, rhoDFII):
+		R = st.makeRealization(F)
+		Rs = st.makeRealization(F, sparse=True)
+		assert Rs.isSparse()
+		assert (Rs.Z.toarray() == R.Z).all()
+		assert Rs.nbOp() == R.nbOp()
+		R.dSS.assert_close(Rs.dSS)
+	# LGS has a lot of intermediate variables (and random coefficients, so the same seed is used for both)
+	seed(0)
+	R = LGS.makeRealization(F)
+	seed(0)
+	Rs = LGS.makeRealization(F, sparse=True)
+	assert Rs.isSparse()
+	assert (Rs.Z.toarray() == R.Z).all()
+	R.dSS.assert_close(Rs.dSS)
@@ -14,8 +14,13 @@ __status__ = "Beta"
 Contains some configurations values, such as paths
 """
 
+import os
 import pkg_resources
 try:
 	SIF_TEMPLATES_PATH = pkg_resources.resource_filename('fixif.fixif', 'SIF/templates/')
 except ModuleNotFoundError:
 	SIF_TEMPLATES_PATH = pkg_resources.resource_filename('fixif', 'SIF/templates/')
+
+# persistent WCPG cache (disabled if FIXIF_WCPG_CACHE is not set), see fixif.LTI.WCPGCache
+WCPG_CACHE_PATH = os.environ.get('FIXIF_WCPG_CACHE')
+WCPG_CACHE_SIZE = int(os.environ.get('FIXIF_WCPG_CACHE_SIZE', 2**30))
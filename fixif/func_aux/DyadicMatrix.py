@@ -0,0 +1,265 @@
+import numpy
+import mpmath
+from mpmath.libmp import from_man_exp
+
+
+def _trailing_zeros(x):
+	"""Returns the number of trailing zeros of the (non-zero) python integer x"""
+	return (x & -x).bit_length() - 1
+
+
+class DyadicMatrix(object):
+	"""
+	A DyadicMatrix is a m x n matrix of dyadic numbers, stored as
+				self = Y * 2 ** e
+	where Y is a numpy array (dtype=object) of python integers (the mantissas)
+	and e is a python integer (the exponent, shared by all the elements).
+
+	Every double and every mpf number is a dyadic number, so the sums, differences and products
+	of such matrices are computed exactly with (vectorized) integer arithmetic only,
+	instead of element-by-element exact operations with MPMATH.
+	The exponent is kept as large as possible (the common trailing zeros of the mantissas are removed).
+	"""
+
+	def __init__(self, Y, e=0):
+		"""
+		Build a DyadicMatrix from a 2D array of integers Y and an exponent e
+		"""
+		Y = numpy.array(Y, dtype=object)
+		if Y.ndim != 2:
+			raise ValueError('Cannot create a DyadicMatrix: the mantissa should be a 2D array')
+		self._Y = Y
+		self._e = int(e)
+		self._normalize()
+
+
+	@classmethod
+	def from_matrix(cls, M):
+		"""
+		Build a DyadicMatrix from a numpy.matrix (or numpy.ndarray), a mpmath.matrix or a DyadicMatrix.
+		Raises ValueError if the matrix has non-finite (NaN or Inf) or complex elements.
+		"""
+		if isinstance(M, DyadicMatrix):
+			return M
+		elif isinstance(M, mpmath.matrix):
+			return cls.from_mpmath(M)
+		elif isinstance(M, numpy.ndarray):
+			return cls.from_numpy(M)
+		else:
+			raise ValueError('Cannot create a DyadicMatrix: unknown object type %s' % type(M))
+
+
+	@classmethod
+	def from_numpy(cls, M):
+		"""Build a DyadicMatrix from a numpy matrix (or 2D array) of doubles"""
+		M = numpy.atleast_2d(numpy.asarray(M))
+		if numpy.iscomplexobj(M):
+			raise ValueError('Cannot create a DyadicMatrix: complex matrices are not supported')
+		M = M.astype(numpy.float64)
+		if not numpy.all(numpy.isfinite(M)):
+			raise ValueError('Cannot create a DyadicMatrix: an abnormal number (NaN/Inf) occured')
+		# M = F * 2**E, with F in [0.5,1) a 53-bit mantissa, so M = (F*2**53) * 2**(E-53) exactly
+		F, E = numpy.frexp(M)
+		Y = numpy.ldexp(F, 53).astype(numpy.int64).astype(object)
+		E = E.astype(numpy.int64) - 53
+		nz = (Y != 0)
+		if not numpy.any(nz):
+			return cls(numpy.zeros(M.shape, dtype=object))
+		emin = int(E[nz].min())
+		return cls(_shift_left(Y, E - emin), emin)
+
+
+	@classmethod
+	def from_mpmath(cls, M):
+		"""Build a DyadicMatrix from a mpmath matrix of mpf numbers"""
+		m, n = M.rows, M.cols
+		Y = numpy.zeros((m, n), dtype=object)
+		E = numpy.zeros((m, n), dtype=numpy.int64)
+		for i in range(m):
+			for j in range(n):
+				x = M[i, j]
+				if not isinstance(x, mpmath.mpf):
+					raise ValueError('Cannot create a DyadicMatrix: expected mpf numbers but got %s' % type(x))
+				sign, man, exp, bc = x._mpf_
+				if not man:
+					if bc:
+						# special values (NaN, +Inf, -Inf) have a zero mantissa and a negative bit count
+						raise ValueError('Cannot create a DyadicMatrix: an abnormal number (NaN/Inf) occured')
+					continue
+				Y[i, j] = -int(man) if sign else int(man)
+				E[i, j] = exp
+		nz = (Y != 0)
+		if not numpy.any(nz):
+			return cls(Y)
+		emin = int(E[nz].min())
+		return cls(_shift_left(Y, E - emin), emin)
+
+
+	@property
+	def mantissa(self):
+		"""Returns the matrix Y of integers, such that self = Y * 2**exponent"""
+		return self._Y
+
+	@property
+	def exponent(self):
+		"""Returns the common exponent e, such that self = mantissa * 2**e"""
+		return self._e
+
+	@property
+	def shape(self):
+		return self._Y.shape
+
+	@property
+	def rows(self):
+		return self._Y.shape[0]
+
+	@property
+	def cols(self):
+		return self._Y.shape[1]
+
+
+	def __getitem__(self, item):
+		"""Returns a sub-matrix (the indexing should keep the two dimensions, like M[:, k:k+1])"""
+		Y = self._Y[item]
+		if not isinstance(Y, numpy.ndarray) or Y.ndim != 2:
+			raise ValueError('DyadicMatrix: the indexing should return a 2D matrix')
+		return DyadicMatrix(Y, self._e)
+
+
+	@classmethod
+	def concatenate(cls, matrices, axis=1):
+		"""Concatenate a list of DyadicMatrix (horizontally by default, vertically if axis=0)"""
+		if not matrices:
+			raise ValueError('DyadicMatrix: cannot concatenate an empty list')
+		e = min(M.exponent for M in matrices)
+		return cls(numpy.concatenate([M.mantissa << (M.exponent - e) for M in matrices], axis=axis), e)
+
+
+	def _normalize(self):
+		"""Remove the common trailing zeros of the mantissas (and update the exponent)"""
+		acc = 0
+		for y in self._Y.flat:
+			acc |= y
+			if acc & 1:
+				return
+		if acc == 0:
+			self._e = 0
+			return
+		t = _trailing_zeros(acc)
+		if t:
+			self._Y = self._Y >> t
+			self._e += t
+
+
+	def _align(self, other):
+		"""Returns the mantissas of self and other with the same (smallest) exponent, and this exponent"""
+		if self.shape != other.shape:
+			raise ValueError('Cannot align two DyadicMatrix: incorrect sizes.')
+		if self._e >= other._e:
+			return self._Y << (self._e - other._e), other._Y, other._e
+		else:
+			return self._Y, other._Y << (other._e - self._e), self._e
+
+
+	def __add__(self, other):
+		Y1, Y2, e = self._align(DyadicMatrix.from_matrix(other))
+		return DyadicMatrix(Y1 + Y2, e)
+
+	def __sub__(self, other):
+		Y1, Y2, e = self._align(DyadicMatrix.from_matrix(other))
+		return DyadicMatrix(Y1 - Y2, e)
+
+	def __neg__(self):
+		return DyadicMatrix(-self._Y, self._e)
+
+	def __mul__(self, other):
+		"""Matrix product (as numpy.matrix and mpmath.matrix)"""
+		other = DyadicMatrix.from_matrix(other)
+		if self.cols != other.rows:
+			raise ValueError('Cannot multiply two DyadicMatrix: incorrect sizes.')
+		return DyadicMatrix(self._Y.dot(other._Y), self._e + other._e)
+
+
+	def round(self, prec, rounding='n'):
+		"""
+		Round each element to a floating-point number with a mantissa of prec bits (without any limit on the
+		exponent, as mpmath does), with the rounding mode (same as mpmath):
+		- 'n': to nearest (ties to even)
+		- 'f': toward -infinity (floor)
+		- 'c': toward +infinity (ceiling)
+		- 'd': toward zero (down)
+		- 'u': away from zero (up)
+		"""
+		if rounding not in ('n', 'f', 'c', 'd', 'u'):
+			raise ValueError('DyadicMatrix: unknown rounding mode %s' % rounding)
+		if prec < 1:
+			raise ValueError('DyadicMatrix: the precision should be positive')
+		Y = self._Y.copy()
+		for idx, y in numpy.ndenumerate(Y):
+			m = -y if y < 0 else y
+			s = m.bit_length() - prec
+			if s <= 0:
+				continue
+			q = m >> s
+			r = m - (q << s)
+			if r:
+				if rounding == 'n':
+					half = 1 << (s - 1)
+					q += (r > half or (r == half and q & 1))
+				elif rounding == 'u' or (rounding == 'f' and y < 0) or (rounding == 'c' and y > 0):
+					q += 1
+			Y[idx] = -(q << s) if y < 0 else q << s
+		return DyadicMatrix(Y, self._e)
+
+
+	def __eq__(self, other):
+		if not isinstance(other, DyadicMatrix):
+			return NotImplemented
+		# both are normalized, so the representation is unique
+		return self.shape == other.shape and self._e == other._e and numpy.all(self._Y == other._Y)
+
+	def __ne__(self, other):
+		eq = self.__eq__(other)
+		return eq if eq is NotImplemented else not eq
+
+	__hash__ = None
+
+
+	def to_mpmath(self):
+		"""
+		Returns the mpmath matrix corresponding to self.
+		The conversion is exact (the mpf numbers are not rounded to the current precision).
+		"""
+		m, n = self.shape
+		C = mpmath.zeros(m, n)
+		e = self._e
+		make_mpf = mpmath.mp.make_mpf
+		for i in range(m):
+			for j in range(n):
+				y = self._Y[i, j]
+				if y:
+					C[i, j] = make_mpf(from_man_exp(y, e))
+		return C
+
+	def to_numpy(self):
+		"""Returns the numpy matrix corresponding to self (each element is rounded to the nearest double)"""
+		m, n = self.shape
+		M = numpy.matrix(numpy.zeros((m, n)))
+		for i in range(m):
+			for j in range(n):
+				y = self._Y[i, j]
+				if y:
+					M[i, j] = float(mpmath.mp.make_mpf(from_man_exp(y, self._e)))
+		return M
+
+	def __str__(self):
+		return '%s * 2**%d' % (self._Y, self._e)
+
+
+
+def _shift_left(Y, S):
+	"""Returns the array Y << S (element-wise), for a object array Y and a non-negative integer array S"""
+	R = numpy.empty(Y.shape, dtype=object)
+	for idx, y in numpy.ndenumerate(Y):
+		R[idx] = y << int(S[idx]) if y else 0
+	return R
@@ -1,45 +1,8 @@
 import numpy
 import mpmath
 
-
-
-def my_forward_subst(L, i):
-	"""
-	This function performs the forward substitution for solution of the system
-				Lx = e_i
-	where
-		L   - is a lower triangular matrix with 1s on the main diagonal
-		e_i - i-th identity vector
-
-	All the computations are done exactly with MPMATH
-
-	Parameters
-	----------
-	L - n x n lower-triangular matrix with ones on the diagonal
-	i - index for the canonical vector
-
-	Returns
-	-------
-	x - n x 1 vector of the solution
-	"""
-
-	n = L.rows
-	x = mpmath.zeros(n, 1)
-
-	e = mpmath.zeros(n, 1)
-	e[i, 0] = mpmath.mp.one
-
-	x[0,0] = e[0,0]
-
-	for i in range(1, n):
-		x[i,0] = e[i]
-		for j in range(0, i):
-			tmp = mpmath.fmul(L[i,j], x[j,0], exact=True)
-			x[i,0] = mpmath.fsub(x[i,0], tmp, exact=True)
-
-	return x
-
-
+from fixif.func_aux.DyadicMatrix import DyadicMatrix
+from fixif.func_aux.mpf_matrix_lt_solve import dyadic_lt_solve
 
 
 
@@ -142,24 +105,19 @@ class MPFMatrix(object):
 		# check input type
 
 		if not isinstance(other, MPFMatrix):
-				raise ValueError('Cannot compute exact sum of two matrices: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s') % type(other)
+				raise ValueError('Cannot compute exact sum of two matrices: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s' % type(other))
 
 		#test sizes
 		if self.shape != other.shape:
 			raise ValueError('Cannot compute exact sum of two matrices: incorrect sizes.')
 
-		# compute the sum
-		m = self._M.rows
-		n = self._M.cols
-		C = mpmath.zeros(m, n)
-		for i in range(0, m):
-			for j in range(0, n):
-				C[i,j] = mpmath.fadd(self[i,j], other[i,j], exact=True)
-				if mpmath.isnan(C[i,j]) or mpmath.isinf(C[i,j]):
-					print('WARNING: in matrix sum an abnormal number (NaN/Inf) occured: %f') % C[i,j]
-		# TODO: use np.vectorize !
+		# compute the sum exactly with dyadic integer matrices
+		try:
+			C = DyadicMatrix.from_mpmath(self._M) + DyadicMatrix.from_mpmath(other._M)
+		except ValueError as e:
+			raise ValueError('Cannot compute exact sum of two matrices. %s' % e)
 
-		return MPFMatrix(C)
+		return MPFMatrix(C.to_mpmath())
 
 	def sub_exact(self, other):
 		"""
@@ -177,24 +135,19 @@ class MPFMatrix(object):
 		# check input type
 
 		if not isinstance(other, MPFMatrix):
-			raise ValueError('Cannot compute exact sum of two matrices: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s') % type(other)
+			raise ValueError('Cannot compute exact sum of two matrices: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s' % type(other))
 
 		# test sizes
 		if self.shape != other.shape:
 			raise ValueError('Cannot compute exact sum of two matrices: incorrect sizes.')
 
-		# compute the sum
-		m = self._M.rows
-		n = self._M.cols
-		C = mpmath.zeros(m, n)
-		for i in range(0, m):
-			for j in range(0, n):
-				C[i, j] = mpmath.fsub(self[i, j], other[i, j], exact=True)
-				if mpmath.isnan(C[i, j]) or mpmath.isinf(C[i, j]):
-					print('WARNING: in matrix sum an abnormal number (NaN/Inf) occured: %f') % C[i, j]
-		# TODO: use np.vectorize !
+		# compute the difference exactly with dyadic integer matrices
+		try:
+			C = DyadicMatrix.from_mpmath(self._M) - DyadicMatrix.from_mpmath(other._M)
+		except ValueError as e:
+			raise ValueError('Cannot compute exact difference of two matrices. %s' % e)
 
-		return MPFMatrix(C)
+		return MPFMatrix(C.to_mpmath())
 
 
 
@@ -214,28 +167,21 @@ class MPFMatrix(object):
 
 		# check input type
 		if not isinstance(other, MPFMatrix):
-			raise ValueError('Cannot compute exact product of two matrices: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s') % type(other)
+			raise ValueError('Cannot compute exact product of two matrices: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s' % type(other))
 
 		# test sizes
 
 
-		if self.rows != other.cols:
+		if self.cols != other.rows:
 			raise ValueError('Cannot compute exact product of two matrices: incorrect sizes.')
 
-		m = self.rows
-		n = self.rows
-		p = other.cols
-
-		C = mpmath.zeros(m, p)
-		for i in range(0, m):
-			for j in range(0, p):
-				for k in range(0, n):
-					tmp = mpmath.fmul(self[i, k], other[k, j], exact=True)
-					C[i, j] = mpmath.fadd(C[i, j], tmp, exact=True)
-					if mpmath.isnan(C[i, j]) or mpmath.isinf(C[i, j]):
-						print('WARNING: in matrix multiplication an abnormal number (NaN/Inf) occured: %f') % C[i, j]
+		# compute the product exactly with dyadic integer matrices
+		try:
+			C = DyadicMatrix.from_mpmath(self._M) * DyadicMatrix.from_mpmath(other._M)
+		except ValueError as e:
+			raise ValueError('Cannot compute exact product of two matrices. %s' % e)
 
-		return MPFMatrix(C)
+		return MPFMatrix(C.to_mpmath())
 
 
 	def inv_lowtr(self):
@@ -254,26 +200,13 @@ class MPFMatrix(object):
 		X - n x n matrix
 		"""
 
-		# checking the size
-		if self.rows != self.cols:
-			raise ValueError('Cannot compute inverse: matrix must be square but istead is %s x %s' % self.rows, self.cols)
-		else:
-			n = self.rows
-
-		# checking if the matrix is indeed lower-triangular with 1s on the main diagonal
-		for i in range(0, n):
-			if self[i, i] != mpmath.mp.one:
-				raise ValueError('Cannot compute inverse: matrix must have 1s on the main diagonal.')
-			for j in range(i + 1, n):
-				if self[i, j] != mpmath.mp.zero:
-					raise ValueError('Cannot compute inverse: matrix must be lower triangular.')
-
-		# compute the inverse using forward substitution
-		X = mpmath.zeros(n, n)
-		for i in range(0, n):
-			X[:, i] = my_forward_subst(self._M, i)
-
-		return MPFMatrix(X)
+		# compute the inverse with one forward substitution for all the columns
+		try:
+			X = dyadic_lt_solve(DyadicMatrix.from_mpmath(self._M), DyadicMatrix.from_numpy(numpy.eye(self.rows)))
+		except ValueError as e:
+			raise ValueError('Cannot compute inverse. %s' % e)
+
+		return MPFMatrix(X.to_mpmath())
 
 	def to_numpy(self):
 		"""
@@ -0,0 +1,27 @@
+import mpmath
+
+
+def mp_context(ctx=None, prec=53):
+	"""
+	Returns the mpmath context to use for a computation:
+	ctx if it is given, otherwise a new mpmath context with prec bits of precision.
+
+	Using a context (passed through the functions) instead of the global mpmath.mp (and mpmath.workprec)
+	keeps the computations independent of the global state, so that they can run concurrently in threads.
+
+	Parameters
+	----------
+	ctx - a mpmath.MPContext (or None)
+	prec - precision of the new context (when ctx is None)
+
+	Returns
+	-------
+	ctx - a mpmath.MPContext
+	"""
+	if ctx is not None:
+		if not isinstance(ctx, mpmath.MPContext):
+			raise ValueError('Expected a mpmath.MPContext but got %s' % type(ctx))
+		return ctx
+	ctx = mpmath.MPContext()
+	ctx.prec = prec
+	return ctx
@@ -0,0 +1,94 @@
+import mpmath
+import numpy
+from fixif.func_aux.DyadicMatrix import DyadicMatrix
+
+
+def dyadic_charpoly(A):
+	"""
+	Given a n x n DyadicMatrix A, this function computes exactly the coefficients c_i of its
+	characteristic polynomial
+		det(zI - A) = z^n + c_1 z^(n-1) + ... + c_n
+
+	The Faddeev-LeVerrier algorithm is used on the integer mantissa Y of A = Y * 2**e:
+		M_1 = I,   c_k = -tr(Y M_k) / k,   M_(k+1) = Y M_k + c_k I
+	All the divisions are exact (the coefficients of the characteristic polynomial of an integer matrix
+	are integers), and c_k(A) = c_k(Y) * 2**(k*e).
+
+	Parameters
+	----------
+	A - n x n DyadicMatrix
+
+	Returns
+	-------
+	c - (n+1) x 1 DyadicMatrix with [1, c_1, ..., c_n]
+	"""
+	if A.rows != A.cols:
+		raise ValueError('Cannot compute the characteristic polynomial: matrix must be square but instead is %d x %d' % A.shape)
+	n = A.rows
+	Y = A.mantissa
+	e = A.exponent
+
+	I = numpy.zeros((n, n), dtype=object)
+	for i in range(n):
+		I[i, i] = 1
+	c = [DyadicMatrix([[1]])]
+	M = I
+	for k in range(1, n + 1):
+		YM = Y.dot(M)
+		ck, r = divmod(-sum(YM[i, i] for i in range(n)), k)
+		if r:
+			raise ValueError('Cannot compute the characteristic polynomial: inexact division (should not happen)')
+		c.append(DyadicMatrix([[ck]], k * e))
+		M = YM + ck * I
+
+	return DyadicMatrix.concatenate(c, axis=0)
+
+
+
+def mpf_matrix_charpoly(A, ctx=mpmath.mp):
+	"""
+	Given a n x n real mpmath matrix A, this function computes the coefficients c_i of its
+	characteristic polynomial
+		det(zI - A) = z^n + c_1 z^(n-1) + ... + c_n
+	in the precision of the context ctx (mpmath.mp by default).
+
+	A is reduced to an upper Hessenberg matrix H (orthogonal similarity), and the characteristic
+	polynomials p_k of the leading k x k sub-matrices of H are given by the recurrence
+		p_k(z) = (z - h_kk) p_(k-1)(z) - sum_(i<k) h_ik (h_(i+1,i) ... h_(k,k-1)) p_(i-1)(z)
+	that requires O(n^3) operations.
+
+	Parameters
+	----------
+	A - n x n mpmath matrix
+	ctx - mpmath context (defines the precision of the computations)
+
+	Returns
+	-------
+	c - list of n+1 numbers (of the context ctx) [1, c_1, ..., c_n]
+	"""
+	if A.rows != A.cols:
+		raise ValueError('Cannot compute the characteristic polynomial: matrix must be square but instead is %d x %d' % (A.rows, A.cols))
+	n = A.rows
+	if n == 0:
+		return [ctx.one]
+
+	A = ctx.matrix(A)
+	_, H = ctx.hessenberg(A)
+
+	# p[k] is the characteristic polynomial of H[0:k,0:k], coefficients in increasing powers of z
+	p = [[ctx.one]]
+	for k in range(n):
+		# (z - h_kk) p_(k-1)
+		pk = [ctx.zero] + p[k]
+		for d in range(k + 1):
+			pk[d] -= H[k, k] * p[k][d]
+		# - sum_i h_ik (h_(i+1,i) ... h_(k,k-1)) p_(i-1)
+		beta = ctx.one
+		for i in range(k - 1, -1, -1):
+			beta *= H[i + 1, i]
+			t = H[i, k] * beta
+			for d in range(i + 1):
+				pk[d] -= t * p[i][d]
+		p.append(pk)
+
+	return [ctx.mpf(x.real) if isinstance(x, ctx.mpc) else x for x in reversed(p[n])]
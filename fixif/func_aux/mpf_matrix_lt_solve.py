@@ -0,0 +1,119 @@
+import mpmath
+import numpy
+from fixif.func_aux.DyadicMatrix import DyadicMatrix
+
+
+def dyadic_lt_solve(L, B):
+	"""
+	For a lower-triangular n x n matrix L with 1s on the main diagonal and a n x k matrix B,
+	both given as DyadicMatrix, this function computes exactly the solution X of
+				L * X = B
+	with a forward substitution done on all the columns at once (row by row). Only the non-zero
+	elements of L are used, so it is cheap for the very sparse matrices J of the usual structures.
+	The function returns X as a n x k DyadicMatrix.
+
+	Parameters
+	----------
+	L - n x n lower-triangular DyadicMatrix with 1s on the main diagonal
+	B - n x k DyadicMatrix
+
+	Returns
+	-------
+	X - n x k DyadicMatrix
+	"""
+	# checking the sizes
+	if L.rows != L.cols:
+		raise ValueError('Cannot solve the triangular system: matrix must be square but instead is %d x %d' % L.shape)
+	n = L.rows
+	if B.rows != n:
+		raise ValueError('Cannot solve the triangular system: incorrect sizes.')
+
+	Yl, el = L.mantissa, L.exponent
+	# the mantissa of 1 (L is normalized, so el<=0 if there is a 1 on the diagonal)
+	one = 1 << -el if el <= 0 else None
+
+	# checking if the matrix is indeed lower-triangular with 1s on the main diagonal
+	for i in range(n):
+		if Yl[i, i] != one:
+			raise ValueError('Cannot solve the triangular system: matrix must have 1s on the main diagonal.')
+		if numpy.any(Yl[i, i + 1:] != 0):
+			raise ValueError('Cannot solve the triangular system: matrix must be lower triangular.')
+
+	# forward substitution: each row X_i = Y_i * 2**e_i has its own exponent
+	Y = []
+	E = []
+	for i in range(n):
+		acc = B.mantissa[i].copy()
+		e = B.exponent
+		for j in numpy.flatnonzero(Yl[i, :i] != 0):
+			# acc*2**e - L_ij * X_j
+			t = Y[j] * (-Yl[i, j])
+			et = el + E[j]
+			if et >= e:
+				acc = acc + (t << (et - e))
+			else:
+				acc = (acc << (e - et)) + t
+				e = et
+		acc, e = _normalize_row(acc, e)
+		Y.append(acc)
+		E.append(e)
+
+	# gather the rows with a common exponent
+	if n == 0:
+		return DyadicMatrix(numpy.zeros((0, B.cols), dtype=object))
+	emin = min(E)
+	X = numpy.empty((n, B.cols), dtype=object)
+	for i in range(n):
+		X[i] = Y[i] << (E[i] - emin)
+	return DyadicMatrix(X, emin)
+
+
+def _normalize_row(y, e):
+	"""Remove the common trailing zeros of the integers of the row y (with exponent e)"""
+	acc = 0
+	for v in y:
+		acc |= v
+		if acc & 1:
+			return y, e
+	if acc == 0:
+		return y, e
+	t = (acc & -acc).bit_length() - 1
+	return y >> t, e + t
+
+
+
+def mpf_matrix_lt_solve(L, B=None):
+	"""
+	For a lower-triangular n x n real matrix L with 1s on the main diagonal
+	and a n x k real matrix B, this function computes exactly the solution X of
+				    L * X = B
+	(so inv(L)*B is obtained without computing inv(L)).
+	If B is None, the identity matrix is used, and X is the inverse of L.
+	Matrices L and B must be in the numpy.matrix of mpmath.matrix formats.
+	The function returns X as n x k real a mpmath.matrix
+
+
+	Parameters
+	----------
+	L - n x n lower-triangular matrix
+	B - n x k matrix (or None)
+
+	Returns
+	-------
+	X - n x k matrix
+
+	"""
+	if not isinstance(L, numpy.matrix) and not isinstance(L, mpmath.matrix):
+		raise ValueError('Cannot solve the triangular system: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s' % type(L))
+	if B is None:
+		B = numpy.matrix(numpy.eye(L.rows if isinstance(L, mpmath.matrix) else L.shape[0]))
+	elif not isinstance(B, numpy.matrix) and not isinstance(B, mpmath.matrix):
+		raise ValueError('Cannot solve the triangular system: unexpected input type, excpected numpy.matrix or mpmath.matrix but got %s' % type(B))
+
+	try:
+		dL = DyadicMatrix.from_matrix(L)
+		dB = DyadicMatrix.from_matrix(B)
+	except ValueError as e:
+		raise ValueError('Cannot solve the triangular system. %s' % e)
+
+	return dyadic_lt_solve(dL, dB).to_mpmath()
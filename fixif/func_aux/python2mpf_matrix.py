@@ -1,6 +1,8 @@
 
 import mpmath as mp
 import numpy
+from mpmath.libmp import from_float
+
 def python2mpf_matrix(M):
 
 	if not isinstance(M, numpy.matrix):
@@ -11,7 +13,8 @@ def python2mpf_matrix(M):
 	Mmp = mp.zeros(n, m)
 	for i in range(0, n):
 		for j in range(0, m):
-			Mmp[i, j] = mp.mpf(M[i, j])
+			# exact conversion (independent of the global precision mp.prec)
+			Mmp[i, j] = mp.mp.make_mpf(from_float(float(M[i, j])))
 
 
 	return Mmp
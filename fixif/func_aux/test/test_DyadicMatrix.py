@@ -0,0 +1,120 @@
+import numpy
+import mpmath
+import pytest
+
+from fixif.func_aux import DyadicMatrix, MPFMatrix, mpf_matrix_fmul, mpf_matrix_fadd, mpf_matrix_fsub, python2mpf_matrix
+from fixif.func_aux import mpf_matrix_lt_solve, mpf_matrix_lt_inverse
+
+
+def exact_mul(A, B):
+	"""Reference exact product (element by element, with mpmath)"""
+	C = mpmath.zeros(A.rows, B.cols)
+	for i in range(A.rows):
+		for j in range(B.cols):
+			for k in range(A.cols):
+				C[i, j] = mpmath.fadd(C[i, j], mpmath.fmul(A[i, k], B[k, j], exact=True), exact=True)
+	return C
+
+
+def random_matrix(m, n):
+	"""Random numpy matrix with very different magnitudes"""
+	return numpy.matrix(numpy.random.randn(m, n) * 2.0 ** numpy.random.randint(-60, 60, (m, n)))
+
+
+@pytest.mark.parametrize("m, n, p", [(1, 1, 1), (3, 5, 2), (7, 7, 7)])
+def test_exact_operations(m, n, p):
+	A = random_matrix(m, n)
+	B = random_matrix(n, p)
+	Amp = python2mpf_matrix(A)
+	Bmp = python2mpf_matrix(B)
+
+	# conversion
+	assert DyadicMatrix.from_matrix(A).to_mpmath() == Amp
+	assert DyadicMatrix.from_matrix(Amp) == DyadicMatrix.from_matrix(A)
+	assert (DyadicMatrix.from_matrix(A).to_numpy() == A).all()
+
+	# product
+	C = exact_mul(Amp, Bmp)
+	assert mpf_matrix_fmul(A, B) == C
+	assert mpf_matrix_fmul(Amp, B) == C
+	# products of exact results
+	assert mpf_matrix_fmul(C.T, A) == exact_mul(C.T, Amp)
+
+	# sum and difference
+	A2 = random_matrix(m, n)
+	A2mp = python2mpf_matrix(A2)
+	S = mpf_matrix_fadd(A, A2)
+	D = mpf_matrix_fsub(A, A2)
+	for i in range(m):
+		for j in range(n):
+			assert S[i, j] == mpmath.fadd(Amp[i, j], A2mp[i, j], exact=True)
+			assert D[i, j] == mpmath.fsub(Amp[i, j], A2mp[i, j], exact=True)
+	assert mpf_matrix_fsub(S, A2) == Amp
+
+
+def test_errors():
+	A = numpy.matrix(numpy.random.rand(3, 3))
+	with pytest.raises(ValueError):
+		mpf_matrix_fmul(A, numpy.matrix(numpy.random.rand(2, 3)))
+	with pytest.raises(ValueError):
+		mpf_matrix_fadd(A, numpy.matrix(numpy.random.rand(3, 2)))
+	with pytest.raises(ValueError):
+		mpf_matrix_fadd(A, [[1, 2, 3]])
+	A[1, 1] = numpy.nan
+	with pytest.raises(ValueError):
+		mpf_matrix_fmul(A, A)
+	with pytest.raises(ValueError):
+		DyadicMatrix.from_matrix(mpmath.matrix([[mpmath.inf]]))
+	with pytest.raises(ValueError):
+		DyadicMatrix.from_matrix(numpy.matrix([[1j]]))
+
+
+def test_normalization():
+	Z = DyadicMatrix.from_matrix(numpy.zeros((2, 3)))
+	assert Z.exponent == 0 and Z.shape == (2, 3)
+	X = DyadicMatrix.from_matrix(numpy.matrix([[0.5, 0.25], [3, 0]]))
+	assert X.exponent == -2
+	assert list(X.mantissa.flat) == [2, 1, 12, 0]
+	assert (X - X) == DyadicMatrix.from_matrix(numpy.zeros((2, 2)))
+	assert (X + X).exponent == -1
+
+
+@pytest.mark.parametrize("n, k", [(1, 1), (5, 3), (12, 12)])
+def test_lt_solve(n, k):
+	# sparse lower-triangular matrix with 1s on the diagonal
+	L = numpy.tril(random_matrix(n, n), -1)
+	L[numpy.random.rand(n, n) < 0.6] = 0
+	L = numpy.matrix(L + numpy.eye(n))
+	B = random_matrix(n, k)
+
+	X = mpf_matrix_lt_solve(L, B)
+	assert mpf_matrix_fmul(L, X) == python2mpf_matrix(B)
+	assert mpf_matrix_lt_solve(python2mpf_matrix(L), B) == X
+
+	# inverse
+	Linv = mpf_matrix_lt_inverse(L)
+	assert mpf_matrix_fmul(L, Linv) == mpmath.eye(n)
+	assert mpf_matrix_fmul(Linv, B) == X
+	assert MPFMatrix(L).inv_lowtr().equal(Linv)
+
+	# not a unit lower-triangular matrix
+	if n > 1:
+		with pytest.raises(ValueError):
+			mpf_matrix_lt_inverse(L + numpy.triu(numpy.ones((n, n)), 1))
+	with pytest.raises(ValueError):
+		mpf_matrix_lt_solve(2 * L, B)
+	with pytest.raises(ValueError):
+		mpf_matrix_lt_solve(L, B[1:])
+
+
+@pytest.mark.parametrize("rounding", ['n', 'f', 'c', 'd', 'u'])
+def test_round(rounding):
+	A = random_matrix(6, 6)
+	X = mpf_matrix_fmul(A, A)
+	for prec in (1, 2, 10, 53, 200):
+		R = DyadicMatrix.from_matrix(X).round(prec, rounding).to_mpmath()
+		assert R == X.apply(lambda x: mpmath.fadd(x, 0, prec=prec, rounding=rounding))
+	# ties to even
+	assert DyadicMatrix.from_matrix(numpy.matrix([[2.5, -3.5, 6.5]])).round(2).to_mpmath() == mpmath.matrix([[2, -4, 6]])
+	with pytest.raises(ValueError):
+		DyadicMatrix.from_matrix(A).round(10, 'toto')